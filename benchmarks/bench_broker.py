@@ -0,0 +1,151 @@
+"""
+measures the fan-out throughput of the broker in the connector middleware.
+
+many local subscribers connect to the broker, one of them never reads (a stalled
+dashboard). Events are published in bulk at a fixed rate, like the /_bulk endpoint does, and the
+other subscribers are read by a single thread until nothing arrives anymore.
+reports the published events/s, the delivered lines/s over all subscribers and
+how long publishing blocked. With topic routing every subscriber subscribes to the
+keys of one sensor ("sensor.<n>.#") and only receives those. The ingestion of the /_bulk endpoint is measured
+with the Flask test client, against posting every event on its own.
+
+usage (from the repository root): python -m benchmarks.bench_broker [subscribers] [events] [events/s]
+"""
+
+import json
+import os
+import selectors
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "connector middleware"))
+
+import connector  # noqa: E402
+from broker import Broker  # noqa: E402
+
+
+SUBSCRIBERS = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+EVENTS = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+RATE = int(sys.argv[3]) if len(sys.argv) > 3 else 5000
+BULK = 100
+
+
+def read_all(sockets, result):
+    # reads every subscriber on one thread, until nothing arrived for a second
+    selector = selectors.DefaultSelector()
+    for sock in sockets:
+        sock.setblocking(False)
+        selector.register(sock, selectors.EVENT_READ)
+    lines = 0
+    last = time.perf_counter()
+    while True:
+        ready = selector.select(timeout=1)
+        if not ready:
+            break
+        for key, _ in ready:
+            data = key.fileobj.recv(1 << 18)
+            if not data:
+                selector.unregister(key.fileobj)
+            lines += data.count(b"\n")
+        last = time.perf_counter()
+    result.extend((lines, last))
+
+
+def fan_out():
+    broker = Broker("127.0.0.1", 0, max_queue=EVENTS // 4).start()
+    stalled = socket.create_connection(broker.address)
+    stalled.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    sockets = [socket.create_connection(broker.address) for _ in range(SUBSCRIBERS - 1)]
+    while len(broker.subscribers) < SUBSCRIBERS:
+        time.sleep(0.01)
+
+    lines = [("tick", connector.encode("tick", {"n": i, "price": 220.5})) for i in range(EVENTS)]
+    result = []
+    reader = threading.Thread(target=read_all, args=(sockets, result))
+    reader.start()
+
+    begin = time.perf_counter()
+    blocked = 0.0
+    for start in range(0, EVENTS, BULK):
+        delay = begin + start / RATE - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        publish = time.perf_counter()
+        broker.publish(lines[start:start + BULK])
+        blocked = max(blocked, time.perf_counter() - publish)
+    published = time.perf_counter() - begin
+    reader.join()
+    delivered, last = result
+    elapsed = last - begin
+
+    port = stalled.getsockname()[1]
+    stats = broker.stats()["subscribers"]
+    stalled_dropped = sum(s["dropped"] for s in stats if s["address"].endswith(f":{port}"))
+    dropped = sum(s["dropped"] for s in stats) - stalled_dropped
+    print(f"{SUBSCRIBERS} subscribers (1 stalled), {EVENTS:,} events in bulks of {BULK} at {RATE:,} events/s")
+    print(f"published {EVENTS / published:>12,.0f} events/s, longest publish call {blocked * 1000:.2f} ms")
+    print(f"delivered {delivered / elapsed:>12,.0f} lines/s to the reading subscribers "
+          f"({delivered:,} lines, {dropped:,} dropped)")
+    print(f"stalled subscriber: {stalled_dropped:,} events dropped")
+
+    for sock in sockets + [stalled]:
+        sock.close()
+    broker.stop()
+
+
+def routing():
+    broker = Broker("127.0.0.1", 0, max_queue=EVENTS).start()
+    sockets = [socket.create_connection(broker.address) for _ in range(SUBSCRIBERS)]
+    for i, sock in enumerate(sockets):
+        sock.sendall(json.dumps({"subscribe": [f"sensor.{i}.#"]}).encode() + b"\n")
+    while sum(s["patterns"] != ["#"] for s in broker.stats()["subscribers"]) < SUBSCRIBERS:
+        time.sleep(0.01)
+
+    keys = [f"sensor.{i % SUBSCRIBERS}.{'temp' if i % 2 else 'humidity'}" for i in range(EVENTS)]
+    events = [(key, connector.encode(key, {"n": i})) for i, key in enumerate(keys)]
+    result = []
+    reader = threading.Thread(target=read_all, args=(sockets, result))
+    reader.start()
+
+    begin = time.perf_counter()
+    for start in range(0, EVENTS, BULK):
+        broker.publish(events[start:start + BULK])
+    published = time.perf_counter() - begin
+    reader.join()
+    delivered, last = result
+
+    print(f"topic routing: {SUBSCRIBERS} subscribers of one sensor each, {EVENTS:,} events")
+    print(f"published {EVENTS / published:>12,.0f} events/s, delivered {delivered:,} lines "
+          f"in {last - begin:.2f} s ({EVENTS * SUBSCRIBERS:,} without routing)")
+
+    for sock in sockets:
+        sock.close()
+    broker.stop()
+
+
+def ingestion():
+    connector.broker = Broker("127.0.0.1", 0).start()
+    client = connector.app.test_client()
+    events = [{"key": "tick", "data": {"n": i}} for i in range(5000)]
+
+    begin = time.perf_counter()
+    for e in events[:1000]:
+        client.post("/" + e["key"], json=e["data"])
+    single = 1000 / (time.perf_counter() - begin)
+
+    begin = time.perf_counter()
+    for start in range(0, len(events), BULK):
+        client.post("/_bulk", json=events[start:start + BULK])
+    bulk = len(events) / (time.perf_counter() - begin)
+
+    print(f"POST /<key>  {single:>12,.0f} events/s")
+    print(f"POST /_bulk  {bulk:>12,.0f} events/s")
+    connector.broker.stop()
+
+
+if __name__ == "__main__":
+    fan_out()
+    routing()
+    ingestion()
@@ -0,0 +1,76 @@
+"""
+compares reading market ticks from a CSV file per record and in batches.
+
+writes a CSV file with synthetic ticks and reads it with csv_generator, parsing
+the timestamp of every record like generate_data does, and with csv_batches,
+which converts the columns and timestamps of a batch at once. Parquet and Arrow
+files are measured as well when pyarrow is installed. reports records/s.
+
+usage (from the repository root): python -m benchmarks.bench_columnar [number of ticks]
+"""
+
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+
+from neca.columnar import csv_batches, np, pa, read_batches
+from neca.generators import csv_generator
+from neca.timestamps import compile_parser
+
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+SIGNATURE = ("time", "epoch_ms")
+
+
+def write_ticks(path):
+    random.seed(1)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["time", "symbol", "price", "volume"])
+        t = 1539202764000
+        for i in range(N):
+            t += random.randint(0, 20)
+            writer.writerow([t, "AAPL", round(220 + random.random(), 2), random.randint(1, 500)])
+
+
+def per_record(path):
+    parse = compile_parser(SIGNATURE[1])
+    for record in csv_generator(path):
+        yield parse(record["time"]), record
+
+
+def measure(name, records):
+    begin = time.perf_counter()
+    count = sum(records)
+    elapsed = time.perf_counter() - begin
+    print(f"{name:<36} {count / elapsed:>12,.0f} records/s")
+
+
+def main():
+    types = {"price": float, "volume": int}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "ticks.csv")
+        write_ticks(path)
+        print(f"{N:,} ticks, {os.path.getsize(path) / 1e6:.1f} MB, numpy: {np is not None}, pyarrow: {pa is not None}")
+
+        measure("csv_generator, per record", (1 for _ in per_record(path)))
+        measure("csv_batches", (len(batch) for batch in csv_batches(path, SIGNATURE, types=types)))
+        measure("csv_batches + rows()", (len(batch.rows()) for batch in csv_batches(path, SIGNATURE, types=types)))
+
+        if pa is not None:
+            import pyarrow.csv
+            import pyarrow.feather
+            import pyarrow.parquet
+
+            table = pyarrow.csv.read_csv(path)
+            pyarrow.parquet.write_table(table, os.path.join(directory, "ticks.parquet"))
+            pyarrow.feather.write_feather(table, os.path.join(directory, "ticks.arrow"))
+            for name in ("ticks.parquet", "ticks.arrow"):
+                measure(f"{name}, batches", (len(batch) for batch in read_batches(os.path.join(directory, name), SIGNATURE)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+measures how many messages per second connect_datastream can read.
+
+a local socket server pushes {"key": ..., "data": ...} lines, first as fast as it can
+and then paced at a fixed rate (100k messages/s by default). Both the original reader
+(recv(1024) and splitting the whole buffer) and the LineBuffer reader are measured, with
+short messages and with long messages that arrive in many pieces. reports the received
+messages/s and the CPU time the reader used per message. The LineBuffer reader
+parses with orjson when it is installed, like connect_datastream.
+
+usage (from the repository root): python -m benchmarks.bench_connector [messages] [rate]
+"""
+
+import json
+import socket
+import sys
+import time
+from threading import Thread
+
+from neca.connectors import LineBuffer, _fire_line
+
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+RATE = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+
+
+def original_reader(sock, fire):
+    # the reader before LineBuffer, stopping when the connection is closed
+    data = b''
+    while True:
+        chunk = sock.recv(1024)
+        if not chunk:
+            return
+        data += chunk
+        if b'\n' in data:
+            data = data.split(b'\n')
+            for i in range(len(data) - 1):
+                message = json.loads(data[i].decode('utf-8'))
+                if 'key' not in message or 'data' not in message:
+                    continue
+                fire(message['key'], message['data'])
+            data = data[-1]
+
+
+def line_buffer_reader(sock, fire):
+    buffer = LineBuffer()
+    while buffer.recv(sock):
+        for line in buffer.lines():
+            if line.strip():
+                _fire_line(line, fire)
+
+
+def serve(server, lines, rate):
+    connection, _ = server.accept()
+    with connection:
+        if rate is None:
+            connection.sendall(b"".join(lines))
+            return
+        # send the lines in small groups, spread over every second
+        group = max(rate // 1000, 1)
+        begin = time.perf_counter()
+        for start in range(0, len(lines), group):
+            due = begin + start / rate
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            connection.sendall(b"".join(lines[start:start + group]))
+
+
+def measure(name, reader, lines, rate):
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(("127.0.0.1", 0))
+    server.listen(1)
+    sender = Thread(target=serve, args=(server, lines, rate), daemon=True)
+    sender.start()
+
+    received = [0]
+
+    def fire(key, data):
+        received[0] += 1
+
+    sock = socket.create_connection(server.getsockname())
+    begin = time.perf_counter()
+    cpu = time.thread_time()
+    with sock:
+        reader(sock, fire)
+    cpu = time.thread_time() - cpu
+    elapsed = time.perf_counter() - begin
+    server.close()
+
+    print(f"{name:<40} {received[0] / elapsed:>12,.0f} msgs/s {cpu / max(received[0], 1) * 1e6:>8.2f} us cpu/msg")
+
+
+def main():
+    short = [json.dumps({"key": "tick", "data": {"symbol": "AAPL", "price": 220.5 + i % 100, "n": i}}).encode() + b"\n"
+             for i in range(N)]
+    long = [json.dumps({"key": "tweet", "data": {"text": "x" * 20000, "n": i}}).encode() + b"\n"
+            for i in range(N // 100)]
+
+    print(f"{N:,} short messages, {len(long):,} long messages, paced at {RATE:,} msgs/s")
+    for name, reader in (("original", original_reader), ("LineBuffer", line_buffer_reader)):
+        measure(f"{name}, short, unpaced", reader, short, None)
+        measure(f"{name}, short, {RATE:,}/s", reader, short, RATE)
+        measure(f"{name}, long, unpaced", reader, long, None)
+
+
+if __name__ == "__main__":
+    main()
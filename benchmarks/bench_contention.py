@@ -0,0 +1,71 @@
+"""
+measures how long producers wait on the event loop while handlers run.
+
+several producer threads fire events as fast as they can while a deliberately
+slow handler runs on the event loop. reports how long a single fire() call
+takes for the producers (p50/p99/max) and the overall enqueue rate.
+
+usage (from the repository root): python -m benchmarks.bench_contention [producers] [events per producer]
+"""
+
+import sys
+import threading
+import time
+
+from neca.events import Manager, event, fire_global
+
+
+PRODUCERS = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+PER_PRODUCER = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+
+# how long the slow handler takes
+HANDLER_TIME = 0.005
+
+
+@event("init")
+def init(ctx, data):
+    pass
+
+
+@event("slow")
+def slow(ctx, data):
+    time.sleep(HANDLER_TIME)
+
+
+def producer(results):
+    calls = []
+    for i in range(PER_PRODUCER):
+        begin = time.perf_counter()
+        fire_global("slow", i)
+        calls.append(time.perf_counter() - begin)
+    results.extend(calls)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def main():
+    threading.Thread(target=Manager.eventLoop, daemon=True).start()
+    time.sleep(0.2)
+
+    results = []
+    threads = [threading.Thread(target=producer, args=(results,)) for _ in range(PRODUCERS)]
+    begin = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - begin
+
+    print(f"producers:      {PRODUCERS} x {PER_PRODUCER} events")
+    print(f"handler time:   {HANDLER_TIME * 1000:.1f} ms")
+    print(f"enqueue rate:   {len(results) / elapsed:,.0f} events/s")
+    print(f"fire() p50:     {percentile(results, 50) * 1e6:.1f} us")
+    print(f"fire() p99:     {percentile(results, 99) * 1e6:.1f} us")
+    print(f"fire() max:     {max(results) * 1e6:.1f} us")
+
+
+if __name__ == "__main__":
+    main()
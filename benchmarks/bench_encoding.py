@@ -0,0 +1,76 @@
+"""
+compares the JSON and the compact encoding of emitted payloads.
+
+uses the payloads of the stocks demo (candles from aapl.json) and of the
+linear chart demo ([x, y] points), and reports the bytes on the wire and the
+time it takes to serialize them.
+
+usage (from the repository root): python -m benchmarks.bench_encoding
+"""
+
+import json
+import math
+import pathlib
+import time
+
+from neca.encoding import encode
+
+
+REPEAT = 20
+
+root = pathlib.Path(__file__).parent.parent
+
+
+def stocks_payload():
+    with open(root / "neca" / "demos" / "stocks_example" / "aapl.json") as f:
+        data = json.load(f)
+    candles = [{"x": d["t"], "y": [d["o"], d["h"], d["l"], d["c"]]} for d in data["results"]]
+    return {"action": "updateSeries", "newSeries": [{"type": "candlestick", "name": "candle", "data": candles}]}
+
+
+def linear_payload():
+    points = [[i / 10, math.sin(i / 100) * 100] for i in range(10000)]
+    return {"action": "set", "series": "series1", "value": points}
+
+
+def serialize_compact(payload):
+    """
+    serializes the payload like Socket.IO does: the JSON packet with
+    placeholders for the binary attachments, and the attachments themselves.
+    """
+    attachments = []
+
+    def placeholder(value):
+        if isinstance(value, bytes):
+            attachments.append(value)
+            return {"_placeholder": True, "num": len(attachments) - 1}
+        if isinstance(value, dict):
+            return {key: placeholder(v) for key, v in value.items()}
+        if isinstance(value, list):
+            return [placeholder(v) for v in value]
+        return value
+
+    packet = json.dumps(placeholder(encode(payload)))
+    return len(packet) + sum(len(attachment) for attachment in attachments)
+
+
+def measure(func, payload):
+    begin = time.perf_counter()
+    for _ in range(REPEAT):
+        size = func(payload)
+    return size, (time.perf_counter() - begin) / REPEAT
+
+
+def main():
+    for name, payload in (("stocks", stocks_payload()), ("linear chart", linear_payload())):
+        json_size, json_time = measure(lambda p: len(json.dumps(p)), payload)
+        compact_size, compact_time = measure(serialize_compact, payload)
+
+        print(f"{name}:")
+        print(f"  json:    {json_size:>10,} bytes  {json_time * 1000:8.2f} ms")
+        print(f"  compact: {compact_size:>10,} bytes  {compact_time * 1000:8.2f} ms  "
+              f"({compact_size / json_size * 100:.0f}% of json)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+measures the event log of the connector middleware.
+
+appends events in bulks of 100 (like the /_bulk endpoint) with the different fsync
+settings: synced by the background thread every 0.1 s, synced on every append and
+left to the operating system. Then a subscriber that was disconnected catches up on
+the whole log through the broker, reading the socket as fast as it can, once for
+every event and once subscribed to a third of the keys.
+reports the appended events/s and MB/s, and the caught up events/s and MB/s.
+
+usage (from the repository root): python -m benchmarks.bench_eventlog [events]
+"""
+
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "connector middleware"))
+
+import connector  # noqa: E402
+from broker import Broker  # noqa: E402
+from eventlog import EventLog  # noqa: E402
+
+
+EVENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+BULK = 100
+
+
+def make_events():
+    keys = [f"sensor.{i}.temp" for i in range(3)]
+    return [(keys[i % 3], connector.encode(keys[i % 3], {"n": i, "value": 20.5 + i % 10}))
+            for i in range(EVENTS)]
+
+
+def append(directory, events, fsync_interval, count):
+    log = EventLog(directory, fsync_interval=fsync_interval)
+    begin = time.perf_counter()
+    for start in range(0, count, BULK):
+        log.append(events[start:start + BULK])
+    log.close()
+    elapsed = time.perf_counter() - begin
+    size = log.stats()["bytes"]
+    name = {None: "os", 0: "every append"}.get(fsync_interval, f"every {fsync_interval} s")
+    print(f"append, fsync {name:<14} {count / elapsed:>12,.0f} events/s {size / elapsed / 1e6:>8.1f} MB/s")
+
+
+def catch_up(directory, subscribe):
+    broker = Broker("127.0.0.1", 0, log=EventLog(directory)).start()
+    end = broker.offset
+    sock = socket.create_connection(broker.address)
+    if subscribe is not None:
+        sock.sendall(json.dumps({"subscribe": subscribe}).encode() + b"\n")
+    sock.sendall(json.dumps({"resume": 0}).encode() + b"\n")
+    expected = end if subscribe is None else len(range(0, end, 3))
+    # the broker first answers with the offset it resumes from
+    answer = sock.makefile("rb", buffering=0).readline()
+    assert json.loads(answer)["resumed"] == 0
+
+    begin = time.perf_counter()
+    lines = 0
+    size = 0
+    while lines < expected:
+        data = sock.recv(1 << 20)
+        if not data:
+            break
+        lines += data.count(b"\n")
+        size += len(data)
+    elapsed = time.perf_counter() - begin
+    sock.close()
+    broker.stop()
+    broker.log.close()
+
+    name = "everything" if subscribe is None else ", ".join(subscribe)
+    print(f"catch up, {name:<19} {lines / elapsed:>12,.0f} events/s {size / elapsed / 1e6:>8.1f} MB/s "
+          f"({lines:,} events)")
+
+
+def main():
+    events = make_events()
+    directory = tempfile.mkdtemp()
+    try:
+        print(f"{EVENTS:,} events, appended in bulks of {BULK}")
+        for fsync_interval, count in ((None, EVENTS), (0, EVENTS // 10)):
+            append(os.path.join(directory, "log"), events, fsync_interval, count)
+            shutil.rmtree(os.path.join(directory, "log"))
+        append(os.path.join(directory, "log"), events, 0.1, EVENTS)
+
+        catch_up(os.path.join(directory, "log"), None)
+        catch_up(os.path.join(directory, "log"), ["sensor.0.*"])
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+micro-benchmarks of the event core: calling the handlers of a fired event.
+
+every case fires events with fire_immediate (and fire_immediate_many), so only the
+lookup of the rules, the conditions and the handler calls are measured, not the
+event loop. The same cases are run with the dispatch loop from before the compiled
+dispatch plans (every rule checked through check_conditions and a debug message
+formatted for every failed condition), as a reference.
+reports the handler invocations per second of every case.
+
+usage (from the repository root): python -m benchmarks.bench_events [events]
+"""
+
+import sys
+import time
+
+from neca.events import Context, Ruleset
+from neca.log import logger
+
+
+EVENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 300000
+
+
+def original_fire(context, key, data):
+    # fire_immediate before the dispatch plans
+    rules = context.ruleset.rules(key)
+    if rules == []:
+        logger.warning(f"no rules for event: {key}")
+        return
+    for rule in rules:
+        if rule.check_conditions(context, data):
+            if rule.batch:
+                context._add_to_batch(rule, key, data)
+            else:
+                context._call_rule(rule, key, data)
+        else:
+            logger.debug(f"rule for {rule.func} did not meet conditions for event: {key}")
+
+
+def original_fire_many(context, key, items):
+    for data in items:
+        original_fire(context, key, data)
+
+
+def make_context(handlers, conditions, passing=True):
+    # a ruleset with a number of handlers for "tick", every one with a number of conditions
+    rules = Ruleset()
+    calls = [0]
+
+    for _ in range(handlers):
+        def handle(context, data):
+            calls[0] += 1
+        for _ in range(conditions):
+            rules.condition(lambda context, data: passing)(handle)
+        rules.event("tick")(handle)
+    return Context(rules), calls
+
+
+def measure(name, fire, context, calls, many=False):
+    calls[0] = 0
+    begin = time.perf_counter()
+    if many:
+        items = list(range(1000))
+        for _ in range(EVENTS // len(items)):
+            fire(context, "tick", items)
+        events = EVENTS // len(items) * len(items)
+    else:
+        for i in range(EVENTS):
+            fire(context, "tick", i)
+        events = EVENTS
+    elapsed = time.perf_counter() - begin
+    # cases where the conditions fail count the checked events instead of the calls
+    count = calls[0] or events
+    print(f"  {name:<40} {count / elapsed:>12,.0f} invocations/s")
+
+
+def main():
+    cases = [
+        ("1 handler", 1, 0, True, False),
+        ("5 handlers", 5, 0, True, False),
+        ("1 handler, 2 conditions", 1, 2, True, False),
+        ("1 handler, failing condition", 1, 1, False, False),
+        ("1 handler, fire_immediate_many", 1, 0, True, True),
+        ("1 handler, 2 conditions, many", 1, 2, True, True),
+    ]
+    print(f"{EVENTS:,} events per case")
+    for label, fire, fire_many in (
+            ("before (the original dispatch loop)", original_fire, original_fire_many),
+            ("after (compiled dispatch plans)", Context.fire_immediate, Context.fire_immediate_many)):
+        print(label)
+        for name, handlers, conditions, passing, many in cases:
+            context, calls = make_context(handlers, conditions, passing)
+            measure(name, fire_many if many else fire, context, calls, many)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+measures the ConnectorHub following many streams at once.
+
+a server process accepts the connections and pushes {"key": ..., "data": ...} lines
+on every one of them. The hub follows all streams on a single thread and hands the
+lines to the threaded event engine in batches, where a handler counts them.
+reports the received messages/s, the number of threads and the peak memory use.
+
+usage (from the repository root): python -m benchmarks.bench_hub [connections] [messages per connection]
+"""
+
+import asyncio
+import json
+import multiprocessing
+import resource
+import sys
+import threading
+import time
+
+from neca.connectors import ConnectorHub
+from neca.events import Manager, event
+
+
+CONNECTIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+MESSAGES = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+
+def serve(port, ready, connections, messages):
+    async def main():
+        async def push(reader, writer):
+            for i in range(0, messages, 50):
+                writer.write(b"".join(json.dumps({"key": "tick", "data": {"n": n, "price": 220.5}}).encode() + b"\n"
+                                      for n in range(i, min(i + 50, messages))))
+                await writer.drain()
+            # keep the connection open, like a live feed
+            await asyncio.sleep(3600)
+
+        server = await asyncio.start_server(push, "127.0.0.1", port, backlog=connections)
+        ready.set()
+        async with server:
+            await server.serve_forever()
+    asyncio.run(main())
+
+
+def main():
+    port = 47311
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(target=serve, args=(port, ready, CONNECTIONS, MESSAGES), daemon=True)
+    server.start()
+    ready.wait()
+
+    total = CONNECTIONS * MESSAGES
+    received = [0]
+    finished = threading.Event()
+
+    @event("tick")
+    def tick(context, data):
+        received[0] += 1
+        if received[0] == total:
+            finished.set()
+
+    threading.Thread(target=Manager.eventLoop, daemon=True).start()
+    time.sleep(0.2)
+
+    threads = threading.active_count()
+    begin = time.perf_counter()
+    hub = ConnectorHub(max_in_flight=50000).start()
+    for i in range(CONNECTIONS):
+        hub.add([("127.0.0.1", port)], name=f"feed {i}")
+    finished.wait(120)
+    elapsed = time.perf_counter() - begin
+
+    health = hub.health()
+    print(f"{CONNECTIONS:,} connections ({health['connected']:,} connected), {MESSAGES:,} messages each")
+    print(f"received {received[0]:,} messages in {elapsed:.2f} s: {received[0] / elapsed:,.0f} msgs/s")
+    print(f"threads: {threads} before the hub, {threading.active_count()} with the hub")
+    print(f"peak memory: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+
+    hub.stop()
+    server.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+measures the dispatch latency of the event loop.
+
+fires N zero-delay events from the main thread and records the time between
+enqueueing the event and the handler being called. reports p50/p99 latency
+and the cpu time used by the process while the event loop is idle.
+
+usage (from the repository root): python -m benchmarks.bench_latency [N]
+"""
+
+import sys
+import threading
+import time
+
+from neca.events import Manager, event, fire_global
+
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+latencies = []
+done = threading.Event()
+
+
+@event("init")
+def init(ctx, data):
+    pass
+
+
+@event("ping")
+def ping(ctx, sent):
+    latencies.append(time.perf_counter() - sent)
+    if len(latencies) == N:
+        done.set()
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def main():
+    threading.Thread(target=Manager.eventLoop, daemon=True).start()
+    time.sleep(0.2)
+
+    # fire the events one by one, giving the loop time to go idle in between
+    # so every event measures a wakeup rather than a batch
+    for _ in range(N):
+        fire_global("ping", time.perf_counter())
+        time.sleep(0.0001)
+    done.wait()
+
+    print(f"events:      {N}")
+    print(f"p50 latency: {percentile(latencies, 50) * 1000:.3f} ms")
+    print(f"p99 latency: {percentile(latencies, 99) * 1000:.3f} ms")
+    print(f"max latency: {max(latencies) * 1000:.3f} ms")
+
+    # measure cpu usage while idle
+    cpu = time.process_time()
+    time.sleep(1)
+    print(f"idle cpu:    {(time.process_time() - cpu) * 100:.1f} %")
+
+
+if __name__ == "__main__":
+    main()
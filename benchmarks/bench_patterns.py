@@ -0,0 +1,63 @@
+"""
+measures firing events in a Ruleset with thousands of wildcard patterns.
+
+a ruleset with only exact keys is compared with one that also has thousands of
+patterns ("building.<n>.*.temp" and "stock.<n>.#"). The events are fired with
+fire_immediate, so only the lookup of the rules and the handler call are measured:
+exact keys, keys that match a pattern (resolved once, then cached) and keys that are
+all different, so every one of them is resolved in the trie.
+reports the events/s of every case.
+
+usage (from the repository root): python -m benchmarks.bench_patterns [patterns] [events]
+"""
+
+import sys
+import time
+
+from neca.events import Context, Ruleset
+
+
+PATTERNS = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+EVENTS = int(sys.argv[2]) if len(sys.argv) > 2 else 500000
+
+
+def ruleset(patterns: int) -> Ruleset:
+    rules = Ruleset()
+    count = [0]
+
+    def handle(context, data):
+        count[0] += 1
+
+    for key in ("tick", "sensor.kitchen.temp"):
+        rules.event(key)(handle)
+    for i in range(patterns // 2):
+        # a new function for every pattern, like separate handlers in a dashboard
+        rules.event(f"building.{i}.*.temp")(lambda context, data: None)
+        rules.event(f"stock.{i}.#")(lambda context, data: None)
+    return rules
+
+
+def measure(name, context, keys):
+    fire = context.fire_immediate
+    begin = time.perf_counter()
+    for key in keys:
+        fire(key, None)
+    elapsed = time.perf_counter() - begin
+    print(f"{name:<44} {len(keys) / elapsed:>12,.0f} events/s")
+
+
+def main():
+    exact = Context(ruleset(0))
+    patterned = Context(ruleset(PATTERNS))
+    print(f"{PATTERNS:,} patterns, {EVENTS:,} events")
+
+    measure("exact key, no patterns", exact, ["tick"] * EVENTS)
+    measure(f"exact key, {PATTERNS:,} patterns", patterned, ["tick"] * EVENTS)
+    measure("matching keys, cached", patterned,
+            [f"building.{i % 100}.hall.temp" for i in range(EVENTS)])
+    measure("matching keys, all different", patterned,
+            [f"stock.{i % (PATTERNS // 2)}.{i}.price" for i in range(EVENTS // 10)])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+compares the throughput of the line readers used by generate_data.
+
+writes a file with synthetic tweets and reads it with the original text mode
+reader (json.loads per line), with json_lines_generator and with
+json_lines_generator keeping only a few fields. The same file compressed with
+gzip is read with decompression in the background (line_reader) and with
+gzip decompressing in the parsing thread. reports records/s and MB/s
+(of uncompressed data).
+
+usage (from the repository root): python -m benchmarks.bench_reader [number of tweets]
+"""
+
+import gzip
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from neca.generators import json_lines_generator, _loads
+
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+
+
+def text_mode_generator(data_file):
+    # the original tweet_generator
+    for line in open(data_file, 'r', encoding='utf-8'):
+        yield json.loads(line)
+
+
+def gzip_inline_generator(data_file):
+    # decompressing and parsing one after the other
+    with gzip.open(data_file, 'rb') as f:
+        for line in f:
+            if line.strip():
+                yield _loads(line)
+
+
+def write_tweets(path):
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(N):
+            tweet = {
+                "created_at": "Wed Oct 10 20:19:24 +0000 2018",
+                "id": 1050118621198921728 + i,
+                "text": f"tweet number {i} about the weather in Enschede #weer",
+                "user": {"id": i % 1000, "name": f"user {i % 1000}", "followers_count": i % 5000},
+                "entities": {"hashtags": [{"text": "weer", "indices": [40, 45]}], "urls": []},
+                "lang": "nl",
+            }
+            f.write(json.dumps(tweet) + "\n")
+
+
+def measure(name, generator, size):
+    begin = time.perf_counter()
+    count = sum(1 for _ in generator)
+    elapsed = time.perf_counter() - begin
+    print(f"{name:<32} {count / elapsed:>12,.0f} records/s {size / elapsed / 1e6:>8.1f} MB/s")
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "tweets.txt")
+        write_tweets(path)
+        size = os.path.getsize(path)
+
+        print(f"{N:,} tweets, {size / 1e6:.1f} MB, parser: {_loads.__module__}")
+        measure("text mode + json.loads", text_mode_generator(path), size)
+        measure("json_lines_generator", json_lines_generator(path), size)
+        measure("json_lines_generator (fields)", json_lines_generator(path, fields=("created_at", "text")), size)
+
+        compressed = path + ".gz"
+        with open(path, 'rb') as source, gzip.open(compressed, 'wb') as target:
+            shutil.copyfileobj(source, target)
+        print(f"gzip: {os.path.getsize(compressed) / 1e6:.1f} MB")
+        measure("gzip, decompress in thread", json_lines_generator(compressed), size)
+        measure("gzip, decompress inline", gzip_inline_generator(compressed), size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+compares datetime.strptime with the compiled timestamp parsers.
+
+writes a file with one million records whose timestamps advance by a few
+seconds at most (so many records share a second, like tweets do), reads the
+timestamp strings back and parses them with strptime, with the compiled parser
+and with the compiled parser without its cache.
+
+usage (from the repository root): python -m benchmarks.bench_timestamps [number of lines]
+"""
+
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from neca.generators import json_lines_generator
+from neca.timestamps import compile_parser
+
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+FORMAT = '%a %b %d %H:%M:%S %z %Y'
+
+
+def write_records(path):
+    moment = datetime(2018, 10, 10, 20, 19, 24, tzinfo=timezone.utc)
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(N):
+            if random.random() < 0.2:
+                moment += timedelta(seconds=random.randint(1, 3))
+            f.write(json.dumps({"created_at": moment.strftime(FORMAT), "id": i}) + "\n")
+
+
+def measure(name, parse, values):
+    begin = time.perf_counter()
+    for value in values:
+        parse(value)
+    elapsed = time.perf_counter() - begin
+    print(f"{name:<28} {elapsed:7.2f} s {len(values) / elapsed:>12,.0f} timestamps/s")
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "records.txt")
+        write_records(path)
+        values = [record["created_at"] for record in json_lines_generator(path)]
+
+    print(f"{len(values):,} timestamps, {len(set(values)):,} distinct")
+    measure("datetime.strptime", lambda value: datetime.strptime(value, FORMAT), values)
+    measure("compiled parser (no cache)", compile_parser(FORMAT, cache_size=0), values)
+    measure("compiled parser", compile_parser(FORMAT), values)
+
+
+if __name__ == "__main__":
+    main()
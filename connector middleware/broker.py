@@ -0,0 +1,476 @@
+"""
+the fan-out broker of the connector middleware.
+
+events posted to the middleware are forwarded to every connected client (usually
+connect_datastream in a NECA dashboard) as {"key": ..., "data": ...} lines.
+
+publishers never wait for subscribers: every subscriber has its own bounded outbound
+queue, and a single I/O thread writes the queues to the sockets without blocking
+(with selectors). When a subscriber can't keep up and its queue is full, the slow
+consumer policy decides what happens:
+- "drop_oldest": the oldest queued events are dropped (the default, a dashboard wants the latest state)
+- "drop_newest": the new events are dropped
+- "disconnect": the subscriber is disconnected, it can connect again and catch up
+
+subscribers receive every event, unless they send the patterns of the keys they want
+(see topics.py) as a line, any time after connecting:
+    {"subscribe": ["sensor.*.temp", "stock.#"]}
+replaces the subscriptions, and
+    {"unsubscribe": ["stock.#"]}
+removes some of them. Events are then only sent to the subscribers that want them.
+
+with an event log (see eventlog.py) every event gets an offset, and subscribers that
+were disconnected can catch up: after subscribing, they send the offset of the first
+event they missed
+    {"resume": 1234}
+and get every (subscribed) event from that offset on, read from the log in big chunks
+whenever their socket has room, before they get new events again. The broker first answers
+with the offset it actually resumes from, which is lower when the log was reset or older
+events were deleted
+    {"resumed": 1000}
+the events sent before the answer are sent again from the log.
+"""
+
+import json
+import selectors
+import socket
+import sys
+from collections import deque
+from threading import Lock, Thread
+from typing import Dict, Iterable, List, Optional, Tuple
+from eventlog import EventLog
+from topics import TopicIndex
+
+
+# the policies for subscribers that can't keep up
+POLICIES = ("drop_oldest", "drop_newest", "disconnect")
+
+# the maximum number of bytes and lines written to a socket at once
+# (sendmsg accepts at most IOV_MAX buffers, 1024 on Linux)
+WRITE_SIZE = 1 << 18
+WRITE_LINES = 512
+
+# the maximum length of a line sent by a subscriber
+MAX_REQUEST_LENGTH = 1 << 16
+
+# the number of bytes read from the event log at once for a subscriber that catches up
+CATCH_UP_SIZE = 1 << 20
+
+
+def _key(line: bytes) -> str:
+    """
+    returns the key of a line of the event log.
+    """
+    # the lines start with {"offset": ..., "key": "..." when they were encoded by connector.py,
+    # so most keys are found without parsing the whole line
+    start = line.find(b", ") + 2
+    if line.startswith(b'"key": "', start):
+        end = line.find(b'"', start + 8)
+        key = line[start + 8:end]
+        if end > 0 and b"\\" not in key:
+            return key.decode("utf-8")
+    return str(json.loads(line).get("key"))
+
+
+class Subscriber:
+    """
+    a connected client, with its outbound queue.
+    """
+
+    def __init__(self, sock: socket.socket, address):
+        self.sock = sock
+        self.address = address
+
+        # the encoded lines that still have to be sent, and their total size
+        self.queue: deque = deque()
+        self.queued_bytes = 0
+        # what is left of a line that was partially sent
+        self.partial: Optional[memoryview] = None
+        # True while the socket is registered for writing
+        self.writing = False
+        # the bytes received from the subscriber that don't form a line yet
+        self.inbound = bytearray()
+        # the next offset to read from the event log while catching up, None when live
+        self.catch_up: Optional[int] = None
+        # new events before this offset are not sent, the subscriber gets them from the log
+        self.live_from = 0
+        # the offset of the first new event the subscriber got
+        self.connected_at = 0
+
+        self.sent = 0       # lines sent
+        self.dropped = 0    # lines dropped by the slow consumer policy
+
+    def stats(self, patterns: Iterable[str] = ()) -> Dict:
+        return {
+            "address": f"{self.address[0]}:{self.address[1]}",
+            "patterns": sorted(patterns),
+            "catch_up": self.catch_up,
+            "queued": len(self.queue),
+            "queued_bytes": self.queued_bytes,
+            "sent": self.sent,
+            "dropped": self.dropped,
+        }
+
+
+class Broker:
+    """
+    accepts subscribers and forwards published lines to them, on its own I/O thread.
+    """
+
+    def __init__(self, host: str = "", port: int = 25565,
+                 max_queue: int = 10000,
+                 max_queue_bytes: int = 16 << 20,
+                 policy: str = "drop_oldest",
+                 log: Optional[EventLog] = None):
+        """
+        host, port: where subscribers connect
+        max_queue: the maximum number of lines queued for a subscriber
+        max_queue_bytes: the maximum number of bytes queued for a subscriber
+        policy: what happens when the queue of a subscriber is full, see POLICIES
+        log: the event log every event is appended to, None keeps no events
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"unknown policy: {policy}. Use one of {', '.join(POLICIES)}")
+        self.max_queue = max_queue
+        self.max_queue_bytes = max_queue_bytes
+        self.policy = policy
+        self.log = log
+
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((host, port))
+        self.server.listen(128)
+        self.server.setblocking(False)
+
+        self.subscribers: Dict[socket.socket, Subscriber] = {}
+        # the patterns of the keys every subscriber wants
+        self.topics = TopicIndex()
+        self.published = 0
+        self.disconnected = 0
+        # the offset the next event gets, and the offset of the next event the I/O thread fans out
+        self.offset = log.end_offset if log is not None else 0
+        self._fanned_out = self.offset
+
+        # the offset of the first event and the (key, line) events of every publish call by
+        # other threads, moved to the queues by the I/O thread
+        self._inbox: List[Tuple[int, List[Tuple[str, bytes]]]] = []
+        self._inbox_lock = Lock()
+        # written to wake up the I/O thread
+        self._wakeup_read, self._wakeup_write = socket.socketpair()
+        self._wakeup_read.setblocking(False)
+        self._wakeup_write.setblocking(False)
+        self._wakeup_pending = False
+
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self.server, selectors.EVENT_READ, self._accept)
+        self._selector.register(self._wakeup_read, selectors.EVENT_READ, self._wake)
+        self._running = False
+        self._thread = Thread(target=self._run, daemon=True)
+
+    @property
+    def address(self):
+        return self.server.getsockname()
+
+    def start(self) -> "Broker":
+        self._running = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        self._notify()
+        self._thread.join()
+
+    def publish(self, events: Iterable[Tuple[str, bytes]]):
+        """
+        forwards (key, encoded line ending with a newline) events to the subscribers of their key,
+        after appending them to the event log. Never blocks on subscribers. can be called from any thread.
+        """
+        events = list(events)
+        with self._inbox_lock:
+            # appending with the lock keeps the offsets in the order of the inbox
+            if self.log is not None:
+                first, events = self.log.append(events)
+            else:
+                first = self.offset
+            self.offset = first + len(events)
+            self._inbox.append((first, events))
+            if self._wakeup_pending:
+                return
+            self._wakeup_pending = True
+        self._notify()
+
+    def stats(self) -> Dict:
+        subscribers = list(self.subscribers.values())
+        return {
+            "published": self.published,
+            "disconnected": self.disconnected,
+            "offset": self.offset,
+            "log": self.log.stats() if self.log is not None else None,
+            "subscribers": [subscriber.stats(self.topics.patterns(subscriber)) for subscriber in subscribers],
+        }
+
+    def _notify(self):
+        try:
+            self._wakeup_write.send(b"\0")
+        except BlockingIOError:
+            # the I/O thread is already woken up
+            pass
+
+    # everything below runs on the I/O thread
+
+    def _run(self):
+        while self._running:
+            for key, mask in self._selector.select():
+                key.data(key.fileobj, mask)
+        for sock in list(self.subscribers):
+            self._remove(sock)
+        self._selector.close()
+        self.server.close()
+
+    def _accept(self, server, mask):
+        try:
+            sock, address = server.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        subscriber = self.subscribers[sock] = Subscriber(sock, address)
+        subscriber.connected_at = self._fanned_out
+        # everything, until the subscriber says what it wants
+        self.topics.subscribe(subscriber, ["#"])
+        self._selector.register(sock, selectors.EVENT_READ, self._ready)
+        print(f"Connection from {address} has been established!")
+
+    def _wake(self, wakeup, mask):
+        try:
+            while wakeup.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        with self._inbox_lock:
+            batches, self._inbox = self._inbox, []
+            self._wakeup_pending = False
+        if batches:
+            self._fan_out(batches)
+
+    def _fan_out(self, batches: List[Tuple[int, List[Tuple[str, bytes]]]]):
+        """
+        adds the lines to the queues of the subscribers of their keys.
+        """
+        # collect the lines per subscriber, keeping their order
+        outbound: Dict[Subscriber, List[bytes]] = {}
+        match = self.topics.match
+        for offset, events in batches:
+            self.published += len(events)
+            for key, line in events:
+                for subscriber in match(key):
+                    if offset < subscriber.live_from:
+                        # catching up, the event is sent from the log
+                        continue
+                    lines = outbound.get(subscriber)
+                    if lines is None:
+                        outbound[subscriber] = [line]
+                    else:
+                        lines.append(line)
+                offset += 1
+            self._fanned_out = offset
+
+        for subscriber, lines in outbound.items():
+            if subscriber.sock in self.subscribers:
+                self._enqueue(subscriber, lines, sum(map(len, lines)))
+
+    def _enqueue(self, subscriber: Subscriber, lines: List[bytes], size: int):
+        subscriber.queue.extend(lines)
+        subscriber.queued_bytes += size
+
+        if len(subscriber.queue) > self.max_queue or subscriber.queued_bytes > self.max_queue_bytes:
+            if self.policy == "disconnect":
+                print(f"Disconnecting {subscriber.address}, it can't keep up")
+                self._remove(subscriber.sock)
+                return
+            queue = subscriber.queue
+            while queue and (len(queue) > self.max_queue or subscriber.queued_bytes > self.max_queue_bytes):
+                line = queue.popleft() if self.policy == "drop_oldest" else queue.pop()
+                subscriber.queued_bytes -= len(line)
+                subscriber.dropped += 1
+
+        if subscriber.queue and not subscriber.writing:
+            # try to write right away, most of the time the socket has room
+            self._write(subscriber)
+
+    def _ready(self, sock, mask):
+        subscriber = self.subscribers.get(sock)
+        if subscriber is None:
+            return
+        if mask & selectors.EVENT_READ:
+            try:
+                data = sock.recv(4096)
+            except (BlockingIOError, InterruptedError):
+                data = None
+            except OSError:
+                data = b""
+            if data == b"":
+                # the subscriber closed the connection
+                self._remove(sock)
+                return
+            if data:
+                self._received(subscriber, data)
+                if sock not in self.subscribers:
+                    return
+        if mask & selectors.EVENT_WRITE:
+            self._write(subscriber)
+
+    def _received(self, subscriber: Subscriber, data: bytes):
+        """
+        handles the subscription requests of a subscriber, one JSON object per line.
+        """
+        subscriber.inbound += data
+        *lines, rest = subscriber.inbound.split(b"\n")
+        if len(rest) > MAX_REQUEST_LENGTH:
+            print(f"Disconnecting {subscriber.address}, its request is too long")
+            self._remove(subscriber.sock)
+            return
+        subscriber.inbound = bytearray(rest)
+
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                subscribe = request.get("subscribe")
+                unsubscribe = request.get("unsubscribe")
+                resume = request.get("resume")
+                if subscribe is not None:
+                    # replaces what the subscriber wanted before
+                    self.topics.unsubscribe(subscriber)
+                    self.topics.subscribe(subscriber, [str(pattern) for pattern in subscribe])
+                if unsubscribe is not None:
+                    self.topics.unsubscribe(subscriber, [str(pattern) for pattern in unsubscribe])
+                if resume is not None:
+                    self._resume(subscriber, int(resume))
+            except (ValueError, AttributeError, TypeError):
+                print(f"Ignoring an invalid request from {subscriber.address}: {bytes(line[:100])!r}")
+
+    def _resume(self, subscriber: Subscriber, offset: int):
+        """
+        starts sending the events from offset on from the log, new events wait until the subscriber caught up.
+        """
+        if self.log is None:
+            print(f"Can't resume {subscriber.address}, the broker has no event log")
+            self._enqueue(subscriber, [b'{"resumed": null}\n'], 17)
+            return
+        if offset > subscriber.connected_at:
+            # the subscriber can't have seen these events, the log was reset.
+            # send everything since it connected
+            offset = subscriber.connected_at
+        offset = max(offset, self.log.start_offset)
+
+        # the queued events are sent again from the log, after the answer
+        for line in subscriber.queue:
+            subscriber.queued_bytes -= len(line)
+        subscriber.queue.clear()
+        answer = json.dumps({"resumed": offset}).encode() + b"\n"
+        subscriber.queue.append(answer)
+        subscriber.queued_bytes += len(answer)
+        subscriber.catch_up = offset
+        subscriber.live_from = sys.maxsize
+        self._write(subscriber)
+
+    def _read_log(self, subscriber: Subscriber) -> bool:
+        """
+        queues the next chunk of the log for a subscriber that catches up.
+        returns False when it caught up.
+        """
+        while True:
+            data, offset = self.log.read(subscriber.catch_up, CATCH_UP_SIZE)
+            if not data:
+                # new events from here on are sent as they are published
+                subscriber.catch_up = None
+                subscriber.live_from = offset
+                return False
+            subscriber.catch_up = offset
+
+            if self.topics.patterns(subscriber) != {"#"}:
+                # only send the keys the subscriber wants
+                match = self.topics.match
+                lines = [line for line in data.splitlines(keepends=True) if subscriber in match(_key(line))]
+                if not lines:
+                    continue
+                data = b"".join(lines)
+            subscriber.queue.append(data)
+            subscriber.queued_bytes += len(data)
+            return True
+
+    def _write(self, subscriber: Subscriber):
+        """
+        writes as much of the queue as the socket accepts, without blocking.
+        """
+        queue = subscriber.queue
+        sock = subscriber.sock
+        while subscriber.partial is not None or queue or (subscriber.catch_up is not None and self._read_log(subscriber)):
+            # gather lines up to WRITE_SIZE into one send
+            buffers = []
+            size = 0
+            if subscriber.partial is not None:
+                buffers.append(subscriber.partial)
+                size += len(subscriber.partial)
+            count = 0
+            for line in queue:
+                if size >= WRITE_SIZE or count >= WRITE_LINES:
+                    break
+                buffers.append(line)
+                size += len(line)
+                count += 1
+
+            try:
+                sent = sock.sendmsg(buffers)
+            except (BlockingIOError, InterruptedError):
+                sent = 0
+            except OSError:
+                self._remove(sock)
+                return
+
+            # remove what was sent
+            if subscriber.partial is not None:
+                if sent < len(subscriber.partial):
+                    subscriber.partial = subscriber.partial[sent:]
+                    break
+                sent -= len(subscriber.partial)
+                subscriber.partial = None
+            for _ in range(count):
+                line = queue[0]
+                if sent < len(line):
+                    if sent:
+                        queue.popleft()
+                        subscriber.queued_bytes -= len(line)
+                        subscriber.partial = memoryview(line)[sent:]
+                        subscriber.sent += line.count(b"\n")
+                    sent = -1
+                    break
+                queue.popleft()
+                subscriber.queued_bytes -= len(line)
+                subscriber.sent += line.count(b"\n")
+                sent -= len(line)
+            if sent < 0:
+                # the socket is full
+                break
+
+        # only wait for the socket to be writable while something is queued
+        writing = subscriber.partial is not None or bool(queue) or subscriber.catch_up is not None
+        if writing != subscriber.writing:
+            subscriber.writing = writing
+            events = selectors.EVENT_READ | (selectors.EVENT_WRITE if writing else 0)
+            self._selector.modify(sock, events, self._ready)
+
+    def _remove(self, sock: socket.socket):
+        subscriber = self.subscribers.pop(sock, None)
+        if subscriber is None:
+            return
+        self.topics.unsubscribe(subscriber)
+        self.disconnected += 1
+        try:
+            self._selector.unregister(sock)
+        except (KeyError, ValueError):
+            pass
+        sock.close()
@@ -1,12 +1,12 @@
 from flask import Flask, render_template, request, redirect, url_for, flash
+import os
 import socket
 import json
-from threading import Thread, Lock
-from time import sleep
+from broker import Broker
+from eventlog import EventLog
 
 app = Flask(__name__)
-csockets = [] # list of connected sockets
-socket_lock = Lock() # lock for the list of sockets
+broker = None # the broker forwarding the events to the connected clients, see broker.py
 
 # =============================================================================================
 #                                        Web app routes
@@ -118,39 +118,43 @@ def index():
     </html>
     """
 
+def encode(key, data):
+    # one line per event, the format connect_datastream reads
+    return (json.dumps({"key": key, "data": data}) + "\n").encode("utf-8")
+
+@app.route("/_bulk", methods=["POST"])
+def bulk():
+    # send many events at once, either as a JSON list of {"key": ..., "data": ...}
+    # or as one {"key": ..., "data": ...} object per line
+    try:
+        if request.is_json:
+            events = request.json
+        else:
+            events = [json.loads(line) for line in request.data.splitlines() if line.strip()]
+    except ValueError:
+        return "the events are not valid JSON", 400
+
+    if not isinstance(events, list) or not all(isinstance(e, dict) and "key" in e for e in events):
+        return "expected a list of {\"key\": ..., \"data\": ...} objects", 400
+
+    broker.publish([(str(e["key"]), encode(e["key"], e.get("data"))) for e in events])
+    return {"published": len(events)}, 200
+
+@app.route("/_stats")
+def stats():
+    return broker.stats()
+
 @app.route("/<key>", methods=["POST"])
 def event(key):
     # send event to all connected clients
     # with the accompanied data
+    data = request.json if request.is_json else request.data.decode("utf-8")
 
-    tosend = {
-        "key": key,
-        "data": request.json if request.is_json else request.data.decode("utf-8")
-    }
-
-    # jsonize the data
-    tosend = json.dumps(tosend) + "\n"
-
-    # send to all connected clients
-    socket_lock.acquire()
-    for csocket in csockets:
-        try:
-            csocket.send(tosend.encode("utf-8"))
-        except:
-            # if the client is not connected anymore, remove it from the list
-            csockets.remove(csocket)
-    socket_lock.release()
+    # the broker queues the event for every client, slow clients don't hold up the request
+    broker.publish([(key, encode(key, data))])
 
     return "OK", 200
 
-def listener(list, lock):
-    while True:
-        clientsocket, address = s.accept()
-        lock.acquire()
-        list.append(clientsocket)
-        lock.release()
-        print(f"Connection from {address} has been established!")
-
 # =============================================================================================
 #                                   Connecting with clients
 # =============================================================================================
@@ -158,19 +162,15 @@ def listener(list, lock):
 # the clients will be connected via network sockets
 # a website will send events to this app
 if __name__ == "__main__":
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    s.bind((socket.gethostname(), 25565))
+    # keep the events on disk, so clients that were disconnected can catch up
+    log = EventLog(os.path.join(os.path.dirname(os.path.abspath(__file__)), "events"), retention_bytes=1 << 30)
+    broker = Broker(socket.gethostname(), 25565, log=log)
 
     # print the port number
-    print(f"Listening on {s.getsockname()}\n")
-
-    s.listen()
-    
-
+    print(f"Listening on {broker.address}\n")
 
-    # start a thread that listens for new connections
-    t = Thread(target=listener, args=(csockets, socket_lock))
-    t.start()
+    # start the thread that accepts the clients and sends them the events
+    broker.start()
 
 
 
@@ -0,0 +1,365 @@
+"""
+the durable event log of the connector middleware.
+
+every published event is appended to the log with an offset, a number that goes up by
+one for every event. The log is a directory of segment files, every segment holds the
+events from the offset in its name on, one {"offset": ..., "key": ..., "data": ...} line per
+event, exactly as they are sent to the clients. A client that was disconnected (a dashboard
+that restarted) sends the offset of the first event it missed, and the broker sends it
+everything from that offset on in big chunks, straight from the segments.
+
+- appends are written to the segment right away, but only made durable with fsync every
+  fsync_interval seconds, on a background thread, so publishing never waits for the disk
+- when a segment is larger than segment_size, a new segment is started
+- old segments are deleted when the log is larger than retention_bytes, or when their
+  newest event is older than retention_seconds
+- every segment has a sparse index (.index) with the position of an event every
+  INDEX_INTERVAL bytes, so reading from an offset only scans a few kilobytes
+
+Example usage:
+```python
+log = EventLog("events", retention_bytes=1 << 30)
+first, events = log.append([("tick", b'{"key": "tick", "data": 1}\\n')])
+data, next_offset = log.read(first)
+```
+"""
+
+import os
+import time
+from array import array
+from bisect import bisect_right
+from threading import Event, Lock, Thread
+from typing import Dict, List, Optional, Tuple
+
+
+# the number of bytes between the entries of the sparse index of a segment
+INDEX_INTERVAL = 1 << 12
+
+# the number of bytes read at once when scanning a segment
+SCAN_SIZE = 1 << 16
+
+# the minimum number of seconds between the checks of the time retention on append
+RETAIN_INTERVAL = 1.0
+
+
+class _Segment:
+    """
+    one file of the log, with the events from base on.
+    """
+
+    def __init__(self, directory: str, base: int):
+        self.base = base
+        self.path = os.path.join(directory, f"{base:020d}.log")
+        self.index_path = os.path.join(directory, f"{base:020d}.index")
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        self.index_fd = os.open(self.index_path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        self.size = os.fstat(self.fd).st_size
+        # the number of events in the segment
+        self.count = 0
+        # the sparse index: the offsets (relative to base) and positions of some events
+        self.offsets = array("Q", [0])
+        self.positions = array("Q", [0])
+        # the time of the last append, for the retention
+        self.modified = os.fstat(self.fd).st_mtime
+
+    def load(self, last: bool):
+        """
+        reads the index of an existing segment. The last segment is checked for events
+        that were appended after the index was written, and for a torn last line.
+        """
+        entries = array("Q")
+        with open(self.index_path, "rb") as f:
+            data = f.read()
+        entries.frombytes(data[:len(data) - len(data) % (2 * entries.itemsize)])
+        offsets, positions = entries[0::2], entries[1::2]
+        # only keep the entries that point into the file
+        keep = bisect_right(positions, self.size)
+        self.offsets, self.positions = offsets[:keep], positions[:keep]
+        if not self.offsets or self.offsets[0] != 0:
+            self.offsets.insert(0, 0)
+            self.positions.insert(0, 0)
+
+        if not last and keep == len(offsets):
+            # the count of a closed segment follows from the base of the next one
+            return
+        self._scan()
+
+    def _scan(self):
+        """
+        counts the events after the last index entry, and cuts off a torn last line.
+        """
+        count = self.offsets[-1]
+        position = self.positions[-1]
+        end = position
+        while position < self.size:
+            data = os.pread(self.fd, SCAN_SIZE, position)
+            if not data:
+                break
+            lines = data.count(b"\n")
+            count += lines
+            if lines:
+                end = position + data.rindex(b"\n") + 1
+            position += len(data)
+        if end < self.size:
+            # a line that was not completely written before a crash
+            os.ftruncate(self.fd, end)
+            self.size = end
+        self.count = count
+
+    def append(self, data: bytes, count: int, index: List[Tuple[int, int]]):
+        position = self.size
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self.fd, view):]
+        self.size += len(data)
+        self.count += count
+        self.modified = time.time()
+
+        if index:
+            entries = array("Q")
+            for offset, relative in index:
+                self.offsets.append(offset)
+                self.positions.append(position + relative)
+                entries.extend((offset, position + relative))
+            os.write(self.index_fd, entries.tobytes())
+
+    def index_due(self) -> int:
+        """
+        returns how many bytes can be appended before the next index entry.
+        """
+        return self.positions[-1] + INDEX_INTERVAL - self.size
+
+    def position(self, offset: int) -> int:
+        """
+        returns the position of the event with the relative offset.
+        """
+        i = bisect_right(self.offsets, offset) - 1
+        current, position = self.offsets[i], self.positions[i]
+        # scan the lines after the index entry
+        while current < offset:
+            data = os.pread(self.fd, SCAN_SIZE, position)
+            start = 0
+            while current < offset:
+                newline = data.find(b"\n", start)
+                if newline < 0:
+                    break
+                start = newline + 1
+                current += 1
+            position += start if current == offset else len(data)
+        return position
+
+    def sync(self):
+        os.fsync(self.fd)
+        os.fsync(self.index_fd)
+
+    def close(self):
+        os.close(self.fd)
+        os.close(self.index_fd)
+
+    def delete(self):
+        self.close()
+        os.remove(self.path)
+        os.remove(self.index_path)
+
+
+class EventLog:
+    """
+    an append-only log of events on disk, split into segments.
+    """
+
+    def __init__(self, directory: str,
+                 segment_size: int = 64 << 20,
+                 retention_bytes: Optional[int] = None,
+                 retention_seconds: Optional[float] = None,
+                 fsync_interval: Optional[float] = 0.1):
+        """
+        directory: where the segments are kept, created if it doesn't exist
+        segment_size: the size (in bytes) from which a new segment is started
+        retention_bytes: the maximum size of the log, None keeps everything
+        retention_seconds: how long events are kept, None keeps them forever
+        fsync_interval: the maximum number of seconds before appended events are durable.
+                        0 syncs on every append, None leaves it to the operating system
+        """
+        self.directory = directory
+        self.segment_size = segment_size
+        self.retention_bytes = retention_bytes
+        self.retention_seconds = retention_seconds
+        self.fsync_interval = fsync_interval
+
+        os.makedirs(directory, exist_ok=True)
+        self._lock = Lock()
+        self._segments: List[_Segment] = []
+        self._bases: List[int] = []
+        bases = sorted(int(name[:-4]) for name in os.listdir(directory)
+                       if name.endswith(".log") and name[:-4].isdigit())
+        for i, base in enumerate(bases):
+            segment = _Segment(directory, base)
+            segment.load(last=i == len(bases) - 1)
+            if i + 1 < len(bases) and not segment.count:
+                segment.count = bases[i + 1] - base
+            self._add(segment)
+        if not self._segments:
+            self._add(_Segment(directory, 0))
+
+        # True when there are appends that were not synced yet
+        self._dirty = False
+        # when the retention was last applied
+        self._retained_at = time.monotonic()
+        self._stopped = Event()
+        self._flusher: Optional[Thread] = None
+        if fsync_interval:
+            self._flusher = Thread(target=self._flush, daemon=True)
+            self._flusher.start()
+
+    @property
+    def start_offset(self) -> int:
+        """
+        the offset of the oldest event in the log.
+        """
+        return self._segments[0].base
+
+    @property
+    def end_offset(self) -> int:
+        """
+        the offset the next event gets.
+        """
+        active = self._segments[-1]
+        return active.base + active.count
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "start_offset": self.start_offset,
+                "end_offset": self.end_offset,
+                "segments": len(self._segments),
+                "bytes": sum(segment.size for segment in self._segments),
+            }
+
+    def append(self, events: List[Tuple[str, bytes]]) -> Tuple[int, List[Tuple[str, bytes]]]:
+        """
+        appends (key, line) events, where every line is a JSON object ending with a newline.
+        returns the offset of the first event, and the events with their offset added to the line.
+        """
+        with self._lock:
+            active = self._segments[-1]
+            if active.size >= self.segment_size:
+                active = self._roll()
+            elif self.retention_seconds is not None and time.monotonic() - self._retained_at >= RETAIN_INTERVAL:
+                # also without a flush thread (fsync_interval 0 or None), old segments expire
+                self._retain()
+
+            first = offset = active.base + active.count
+            # the position of the next index entry, relative to the end of the segment
+            next_index = active.index_due()
+            lines = []
+            index = []
+            size = 0
+            for key, line in events:
+                line = b'{"offset": %d, ' % offset + line[1:]
+                if size >= next_index:
+                    index.append((offset - active.base, size))
+                    next_index = size + INDEX_INTERVAL
+                lines.append((key, line))
+                size += len(line)
+                offset += 1
+
+            active.append(b"".join(line for _, line in lines), len(lines), index)
+            if self.fsync_interval == 0:
+                active.sync()
+            else:
+                self._dirty = True
+        return first, lines
+
+    def read(self, offset: int, max_bytes: int = 1 << 20) -> Tuple[bytes, int]:
+        """
+        returns the lines from offset on, at most max_bytes (but at least one line),
+        and the offset of the event after them. Offsets that were already deleted
+        start at the oldest event. Returns no lines at the end of the log.
+        """
+        with self._lock:
+            offset = max(offset, self.start_offset)
+            if offset >= self.end_offset:
+                return b"", self.end_offset
+
+            segment = self._segments[bisect_right(self._bases, offset) - 1]
+            position = segment.position(offset - segment.base)
+            data = os.pread(segment.fd, min(max_bytes, segment.size - position), position)
+            end = data.rfind(b"\n") + 1
+            if not end:
+                # a line longer than max_bytes, read all of it
+                chunks = [data]
+                position += len(data)
+                while True:
+                    chunk = os.pread(segment.fd, SCAN_SIZE, position)
+                    newline = chunk.find(b"\n")
+                    if newline >= 0:
+                        chunks.append(chunk[:newline + 1])
+                        break
+                    chunks.append(chunk)
+                    position += len(chunk)
+                data = b"".join(chunks)
+                end = len(data)
+            data = data[:end]
+            return data, offset + data.count(b"\n")
+
+    def close(self):
+        self._stopped.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        with self._lock:
+            for segment in self._segments:
+                if self.fsync_interval is not None:
+                    segment.sync()
+                segment.close()
+
+    def _add(self, segment: _Segment):
+        self._segments.append(segment)
+        self._bases.append(segment.base)
+
+    def _roll(self) -> _Segment:
+        """
+        starts a new segment and applies the retention. Called with the lock.
+        """
+        active = self._segments[-1]
+        if self.fsync_interval is not None:
+            active.sync()
+        segment = _Segment(self.directory, active.base + active.count)
+        self._add(segment)
+        self._retain()
+        return segment
+
+    def _retain(self):
+        """
+        deletes the oldest segments beyond the retention, never the active one. Called with the lock.
+        """
+        size = sum(segment.size for segment in self._segments)
+        now = time.time()
+        self._retained_at = time.monotonic()
+        while len(self._segments) > 1:
+            oldest = self._segments[0]
+            too_big = self.retention_bytes is not None and size > self.retention_bytes
+            too_old = self.retention_seconds is not None and now - oldest.modified > self.retention_seconds
+            if not too_big and not too_old:
+                break
+            del self._segments[0]
+            del self._bases[0]
+            size -= oldest.size
+            oldest.delete()
+
+    def _flush(self):
+        """
+        syncs the appended events every fsync_interval seconds, and applies the time retention.
+        """
+        while not self._stopped.wait(self.fsync_interval):
+            with self._lock:
+                dirty, self._dirty = self._dirty, False
+                active = self._segments[-1]
+                if self.retention_seconds is not None:
+                    self._retain()
+            if dirty:
+                try:
+                    # outside the lock, appends continue while the disk catches up
+                    active.sync()
+                except OSError:
+                    # the segment was deleted by the retention in the meantime
+                    pass
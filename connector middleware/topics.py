@@ -0,0 +1,131 @@
+"""
+the subscription index of the connector middleware.
+
+subscribers declare the keys they want with patterns, the segments of a key
+are separated by dots:
+- "sensor.kitchen.temp" matches only that key
+- "*" matches exactly one segment: "sensor.*.temp" matches "sensor.kitchen.temp"
+- "#" matches any number of segments, also none: "stock.#" matches "stock", "stock.aapl"
+  and "stock.aapl.price", and "#" matches every key
+
+the patterns are stored in a trie with one level per segment, so finding the
+subscribers of a key takes time in the length of the key, not in the number of
+subscriptions. The result is cached per key until the subscriptions change.
+
+the matching is the same as in neca/topics.py (used by the rulesets of neca). The middleware
+runs on its own, without neca installed, so it can't import that module: a change to the
+matching has to be made in both, tests/test_topics.py runs the same cases against both.
+"""
+
+from typing import Dict, FrozenSet, Hashable, Iterable, Set
+
+
+class _Node:
+    __slots__ = ("children", "subscribers")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        # the subscribers whose pattern ends at this node
+        self.subscribers: Set[Hashable] = set()
+
+
+class TopicIndex:
+    """
+    finds the subscribers whose patterns match a key.
+    """
+
+    # the number of keys whose subscribers are remembered
+    CACHE_SIZE = 65536
+
+    def __init__(self):
+        self._root = _Node()
+        self._patterns: Dict[Hashable, Set[str]] = {}
+        self._cache: Dict[str, FrozenSet[Hashable]] = {}
+
+    def __len__(self) -> int:
+        return sum(len(patterns) for patterns in self._patterns.values())
+
+    def patterns(self, subscriber: Hashable) -> Set[str]:
+        return set(self._patterns.get(subscriber, ()))
+
+    def subscribe(self, subscriber: Hashable, patterns: Iterable[str]):
+        """
+        adds patterns to the subscriptions of a subscriber.
+        """
+        own = self._patterns.setdefault(subscriber, set())
+        for pattern in patterns:
+            if pattern in own:
+                continue
+            own.add(pattern)
+            node = self._root
+            for segment in pattern.split("."):
+                node = node.children.setdefault(segment, _Node())
+            node.subscribers.add(subscriber)
+        self._cache.clear()
+
+    def unsubscribe(self, subscriber: Hashable, patterns: Iterable[str] = None):
+        """
+        removes patterns from the subscriptions of a subscriber, None removes all of them.
+        """
+        own = self._patterns.get(subscriber)
+        if own is None:
+            return
+        for pattern in list(own if patterns is None else patterns):
+            if pattern not in own:
+                continue
+            own.discard(pattern)
+            self._remove(self._root, pattern.split("."), 0, subscriber)
+        if not own:
+            del self._patterns[subscriber]
+        self._cache.clear()
+
+    def _remove(self, node: _Node, segments, depth: int, subscriber: Hashable) -> bool:
+        # removes the subscriber and the nodes that became empty, returns whether node is empty
+        if depth == len(segments):
+            node.subscribers.discard(subscriber)
+        else:
+            child = node.children.get(segments[depth])
+            if child is not None and self._remove(child, segments, depth + 1, subscriber):
+                del node.children[segments[depth]]
+        return not node.subscribers and not node.children
+
+    def match(self, key: str) -> FrozenSet[Hashable]:
+        """
+        returns the subscribers with a pattern that matches the key.
+        """
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+
+        found: Set[Hashable] = set()
+        self._match(self._root, key.split("."), 0, found)
+        result = frozenset(found)
+
+        if len(self._cache) >= self.CACHE_SIZE:
+            self._cache.clear()
+        self._cache[key] = result
+        return result
+
+    def _match(self, node: _Node, segments, depth: int, found: Set[Hashable], visited=None):
+        if depth == len(segments):
+            found.update(node.subscribers)
+
+        children = node.children
+        if depth < len(segments):
+            child = children.get(segments[depth])
+            if child is not None:
+                self._match(child, segments, depth + 1, found, visited)
+            child = children.get("*")
+            if child is not None and segments[depth] != "*":
+                self._match(child, segments, depth + 1, found, visited)
+
+        # "#" takes zero or more segments
+        child = children.get("#")
+        if child is not None:
+            if visited is None:
+                visited = set()
+            for skip in range(depth, len(segments) + 1):
+                # patterns with several "#" can reach the same place in many ways
+                if (id(child), skip) not in visited:
+                    visited.add((id(child), skip))
+                    self._match(child, segments, skip, found, visited)
@@ -8,8 +8,14 @@ from flask_socketio import SocketIO as Sock
 
 
 import logging
+import multiprocessing
 import neca.settings as settings
-from neca.events import fire_global
+from neca.events import fire_global, Manager
+from neca.executors import Dispatcher
+from neca.aio import AsyncEngine
+from neca.emitter import Emitter
+from neca import replay
+import threading
 
 
 
@@ -36,11 +42,55 @@ def disconnect():
     print("disconnected")
     fire_global('disconnect', request.sid)
 
+@socket.on('replay')
+def replay_control(message):
+    # sent by replay_control in core.js, for replays that called register()
+    if isinstance(message, dict):
+        replay.control(message.get("name", "replay"), message.get("action"), message.get("value"))
 
-def start(debug=True, port=3000):
+
+def start(debug=True, port=3000, workers=0, process_workers=None, engine="thread", emit_interval=None, compact=False):
+    """
+    starts the event loop and the web server.
+    
+    debug: run the web server in debug mode
+    port: the port the web server listens on
+    workers: the number of worker threads handling events. 0 handles every event
+             on the event loop thread. With workers, events for different contexts
+             run concurrently, events within one context still run in order.
+    process_workers: the number of worker processes for handlers registered with
+                     executor="process". If None, the number of CPUs is used.
+                     The worker processes import the main module again, so call start()
+                     behind `if __name__ == "__main__":` when there are process handlers.
+    engine: "thread" runs the events on the threaded event loop, "asyncio" runs them
+            on an asyncio event loop so `async def` handlers run as tasks (see neca.aio).
+    emit_interval: if set, emitted messages are collected for this many seconds and
+                   merged before they are sent to the browser (see neca.emitter).
+                   None sends every emit right away.
+    compact: send long numeric lists in emitted payloads as binary typed arrays
+             instead of JSON (see neca.encoding). Can be overridden per emit.
+    """
+    if multiprocessing.parent_process() is not None:
+        # a worker process that imported a main module without the guard
+        raise RuntimeError("neca.start() was called in a worker process. "
+                           "Call it behind `if __name__ == \"__main__\":` in the main module.")
+    if engine not in ("thread", "asyncio"):
+        raise ValueError(f"unknown engine: {engine}. Use 'thread' or 'asyncio'.")
+    
+    if workers or process_workers:
+        Manager.dispatcher = Dispatcher(workers, process_workers)
+    
+    if emit_interval:
+        settings.emitter = Emitter(socket, emit_interval)
+    settings.compact = compact
+    
     # start the event loop on a separate thread
     #settings.init()
-    eventThread.start()
+    if engine == "asyncio":
+        settings.eventThread = threading.Thread(target=AsyncEngine.eventLoop, daemon=True)
+        settings.eventThread.start()
+    else:
+        eventThread.start()
     
     
     #app.run(debug=debug, use_reloader=False)
@@ -0,0 +1,160 @@
+"""
+This module contains the asyncio event engine, an alternative to Manager.eventLoop.
+
+start it with neca.start(engine="asyncio"). The engine runs an asyncio event loop
+on the event thread. Pending events are kept in the same scheduler as the threaded
+engine, the loop only keeps a single timer (loop.call_at) for the earliest one.
+
+handlers can be written as `async def`, they are run as tasks on the loop so
+many I/O-bound handlers (HTTP lookups, DB writes) can wait at the same time
+without a thread per handler. Synchronous handlers keep working as before.
+
+Example Usage:
+```python
+import neca
+from neca.events import event
+from neca.aio import emit_async
+
+@event("tweet")
+async def tweet(context, data):
+    user = await lookup_user(data["user"])
+    await emit_async("tweet", {"user": user})
+
+neca.start(engine="asyncio")
+```
+"""
+
+import asyncio
+from threading import get_ident
+from typing import Any, Coroutine, Optional
+from neca.log import logger
+import neca.events as events
+
+
+class AsyncEngine:
+    """
+    runs the events on an asyncio event loop.
+
+    mostly used for internal bookkeeping. If you're a user,
+    you probably won't need to use this class directly, use neca.start(engine="asyncio") instead.
+    """
+
+    # the running loop, None if the engine is not running
+    loop: Optional[asyncio.AbstractEventLoop] = None
+    _thread: Optional[int] = None
+
+    # the timer for the earliest pending event
+    _timer: Optional[asyncio.TimerHandle] = None
+
+    # True while a wakeup is scheduled on the loop, so that producers
+    # don't schedule a wakeup for every single event
+    _wakeup_pending = False
+
+    @staticmethod
+    def eventLoop():
+        """
+        runs the asyncio engine on the current thread, calls the 'init' event when the engine starts.
+        """
+        asyncio.run(AsyncEngine._main())
+
+    @staticmethod
+    async def _main():
+        AsyncEngine.loop = asyncio.get_running_loop()
+        AsyncEngine._thread = get_ident()
+        events.Manager._notify = AsyncEngine._notify
+
+        # wait 100 ms before calling init
+        # so that the web server has time to start
+        await asyncio.sleep(0.1)
+        logger.debug("calling init event")
+        events.fire_global("init", None)
+
+        # events fired before the engine started are already waiting
+        AsyncEngine._wakeup()
+
+        # run until the process exits
+        await asyncio.Event().wait()
+
+    @staticmethod
+    def _notify():
+        """
+        called by Manager.add_event after a new event is put on the ingress queue.
+        may be called from any thread.
+        """
+        if AsyncEngine._wakeup_pending:
+            return
+        AsyncEngine._wakeup_pending = True
+        AsyncEngine.loop.call_soon_threadsafe(AsyncEngine._wakeup)
+
+    @staticmethod
+    def _wakeup():
+        """
+        moves new events into the scheduler and fires the ready ones.
+        """
+        # clear the flag before draining, events added after this point
+        # schedule a new wakeup
+        AsyncEngine._wakeup_pending = False
+        manager = events.Manager
+        with manager._lock:
+            manager._drain_ingress()
+            ready = manager.scheduler.pop_ready()
+            due = manager.scheduler.peek()
+
+        dispatcher = manager.dispatcher
+        for pending_event in ready:
+            try:
+                dispatcher.dispatch(pending_event)
+            except Exception:
+                logger.exception(f"error while handling event {pending_event.key} in {pending_event.context}")
+
+        # set the timer for the earliest pending event
+        # the loop uses the monotonic clock, just like the scheduler
+        timer = AsyncEngine._timer
+        if due is None:
+            if timer is not None:
+                timer.cancel()
+                AsyncEngine._timer = None
+        elif timer is None or timer.when() != due:
+            if timer is not None:
+                timer.cancel()
+            AsyncEngine._timer = AsyncEngine.loop.call_at(due, AsyncEngine._on_timer)
+
+    @staticmethod
+    def _on_timer():
+        AsyncEngine._timer = None
+        AsyncEngine._wakeup()
+
+
+def run_coroutine(coro: Coroutine) -> Any:
+    """
+    runs the coroutine returned by an `async def` handler.
+
+    on the asyncio engine the coroutine becomes a task on the loop and this returns immediately.
+    on the threaded engine there is no loop to hand it to, so it is run to completion.
+    """
+    loop = AsyncEngine.loop
+    if loop is None:
+        return asyncio.run(coro)
+
+    if get_ident() == AsyncEngine._thread:
+        task = loop.create_task(coro)
+        task.add_done_callback(_log_task_error)
+        return task
+
+    # called from a worker thread, hand it to the loop
+    future = asyncio.run_coroutine_threadsafe(coro, loop)
+    future.add_done_callback(_log_task_error)
+    return future
+
+
+def _log_task_error(task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"error in async event handler: {task.exception()!r}")
+
+
+async def emit_async(event, data, id=None, sid: str | None = None):
+    """
+    same as events.emit, but awaits the send instead of blocking the loop.
+    """
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, events.emit, event, data, id, sid)
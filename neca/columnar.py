@@ -0,0 +1,308 @@
+"""
+This module contains the readers for CSV and columnar (Parquet, Arrow) data files.
+
+The readers return the records in batches of columns instead of one dict per record,
+and convert the timestamps of a whole batch at once. This is a lot faster for files
+with millions of small records, like market ticks.
+
+- NumPy is used for numeric columns and timestamps when it is installed
+- Parquet and Arrow (IPC / Feather) files need pyarrow: pip install neca[columnar]
+
+generate_columnar in neca.generators replays these files, as one event per
+record or one event per batch.
+
+Example usage:
+```python
+from neca.columnar import read_batches
+
+for batch in read_batches('ticks.parquet', ('time', 'epoch_ms'), batch_size=100000):
+    batch.timestamps    # seconds since the epoch, one per record
+    batch.columns       # {'time': [...], 'price': [...], ...}
+    for record in batch.rows():
+        ...
+```
+"""
+
+import csv
+import io
+import os
+from typing import Any, Callable, Dict, Generator, Iterable, List, Optional, Sequence, Tuple
+from neca.log import logger
+from neca.timestamps import EPOCH_FORMATS, compile_parser
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+
+
+# the number of records in a batch
+BATCH_SIZE = 65536
+
+# the formats, by extension
+FORMATS = {
+    ".csv": "csv",
+    ".tsv": "csv",
+    ".parquet": "parquet",
+    ".pq": "parquet",
+    ".arrow": "arrow",
+    ".feather": "arrow",
+    ".ipc": "arrow",
+}
+
+# the number of units of an Arrow timestamp in a second
+_ARROW_UNITS = {"s": 1, "ms": 1000, "us": 1000000, "ns": 1000000000}
+
+
+class ColumnBatch:
+    """
+    a batch of records stored as columns, with the timestamp of every record.
+    """
+
+    def __init__(self, columns: Dict[str, Sequence[Any]], timestamps: Sequence[float]):
+        """
+        columns: the values of every field, all columns have the same length
+        timestamps: the timestamp of every record, in seconds since the epoch
+        """
+        self.columns = columns
+        self.timestamps = timestamps
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """
+        returns the records as dicts.
+        """
+        names = list(self.columns)
+        values = [as_list(column) for column in self.columns.values()]
+        return [dict(zip(names, row)) for row in zip(*values)]
+
+    def slice(self, start: int, end: Optional[int] = None) -> "ColumnBatch":
+        """
+        returns the records from start to end as a new batch.
+        """
+        return ColumnBatch({name: column[start:end] for name, column in self.columns.items()},
+                           self.timestamps[start:end])
+
+
+def as_list(values: Sequence[Any]) -> List[Any]:
+    """
+    returns a column as a list of python values, numpy arrays are converted at once.
+    """
+    tolist = getattr(values, "tolist", None)
+    return tolist() if tolist is not None else list(values)
+
+
+def file_format(data_file: str) -> str:
+    """
+    returns the format of a data file based on its extension, a compression extension is ignored.
+    """
+    name = data_file.lower()
+    for suffix in (".gz", ".bz2", ".xz", ".lzma", ".zst"):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    extension = os.path.splitext(name)[1]
+    if extension not in FORMATS:
+        raise ValueError(f"unknown format of {data_file}, use one of {', '.join(FORMATS)}")
+    return FORMATS[extension]
+
+
+def convert_timestamps(values: Sequence[Any], timestamp_format: Optional[str]) -> Sequence[float]:
+    """
+    converts a column of timestamps to seconds since the epoch.
+    epoch numbers are converted at once, strings are parsed once per distinct value.
+    returns a numpy array when numpy is installed, a list otherwise.
+    """
+    if timestamp_format is None:
+        timestamp_format = "epoch"
+
+    if timestamp_format in EPOCH_FORMATS:
+        scale = EPOCH_FORMATS[timestamp_format]
+        if np is not None:
+            return np.asarray(values, dtype=np.float64) / scale
+        return [float(value) / scale for value in values]
+
+    # records often share timestamps, parse every distinct one once
+    parse = compile_parser(timestamp_format)
+    if np is not None:
+        distinct, inverse = np.unique(np.asarray(values, dtype=object), return_inverse=True)
+        parsed = np.fromiter((parse(value) for value in distinct), dtype=np.float64, count=len(distinct))
+        return parsed[inverse]
+    return [parse(value) for value in values]
+
+
+def csv_batches(data_file: str,
+                timestamp_signature: Tuple[str, Optional[str]],
+                batch_size: int = BATCH_SIZE,
+                fields: Optional[Iterable[str]] = None,
+                types: Optional[Dict[str, Callable[[str], Any]]] = None,
+                delimiter: Optional[str] = None) -> Generator[ColumnBatch, None, None]:
+    """
+    reads a CSV file with a header line in batches, the file may be compressed (see neca.generators.line_reader).
+
+    timestamp_signature: (field, format) of the timestamp column, see neca.timestamps
+    batch_size: the number of records in a batch
+    fields: only keep these columns, None keeps every column
+    types: converts the values of a column, like {'price': float}. Without a type the values are strings.
+           with numpy installed, float and int columns are converted at once into numpy arrays.
+    delimiter: the delimiter of the values, None is a tab for .tsv files and a comma otherwise
+    rows with another number of values than the header are skipped, with a warning
+    """
+    # import here, neca.generators uses this module
+    from neca.generators import open_data_file
+
+    timestamp_field, timestamp_format = timestamp_signature
+    types = types or {}
+    if delimiter is None:
+        delimiter = "\t" if ".tsv" in data_file.lower() else ","
+
+    with io.TextIOWrapper(open_data_file(data_file), encoding="utf-8", newline="") as f:
+        reader = csv.reader(f, delimiter=delimiter)
+        header = next(reader, None)
+        if header is None:
+            return
+        if timestamp_field not in header:
+            raise KeyError(f"{data_file} has no column {timestamp_field}")
+
+        names = header if fields is None else [name for name in header if name in set(fields)]
+        indices = [header.index(name) for name in names]
+        timestamp_index = header.index(timestamp_field)
+
+        width = len(header)
+        while True:
+            rows = [row for _, row in zip(range(batch_size), reader) if row]
+            if not rows:
+                return
+            # a short or long row would shift the columns of the whole batch
+            if any(len(row) != width for row in rows):
+                count = len(rows)
+                rows = [row for row in rows if len(row) == width]
+                logger.warning(f"skipped {count - len(rows)} rows of {data_file} "
+                               f"with another number of values than the header ({width})")
+                if not rows:
+                    continue
+            # turn the rows into columns
+            values = list(zip(*rows))
+            columns = {name: _convert(values[index], types.get(name)) for name, index in zip(names, indices)}
+            timestamps = convert_timestamps(values[timestamp_index], timestamp_format)
+            yield ColumnBatch(columns, timestamps)
+
+
+def _convert(values: Sequence[str], convert: Optional[Callable[[str], Any]]) -> Sequence[Any]:
+    if convert is None:
+        return list(values)
+    if np is not None and convert in (float, int):
+        return np.asarray(values, dtype=np.float64 if convert is float else np.int64)
+    return list(map(convert, values))
+
+
+def _require_pyarrow(data_file: str):
+    if pa is None:
+        raise ImportError(f"reading {data_file} needs pyarrow: pip install neca[columnar]")
+
+
+def _arrow_timestamps(column: Any, timestamp_format: Optional[str]) -> Sequence[float]:
+    """
+    converts an Arrow column of timestamps to seconds since the epoch, without python objects where possible.
+    """
+    if pa.types.is_timestamp(column.type):
+        # stored as a number of units since the epoch (UTC)
+        seconds = pc.divide(pc.cast(pc.cast(column, pa.int64()), pa.float64()), float(_ARROW_UNITS[column.type.unit]))
+        return seconds.to_numpy(zero_copy_only=False) if np is not None else seconds.to_pylist()
+
+    if pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+        # parse every distinct string once
+        encoded = column.dictionary_encode()
+        parsed = convert_timestamps(encoded.dictionary.to_pylist(), timestamp_format)
+        indices = encoded.indices.to_numpy(zero_copy_only=False) if np is not None else encoded.indices.to_pylist()
+        if np is not None:
+            return np.asarray(parsed)[indices]
+        return [parsed[index] for index in indices]
+
+    values = column.to_numpy(zero_copy_only=False) if np is not None else column.to_pylist()
+    return convert_timestamps(values, timestamp_format)
+
+
+def _arrow_batch(batch: Any, timestamp_signature: Tuple[str, Optional[str]],
+                 fields: Optional[Iterable[str]]) -> ColumnBatch:
+    timestamp_field, timestamp_format = timestamp_signature
+    names = batch.schema.names if fields is None else [name for name in batch.schema.names if name in set(fields)]
+
+    columns = {}
+    for name in names:
+        column = batch.column(batch.schema.get_field_index(name))
+        # numbers become numpy arrays, other values python objects
+        if np is not None and (pa.types.is_integer(column.type) or pa.types.is_floating(column.type)) \
+                and column.null_count == 0:
+            columns[name] = column.to_numpy()
+        else:
+            columns[name] = column.to_pylist()
+
+    timestamp_column = batch.column(batch.schema.get_field_index(timestamp_field))
+    return ColumnBatch(columns, _arrow_timestamps(timestamp_column, timestamp_format))
+
+
+def parquet_batches(data_file: str,
+                    timestamp_signature: Tuple[str, Optional[str]],
+                    batch_size: int = BATCH_SIZE,
+                    fields: Optional[Iterable[str]] = None) -> Generator[ColumnBatch, None, None]:
+    """
+    reads a Parquet file in batches, only the requested columns are read from disk.
+    arguments like csv_batches.
+    """
+    _require_pyarrow(data_file)
+    import pyarrow.parquet as pq
+
+    columns = None
+    if fields is not None:
+        # the timestamp is always needed
+        columns = list(dict.fromkeys(list(fields) + [timestamp_signature[0]]))
+
+    parquet = pq.ParquetFile(data_file)
+    for batch in parquet.iter_batches(batch_size=batch_size, columns=columns):
+        yield _arrow_batch(batch, timestamp_signature, fields)
+
+
+def arrow_batches(data_file: str,
+                  timestamp_signature: Tuple[str, Optional[str]],
+                  batch_size: int = BATCH_SIZE,
+                  fields: Optional[Iterable[str]] = None) -> Generator[ColumnBatch, None, None]:
+    """
+    reads an Arrow IPC file (also Feather v2) or stream in batches, the file is memory-mapped.
+    the batches of the file are split to at most batch_size records. arguments like csv_batches.
+    """
+    _require_pyarrow(data_file)
+    import pyarrow.ipc as ipc
+
+    with pa.memory_map(data_file, "r") as source:
+        try:
+            reader = ipc.open_file(source)
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        except pa.ArrowInvalid:
+            # not the file format, try the stream format
+            source.seek(0)
+            batches = iter(ipc.open_stream(source))
+
+        for batch in batches:
+            for start in range(0, batch.num_rows, batch_size):
+                yield _arrow_batch(batch.slice(start, batch_size), timestamp_signature, fields)
+
+
+def read_batches(data_file: str,
+                 timestamp_signature: Tuple[str, Optional[str]],
+                 batch_size: int = BATCH_SIZE,
+                 fields: Optional[Iterable[str]] = None,
+                 **options: Any) -> Generator[ColumnBatch, None, None]:
+    """
+    reads a CSV, Parquet or Arrow file in batches, the format is chosen by the extension.
+    options are passed to the reader, like types and delimiter for CSV files.
+    """
+    readers = {"csv": csv_batches, "parquet": parquet_batches, "arrow": arrow_batches}
+    yield from readers[file_format(data_file)](data_file, timestamp_signature, batch_size, fields, **options)
@@ -1,53 +1,874 @@
+import asyncio
+import os
 import socket
-from threading import Thread
-from time import sleep
-from typing import Callable, List, Tuple, Any
+import random
+from functools import partial
+from threading import Event, Lock, Thread
+from time import monotonic, time
+from typing import Callable, Dict, Iterable, List, Tuple, Any, Generator, Optional, Union
 import json
+from neca.events import Context, Manager
+from neca.log import logger
 
-def connect_datastream(host: str, port: int, fire: Callable):
+# use orjson to parse lines when it is installed, like neca.generators
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+# the number of bytes received at once
+READ_SIZE = 1 << 16
+
+# lines longer than this are dropped, so a misbehaving stream can't fill up the memory
+MAX_LINE_LENGTH = 1 << 24
+
+
+class LineBuffer:
+    """
+    receives bytes from a socket into one buffer and splits them into lines.
+
+    data is received straight into the buffer with recv_into, and every byte is only
+    scanned for a newline once, so long lines or lines arriving in small pieces
+    don't make the reading slower.
+
+    mostly used for internal bookkeeping by the connectors. If you're a user,
+    you probably won't need to use this class directly.
+    """
+
+    def __init__(self, read_size: int = READ_SIZE, max_line_length: int = MAX_LINE_LENGTH):
+        """
+        read_size: the maximum number of bytes received at once
+        max_line_length: lines longer than this (in bytes) are dropped
+        """
+        if read_size <= 0:
+            raise ValueError("the read size should be greater than 0")
+        self.read_size = read_size
+        self.max_line_length = max_line_length
+
+        self._buffer = bytearray(2 * read_size)
+        # the received bytes that were not returned yet are in _buffer[_start:_end],
+        # the bytes before _scanned contain no newline
+        self._start = 0
+        self._end = 0
+        self._scanned = 0
+        # set while the rest of a line that was too long is skipped
+        self._discarding = False
+
+        # the number of dropped lines
+        self.dropped = 0
+
+    def recv(self, sock: socket.socket) -> int:
+        """
+        receives bytes from the socket, returns 0 when the connection was closed.
+        """
+        if len(self._buffer) - self._end < self.read_size:
+            self._make_room()
+        with memoryview(self._buffer) as view:
+            received = sock.recv_into(view[self._end:self._end + self.read_size])
+        self._end += received
+        return received
+
+    def feed(self, data: bytes):
+        """
+        adds bytes to the buffer, for data that was not received from a socket.
+        """
+        if len(self._buffer) - self._end < len(data):
+            self._make_room(len(data))
+        self._buffer[self._end:self._end + len(data)] = data
+        self._end += len(data)
+
+    def _make_room(self, size: Optional[int] = None):
+        size = self.read_size if size is None else size
+        pending = self._end - self._start
+        if self._start:
+            # move the start of the unfinished line to the front of the buffer
+            self._buffer[:pending] = self._buffer[self._start:self._end]
+            self._scanned -= self._start
+            self._start = 0
+            self._end = pending
+        if len(self._buffer) - self._end < size:
+            # a long line, grow the buffer
+            self._buffer.extend(bytes(max(size, len(self._buffer))))
+
+    def lines(self) -> Generator[bytearray, None, None]:
+        """
+        yields the complete lines in the buffer, without the newline.
+        """
+        buffer = self._buffer
+        while True:
+            newline = buffer.find(b'\n', self._scanned, self._end)
+            if newline == -1:
+                break
+
+            if self._discarding:
+                # the end of a line that was too long
+                self._discarding = False
+            else:
+                if newline - self._start > self.max_line_length:
+                    self._drop()
+                else:
+                    # a copy, the buffer is reused for the next bytes
+                    yield buffer[self._start:newline]
+            self._start = self._scanned = newline + 1
+
+        self._scanned = self._end
+        if self._end - self._start > self.max_line_length:
+            # the line is too long already, skip it until the newline
+            if not self._discarding:
+                self._drop()
+                self._discarding = True
+            self._start = self._scanned = self._end = 0
+        elif self._start == self._end:
+            # nothing left, start at the front again
+            self._start = self._scanned = self._end = 0
+            if len(self._buffer) > 4 * self.read_size:
+                # give back the memory of a long line or a large feed
+                self._buffer = bytearray(2 * self.read_size)
+
+    def _drop(self):
+        self.dropped += 1
+        logger.warning(f"dropped a line longer than {self.max_line_length} bytes")
+
+
+def connect_datastream(host: str, port: int, fire: Callable,
+                       read_size: int = READ_SIZE, max_line_length: int = MAX_LINE_LENGTH,
+                       reconnect: bool = False,
+                       subscribe: Optional[Iterable[str]] = None,
+                       resume: Union[None, int, str] = None) -> "Connector":
     """
     connects to a datastream at host:port, then fires the appropriate
     events when data is received
     host: the hostname to connect to (example.com)
     port: the port to connect to (25565)
     fire: the function to invoke when data is received
+    read_size: the maximum number of bytes received at once
+    max_line_length: lines longer than this (in bytes) are dropped
+    reconnect: connect again when the connection fails or is closed, see Connector
+    subscribe: the key patterns to receive from the connector middleware, see Connector
+    resume: catch up on the events missed while disconnected, see Connector
+    returns the Connector reading the stream
+    """
+    return Connector([(host, port)], fire, read_size=read_size, max_line_length=max_line_length,
+                     reconnect=reconnect, subscribe=subscribe, resume=resume).start()
+
+
+def _subscribe_line(patterns: Optional[Iterable[str]]) -> Optional[bytes]:
+    """
+    returns the request for the connector middleware to only send the keys matching the patterns.
+    """
+    if patterns is None:
+        return None
+    return json.dumps({"subscribe": list(patterns)}).encode() + b"\n"
+
+
+class Position:
+    """
+    the offset of the next event a connector wants from the event log of the connector
+    middleware, optionally kept in a file so it survives a restart of the dashboard.
+    """
+
+    # the minimum number of seconds between writes of the file
+    SAVE_INTERVAL = 1.0
+
+    # the number of seconds to wait for the answer to a resume request. A middleware that
+    # doesn't answer (an older version) is taken to send new events only, after that
+    RESUME_TIMEOUT = 5.0
+
+    def __init__(self, offset: Optional[int] = None, path: Optional[str] = None):
+        """
+        offset: the offset to start from, None starts with new events (or from the file)
+        path: the file the offset is kept in
+        """
+        self.path = path
+        self.offset = offset
+        if offset is None and path is not None and os.path.exists(path):
+            with open(path) as f:
+                self.offset = int(f.read().strip() or 0)
+        self._saved = self.offset
+        self._saved_at = 0.0
+        # True after asking to resume, until the middleware answered where it resumes from
+        self.waiting = False
+        self._asked_at = 0.0
+
+    def request(self) -> Optional[bytes]:
+        """
+        returns the request to resume from the offset, None when there is nothing to resume from.
+        """
+        if self.offset is None:
+            return None
+        self.waiting = True
+        self._asked_at = monotonic()
+        return json.dumps({"resume": self.offset}).encode() + b"\n"
+
+    def resumed(self, offset: Optional[int]):
+        """
+        the middleware resumes from offset, which is lower than asked when its log was reset.
+        only the events after it are compared with what was received, never the ones before a reset.
+        """
+        self.waiting = False
+        if offset is not None:
+            self.offset = offset
+
+    def seen(self, offset: int) -> bool:
+        """
+        returns False if the event with the offset was already received on this connection,
+        or was sent before the middleware answered the resume request (it is sent again).
+        when there is no answer within RESUME_TIMEOUT seconds, the events are received again.
+        """
+        if self.waiting:
+            if monotonic() - self._asked_at < self.RESUME_TIMEOUT:
+                return False
+            logger.warning(f"the connector middleware did not answer the request to resume from offset "
+                           f"{self.offset} within {self.RESUME_TIMEOUT} s, receiving new events instead")
+            self.waiting = False
+        if self.offset is not None and offset < self.offset:
+            return False
+        self.offset = offset + 1
+        return True
+
+    def save(self, force: bool = False):
+        """
+        writes the offset to the file, at most every SAVE_INTERVAL seconds unless forced.
+        """
+        if self.path is None or self.offset == self._saved:
+            return
+        now = monotonic()
+        if not force and now - self._saved_at < self.SAVE_INTERVAL:
+            return
+        # replace the file at once, so a crash never leaves half an offset
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as f:
+            f.write(str(self.offset))
+        os.replace(temporary, self.path)
+        self._saved = self.offset
+        self._saved_at = now
+
+
+def _fire_line(line: bytearray, fire: Callable, position: Optional[Position] = None) -> bool:
+    """
+    decodes a line of the stream, {"key": ..., "data": ...}, and fires it.
+    with a position, lines with an offset that was already received are skipped.
+    returns False if the line is not JSON.
     """
-    Thread(target=_connect, args=(host, port, fire)).start()
-    
-def _connect(host: str, port: int, fire: Callable):
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    try:
-        sock.connect((host, port))
-    except Exception as e:
-        print(str(e))
-        return
-    data = b''
     try:
-        while True:
-            # wait for data, append to buffer
-            data += sock.recv(1024)
-            # if there is a newline in the buffer, split the buffer
-            if b'\n' in data:
-                data = data.split(b'\n')
-
-                # fire the event for each line
-                for i in range(len(data) - 1):
-                    # decode the data and decode the json
-                    decoded = data[i].decode('utf-8')
-                    unjsoned = json.loads(decoded)
-
-                    # if the json does not have a key or data, skip it
-                    if 'key' not in unjsoned or 'data' not in unjsoned:
-                        continue
-
-                    # get the key and data from the json
-                    key = unjsoned['key']
-                    d = unjsoned['data']
-
-                    # fire the event
-                    fire(key, d)
-
-                # reset the buffer to the last line
-                data = data[-1]
-    except Exception as e:
-        print('connection closed unexpectedly')
\ No newline at end of file
+        message = _loads(line)
+    except ValueError:
+        logger.warning(f"skipped a line that is not JSON: {line[:100]!r}")
+        return False
+
+    if position is not None and isinstance(message, dict) and 'resumed' in message:
+        # the answer to the resume request
+        resumed = message['resumed']
+        position.resumed(resumed if isinstance(resumed, int) else None)
+        return True
+
+    # if the json does not have a key or data, skip it
+    if not isinstance(message, dict) or 'key' not in message or 'data' not in message:
+        return True
+
+    if position is not None:
+        offset = message.get('offset')
+        if isinstance(offset, int) and not position.seen(offset):
+            return True
+
+    fire(message['key'], message['data'])
+    return True
+
+
+def _fire_lifecycle(context: Context, key: str, data: Dict[str, Any]):
+    """
+    fires connector_up or connector_down, only when the context has rules for it,
+    so apps that don't handle them don't get a warning on every (re)connect.
+    """
+    if context.ruleset.rules(key):
+        context.fire(key, data)
+
+
+class ConnectionStats:
+    """
+    the statistics of the connections to one endpoint.
+    """
+
+    # the number of seconds over which the message rate is measured
+    RATE_INTERVAL = 1.0
+
+    def __init__(self):
+        self.connects = 0           # successful connections
+        self.failures = 0           # failed connection attempts and connections that broke
+        self.messages = 0           # received lines
+        self.bytes = 0              # received bytes
+        self.parse_errors = 0       # lines that were not JSON
+        self.handler_errors = 0     # lines where fire raised an exception
+        self.dropped = 0            # lines that were too long
+        self.last_message: Optional[float] = None   # time.time() of the last line
+        self.connected_since: Optional[float] = None
+        self.rate = 0.0             # lines per second, over the last interval
+
+        self._window = (monotonic(), 0)
+
+    def _update_rate(self, now: float):
+        begin, messages = self._window
+        if now - begin >= self.RATE_INTERVAL:
+            self.rate = (self.messages - messages) / (now - begin)
+            self._window = (now, self.messages)
+
+    def as_dict(self) -> Dict[str, Any]:
+        self._update_rate(monotonic())
+        stats = dict(vars(self))
+        del stats["_window"]
+        return stats
+
+
+class Connector:
+    """
+    reads {"key": ..., "data": ...} lines from a TCP stream and fires them as events,
+    connecting again with exponential backoff when the connection fails or is closed.
+
+    with multiple endpoints, the next endpoint is tried when one fails. The events
+    connector_up and connector_down are fired in the context when a connection is made
+    or lost, with {"name", "host", "port"} (and "error" for connector_down) as data.
+
+    the connector middleware sends every event, unless the connector subscribes to
+    key patterns: "sensor.*.temp" (* is one dot separated segment) or "stock.#"
+    (# is any number of segments). The subscription is sent again on every reconnect.
+
+    when the connector middleware keeps an event log, a connector with resume catches up on
+    the events it missed while it was disconnected. resume is the offset of the first event
+    to get, or the path of a file where the connector keeps its offset, so it also catches
+    up after the dashboard restarted.
+
+    Example usage:
+    ```python
+    connector = Connector([("primary.example.com", 25565), ("backup.example.com", 25565)], name="sensors",
+                          subscribe=["sensor.*.temp"], resume="sensors.offset")
+    connector.start()
+
+    @event("connector_down")
+    def down(context, data):
+        emit("status", {"action": "set", "value": f"{data['name']} is down"})
+    ```
+    """
+
+    def __init__(self, endpoints: Iterable[Union[Tuple[str, int], str]],
+                 fire: Optional[Callable[[str, Any], None]] = None,
+                 context: Optional[Context] = None,
+                 name: Optional[str] = None,
+                 read_size: int = READ_SIZE,
+                 max_line_length: int = MAX_LINE_LENGTH,
+                 reconnect: bool = True,
+                 backoff: float = 0.5,
+                 max_backoff: float = 30.0,
+                 connect_timeout: float = 5.0,
+                 subscribe: Optional[Iterable[str]] = None,
+                 resume: Union[None, int, str] = None):
+        """
+        endpoints: the (host, port) pairs or "host:port" strings to connect to, in order of preference
+        fire: the function to invoke with (key, data) for every line. None fires in the context.
+        context: the context the connector_up and connector_down events are fired in. None is the
+                 context of fire if it is context.fire, otherwise the global context.
+        name: the name of the connector in the events, the first endpoint if None
+        read_size: the maximum number of bytes received at once
+        max_line_length: lines longer than this (in bytes) are dropped
+        reconnect: connect again when the connection fails or is closed
+        backoff: the number of seconds to wait after every endpoint failed, doubled on every
+                 round of failures up to max_backoff
+        connect_timeout: the number of seconds to wait for a connection
+        subscribe: the key patterns to receive from the connector middleware, None receives everything
+        resume: the offset of the first event to get from the event log of the connector middleware,
+                or the file the offset is kept in. None only receives new events
+        """
+        self.endpoints = [_endpoint(endpoint) for endpoint in endpoints]
+        if not self.endpoints:
+            raise ValueError("a connector needs at least one endpoint")
+
+        if context is None:
+            owner = getattr(fire, "__self__", None)
+            context = owner if isinstance(owner, Context) else Manager.global_context
+        self.context = context
+        self.fire = context.fire if fire is None else fire
+        self.name = name if name is not None else "{}:{}".format(*self.endpoints[0])
+
+        self.read_size = read_size
+        self.max_line_length = max_line_length
+        self.reconnect = reconnect
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.connect_timeout = connect_timeout
+        self.subscribe = None if subscribe is None else list(subscribe)
+        if resume is None:
+            self.position = None
+        elif isinstance(resume, int):
+            self.position = Position(offset=resume)
+        else:
+            self.position = Position(path=resume)
+
+        self.stats: Dict[Tuple[str, int], ConnectionStats] = {endpoint: ConnectionStats() for endpoint in self.endpoints}
+        # the endpoint that is connected, None when not connected
+        self.endpoint: Optional[Tuple[str, int]] = None
+
+        self._stopped = Event()
+        self._socket: Optional[socket.socket] = None
+        self._thread = Thread(target=self._run, daemon=True)
+
+    @property
+    def connected(self) -> bool:
+        return self.endpoint is not None
+
+    def start(self) -> "Connector":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        closes the connection and stops connecting.
+        """
+        self._stopped.set()
+        sock = self._socket
+        if sock is not None:
+            try:
+                # wakes up the thread waiting in recv
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def join(self, timeout: Optional[float] = None):
+        self._thread.join(timeout)
+
+    def health(self) -> Dict[str, Any]:
+        """
+        returns the state of the connector and the statistics of every endpoint.
+        """
+        return {
+            "name": self.name,
+            "connected": self.connected,
+            "endpoint": "{}:{}".format(*self.endpoint) if self.endpoint else None,
+            "offset": self.position.offset if self.position is not None else None,
+            "endpoints": {f"{host}:{port}": stats.as_dict() for (host, port), stats in self.stats.items()},
+        }
+
+    def _run(self):
+        delay = self.backoff
+        while not self._stopped.is_set():
+            # try every endpoint once, in order
+            for endpoint in self.endpoints:
+                if self._stopped.is_set():
+                    return
+                received = self._read(endpoint)
+                if received:
+                    # the connection worked, start over with the first endpoint and a short backoff
+                    delay = self.backoff
+                    break
+
+            if not self.reconnect:
+                return
+            # wait before the next round, with jitter so clients don't reconnect all at once
+            self._stopped.wait(delay * random.uniform(0.5, 1.0))
+            delay = min(delay * 2, self.max_backoff)
+
+    def _read(self, endpoint: Tuple[str, int]) -> bool:
+        """
+        connects to the endpoint and reads it until the connection is closed.
+        returns whether anything was received.
+        """
+        host, port = endpoint
+        stats = self.stats[endpoint]
+        try:
+            sock = socket.create_connection(endpoint, timeout=self.connect_timeout)
+            request = _subscribe_line(self.subscribe)
+            if request is not None:
+                sock.sendall(request)
+            request = self.position.request() if self.position is not None else None
+            if request is not None:
+                sock.sendall(request)
+        except OSError as e:
+            stats.failures += 1
+            logger.warning(f"connector {self.name} could not connect to {host}:{port}: {e}")
+            return False
+
+        sock.settimeout(None)
+        self._socket = sock
+        self.endpoint = endpoint
+        stats.connects += 1
+        stats.connected_since = time()
+        logger.info(f"connector {self.name} connected to {host}:{port}")
+        _fire_lifecycle(self.context, "connector_up", {"name": self.name, "host": host, "port": port})
+
+        buffer = LineBuffer(self.read_size, self.max_line_length)
+        fire = self.fire
+        position = self.position
+        received = False
+        error = None
+        try:
+            with sock:
+                while not self._stopped.is_set():
+                    size = buffer.recv(sock)
+                    if not size:
+                        break
+                    received = True
+                    stats.bytes += size
+                    for line in buffer.lines():
+                        if line.strip():
+                            stats.messages += 1
+                            try:
+                                if not _fire_line(line, fire, position):
+                                    stats.parse_errors += 1
+                            except Exception:
+                                # an error in fire is not a problem of the connection, keep reading
+                                stats.handler_errors += 1
+                                logger.exception(f"connector {self.name}: error while firing a line: {bytes(line[:100])!r}")
+                    stats.last_message = time()
+                    stats.dropped = buffer.dropped
+                    stats._update_rate(monotonic())
+                    if position is not None:
+                        position.save()
+        except Exception as e:
+            # a broken connection
+            if not self._stopped.is_set():
+                error = str(e) or type(e).__name__
+                stats.failures += 1
+        finally:
+            self._socket = None
+            self.endpoint = None
+            stats.connected_since = None
+            if position is not None:
+                position.save(force=True)
+
+        if error is None:
+            logger.info(f"connector {self.name}: connection to {host}:{port} closed")
+        else:
+            logger.warning(f"connector {self.name}: connection to {host}:{port} failed: {error}")
+        _fire_lifecycle(self.context, "connector_down", {"name": self.name, "host": host, "port": port, "error": error})
+        return received
+
+
+def _endpoint(endpoint: Union[Tuple[str, int], str]) -> Tuple[str, int]:
+    if isinstance(endpoint, str):
+        host, _, port = endpoint.rpartition(":")
+        return (host, int(port))
+    host, port = endpoint
+    return (host, int(port))
+
+
+class _StreamProtocol(asyncio.Protocol):
+    """
+    the protocol of one stream of a ConnectorHub, splits the received bytes into lines.
+    """
+
+    def __init__(self, hub: "ConnectorHub", stats: ConnectionStats, request: Optional[bytes] = None):
+        self.hub = hub
+        self.stats = stats
+        self.request = request
+        self.transport: Optional[asyncio.Transport] = None
+        self.buffer = LineBuffer(hub.read_size, hub.max_line_length)
+        self.closed = asyncio.get_running_loop().create_future()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        if self.request is not None:
+            transport.write(self.request)
+        if self.hub._paused:
+            transport.pause_reading()
+
+    def data_received(self, data: bytes):
+        stats = self.stats
+        stats.bytes += len(data)
+        self.buffer.feed(data)
+        collect = self.hub._collect
+        for line in self.buffer.lines():
+            if line.strip():
+                stats.messages += 1
+                if not _fire_line(line, collect):
+                    stats.parse_errors += 1
+        stats.last_message = time()
+        stats.dropped = self.buffer.dropped
+        self.hub._schedule_flush()
+
+    def connection_lost(self, exc: Optional[Exception]):
+        if not self.closed.done():
+            self.closed.set_result(exc)
+
+
+class _HubStream:
+    """
+    a stream of a ConnectorHub, with its endpoints and statistics.
+    """
+
+    def __init__(self, name: str, endpoints: List[Tuple[str, int]], subscribe: Optional[Iterable[str]] = None):
+        self.name = name
+        self.endpoints = endpoints
+        self.request = _subscribe_line(subscribe)
+        self.stats: Dict[Tuple[str, int], ConnectionStats] = {endpoint: ConnectionStats() for endpoint in endpoints}
+        self.endpoint: Optional[Tuple[str, int]] = None
+        self.protocol: Optional[_StreamProtocol] = None
+        self.task: Optional[asyncio.Task] = None
+
+
+class ConnectorHub:
+    """
+    reads many streams of {"key": ..., "data": ...} lines on a single thread, with asyncio.
+
+    where every Connector has its own thread, the hub multiplexes all of its streams on
+    one asyncio event loop, so it can follow thousands of feeds. The received lines are
+    collected and handed to the event engine in batches, one pending event per key
+    (see Context.fire_many). Like Connector, every stream reconnects with exponential
+    backoff, can fail over to other endpoints, has statistics and fires connector_up
+    and connector_down events.
+
+    memory is bounded: lines longer than max_line_length are dropped, and when more
+    than max_in_flight lines were handed to the engine but not handled yet, the hub
+    stops reading (the TCP windows fill up and the senders slow down) until the
+    engine caught up.
+
+    Example usage:
+    ```python
+    hub = ConnectorHub().start()
+    for port in range(9000, 10000):
+        hub.add([("feeds.example.com", port)])
+    ```
+    """
+
+    def __init__(self, context: Optional[Context] = None,
+                 read_size: int = 4096,
+                 max_line_length: int = MAX_LINE_LENGTH,
+                 max_in_flight: int = 100000,
+                 reconnect: bool = True,
+                 backoff: float = 0.5,
+                 max_backoff: float = 30.0,
+                 connect_timeout: float = 5.0):
+        """
+        context: the context the events are fired in, None is the global context
+        read_size: the initial size of the receive buffer of every stream, the buffer only grows for long lines
+        max_line_length: lines longer than this (in bytes) are dropped
+        max_in_flight: the maximum number of lines handed to the engine that were not handled yet
+        reconnect, backoff, max_backoff, connect_timeout: see Connector
+        """
+        self.context = Manager.global_context if context is None else context
+        self.read_size = read_size
+        self.max_line_length = max_line_length
+        self.max_in_flight = max_in_flight
+        self.reconnect = reconnect
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.connect_timeout = connect_timeout
+
+        self.streams: Dict[str, _HubStream] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+        # the lines received since the last flush, by key
+        self._pending: Dict[str, List[Any]] = {}
+        self._flush_scheduled = False
+        # the lines handed to the engine that were not handled yet
+        self._in_flight = 0
+        self._paused = False
+
+        # the streams added before the hub was started, added when its loop runs
+        self._queued: List[_HubStream] = []
+        self._queued_lock = Lock()
+
+        self._started = Event()
+        self._thread = Thread(target=self._run, daemon=True)
+
+    def start(self) -> "ConnectorHub":
+        self._thread.start()
+        self._started.wait()
+        return self
+
+    def stop(self):
+        """
+        closes every stream and stops the hub.
+        """
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._stop)
+            self._thread.join()
+
+    def add(self, endpoints: Iterable[Union[Tuple[str, int], str]], name: Optional[str] = None,
+            subscribe: Optional[Iterable[str]] = None) -> str:
+        """
+        adds a stream, read from the first endpoint that works. Can be called from any thread,
+        also before the hub is started, the stream then connects when it starts.
+        subscribe: the key patterns to receive from the connector middleware, see Connector
+        returns the name of the stream, the first endpoint if None.
+        """
+        endpoints = [_endpoint(endpoint) for endpoint in endpoints]
+        if not endpoints:
+            raise ValueError("a stream needs at least one endpoint")
+        name = name if name is not None else "{}:{}".format(*endpoints[0])
+        stream = _HubStream(name, endpoints, subscribe)
+        with self._queued_lock:
+            if self.loop is None:
+                self._queued.append(stream)
+                return name
+        self.loop.call_soon_threadsafe(self._add, stream)
+        return name
+
+    def remove(self, name: str):
+        """
+        closes a stream. Can be called from any thread.
+        """
+        with self._queued_lock:
+            if self.loop is None:
+                self._queued = [stream for stream in self._queued if stream.name != name]
+                return
+        self.loop.call_soon_threadsafe(self._remove, name)
+
+    def health(self) -> Dict[str, Any]:
+        """
+        returns the state and the statistics of every stream.
+        """
+        streams = {}
+        for name, stream in list(self.streams.items()):
+            streams[name] = {
+                "connected": stream.endpoint is not None,
+                "endpoint": "{}:{}".format(*stream.endpoint) if stream.endpoint else None,
+                "endpoints": {f"{host}:{port}": stats.as_dict() for (host, port), stats in stream.stats.items()},
+            }
+        return {"connected": sum(stream["connected"] for stream in streams.values()),
+                "in_flight": self._in_flight, "paused": self._paused, "streams": streams}
+
+    # everything below runs on the loop of the hub
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        with self._queued_lock:
+            self.loop = loop
+            queued, self._queued = self._queued, []
+        for stream in queued:
+            loop.call_soon(self._add, stream)
+        self.loop.call_soon(self._started.set)
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    def _stop(self):
+        for name in list(self.streams):
+            self._remove(name)
+        self._flush()
+
+        async def wait_and_stop():
+            tasks = [stream.task for stream in self.streams.values() if stream.task is not None]
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.loop.stop()
+        self.loop.create_task(wait_and_stop())
+
+    def _add(self, stream: _HubStream):
+        if stream.name in self.streams:
+            logger.warning(f"connector hub already has a stream named {stream.name}")
+            return
+        self.streams[stream.name] = stream
+        stream.task = self.loop.create_task(self._follow(stream))
+
+    def _remove(self, name: str):
+        stream = self.streams.get(name)
+        if stream is not None and stream.task is not None:
+            stream.task.cancel()
+
+    async def _follow(self, stream: _HubStream):
+        """
+        keeps a stream connected, trying the endpoints in order with backoff between rounds.
+        """
+        delay = self.backoff
+        try:
+            while True:
+                for endpoint in stream.endpoints:
+                    if await self._read(stream, endpoint):
+                        delay = self.backoff
+                        break
+
+                if not self.reconnect:
+                    return
+                await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+                delay = min(delay * 2, self.max_backoff)
+        except asyncio.CancelledError:
+            protocol = stream.protocol
+            if protocol is not None and protocol.transport is not None:
+                protocol.transport.close()
+        finally:
+            if self.streams.get(stream.name) is stream:
+                del self.streams[stream.name]
+
+    async def _read(self, stream: _HubStream, endpoint: Tuple[str, int]) -> bool:
+        """
+        connects to the endpoint and waits until the connection is closed.
+        returns whether anything was received.
+        """
+        host, port = endpoint
+        stats = stream.stats[endpoint]
+        try:
+            _, protocol = await asyncio.wait_for(
+                self.loop.create_connection(lambda: _StreamProtocol(self, stats, stream.request), host, port),
+                self.connect_timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            stats.failures += 1
+            logger.warning(f"connector {stream.name} could not connect to {host}:{port}: {e!r}")
+            return False
+
+        stream.protocol = protocol
+        stream.endpoint = endpoint
+        stats.connects += 1
+        stats.connected_since = time()
+        _fire_lifecycle(self.context, "connector_up", {"name": stream.name, "host": host, "port": port})
+
+        bytes_before = stats.bytes
+        error = None
+        try:
+            error = await protocol.closed
+        finally:
+            stream.protocol = None
+            stream.endpoint = None
+            stats.connected_since = None
+            if error is not None:
+                stats.failures += 1
+            _fire_lifecycle(self.context, "connector_down", {"name": stream.name, "host": host, "port": port,
+                                                             "error": None if error is None else str(error)})
+        return stats.bytes > bytes_before
+
+    def _collect(self, key: str, data: Any):
+        pending = self._pending.get(key)
+        if pending is None:
+            self._pending[key] = [data]
+        else:
+            pending.append(data)
+
+    def _schedule_flush(self):
+        # the lines received in one iteration of the loop are handed over together
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            self.loop.call_soon(self._flush)
+
+    def _flush(self):
+        self._flush_scheduled = False
+        pending, self._pending = self._pending, {}
+        for key, items in pending.items():
+            self._in_flight += len(items)
+            done = partial(self._done, len(items))
+            Manager.add_event(key, items, self.context, None, Manager.PendingEvent.MANY, done)
+
+        if self._in_flight >= self.max_in_flight and not self._paused:
+            # the engine can't keep up, stop reading until it caught up
+            self._paused = True
+            self._set_reading(False)
+
+    def _done(self, count: int):
+        # called by the engine once a batch was handled, on the thread of the engine
+        try:
+            self.loop.call_soon_threadsafe(self._handled, count)
+        except RuntimeError:
+            # the hub was stopped
+            pass
+
+    def _handled(self, count: int):
+        self._in_flight -= count
+        if self._paused and self._in_flight <= self.max_in_flight // 2:
+            self._paused = False
+            self._set_reading(True)
+
+    def _set_reading(self, reading: bool):
+        for stream in self.streams.values():
+            protocol = stream.protocol
+            if protocol is not None and protocol.transport is not None and not protocol.transport.is_closing():
+                if reading:
+                    protocol.transport.resume_reading()
+                else:
+                    protocol.transport.pause_reading()
@@ -6,7 +6,12 @@ rs = Ruleset()
 dataContext = create_context(name='Data Context', ruleset=rs)
 
 # when running this, you should replace the ip with the ip of your server
-connect_datastream('192.168.1.166', 25565, dataContext.fire)
+# the connection is made again when the server restarts
+connect_datastream('192.168.1.166', 25565, dataContext.fire, reconnect=True)
+
+@rs.event("connector_down")
+def connector_down(ctx, data):
+    print(f"lost the connection to {data['host']}:{data['port']}, reconnecting")
 
 @rs.event("button1")
 def button1(ctx, data):
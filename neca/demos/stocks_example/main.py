@@ -1,6 +1,7 @@
 import neca
 from neca.events import *
 from neca.log import logger
+from neca.series import SeriesStore
 import logging
 import random
 import json
@@ -15,6 +16,10 @@ REFRESH_RATE = 1
 
 stocks = ["aapl"]
 
+# keeps the candles shown on the chart, and sends every browser
+# only the candles it does not have yet
+store = SeriesStore("stock", window=LOOKBACK)
+
 @event("init")
 def init(ctx, e):
     # load the stock data
@@ -26,6 +31,15 @@ def init(ctx, e):
 
     ctx["chart_type"] = "candlestick"
     
+@event("connect")
+def connect(ctx, sid):
+    # the new browser receives the whole window right away
+    store.connect(sid)
+    store.sync(sid)
+
+@event("disconnect")
+def disconnect(ctx, sid):
+    store.disconnect(sid)
 
 @event("roll")
 def roll(ctx, event):
@@ -60,7 +74,7 @@ def stock_data(ctx, data):
         })
     
     #print(f"Stock data received: {processed_data}")
-    ctx["stockdata"] = processed_data
+    store.extend("candle", processed_data)
     fire_global("update_chart", None)        
 
 chartkeys = {
@@ -72,10 +86,15 @@ chartkeys = {
 
 @event("update_chart")
 def update_chart(ctx, e):
-    stockdata = ctx.get("stockdata", [])
     # possibly format the data for other chart types
     chart_type = ctx.get("chart_type", "candlestick")
     
+    if chart_type == "candlestick":
+        # only send the new candles
+        store.sync()
+        return
+    
+    stockdata = store.points("candle")
     # lines can be drawn on the chart based on open, high, low, close
     if chart_type[:4] == "line":
         key = chartkeys[chart_type[4]]
@@ -0,0 +1,158 @@
+"""
+This module contains the outbound emit pipeline.
+
+By default every call to events.emit is sent to the browser right away.
+When the engine is started with an emit interval (neca.start(emit_interval=0.05)),
+emitted messages are collected for one frame and then sent together:
+- messages that replace the state of (a part of) a block, like "set", "data",
+  "updateSeries" or "draw", only keep the latest message per block and target.
+- other messages, like "add" or "appendData", are kept in order and sent to the
+  browser as one message per block, which connect_block in core.js unpacks.
+a block is an event name, a session and the id of the element (a chart) the message is for.
+
+NOTE: the data of an emitted message is sent at the end of the frame,
+so it should not be modified after it was emitted.
+"""
+
+import json
+from threading import Event, Lock, Thread
+from time import sleep
+from typing import Any, Dict, List, Optional, Tuple
+from neca.log import logger
+
+
+# actions that overwrite what an earlier message with the same target did
+REPLACE_ACTIONS = {"set", "data", "updateSeries", "updateOptions", "draw", "setEntityPosition", "setView"}
+
+# actions that overwrite everything earlier messages did to the block
+RESET_ACTIONS = {"data", "updateSeries"}
+
+# the key the browser looks for to recognise a merged message
+BATCH_KEY = "__batch__"
+
+
+def _target(data: Dict) -> Any:
+    """
+    returns the part of a block that a message applies to,
+    like a series of a chart or a named entity on a map.
+    """
+    if "series" in data:
+        return ("series", data["series"])
+    if "name" in data:
+        return ("name", data["name"])
+    value = data.get("value")
+    if isinstance(value, (list, tuple)) and len(value) == 2 and isinstance(value[0], str):
+        # [category, value] pairs of the line, bar and pie charts
+        return ("category", value[0])
+    return None
+
+
+class Emitter:
+    """
+    collects emitted messages for one frame, merges them and sends them to the browser.
+
+    mostly used for internal bookkeeping. If you're a user,
+    you probably won't need to use this class directly, use neca.start(emit_interval=...) instead.
+    """
+
+    def __init__(self, socket, interval: float = 0.05):
+        """
+        socket: the Socket.IO server to send the messages with
+        interval: the length of a frame in seconds
+        """
+        if interval <= 0:
+            raise ValueError("the emit interval should be greater than 0")
+
+        self.socket = socket
+        self.interval = interval
+
+        # the messages of the current frame, in the order they were emitted
+        # the keys start with (event, sid, id) of the block the message is for,
+        # followed by what a replacing message replaces, or a unique number for the others
+        self._frame: Dict[Any, Tuple[str, Any, Optional[str]]] = {}
+        self._counter = 0
+        self._lock = Lock()
+        self._pending = Event()
+
+        self.stats = {
+            "received": 0,      # messages emitted by handlers
+            "sent": 0,          # messages sent to Socket.IO
+            "dropped": 0,       # messages replaced by a later message before they were sent
+            "merged": 0,        # messages sent as part of a merged message
+            "bytes_saved": 0,   # approximate size of the dropped messages and the merged message framing
+        }
+
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def emit(self, event: str, data: Any, sid: Optional[str] = None):
+        """
+        adds a message to the current frame.
+        """
+        with self._lock:
+            self.stats["received"] += 1
+            is_dict = isinstance(data, dict)
+            action = data.get("action") if is_dict else None
+            block = (event, sid, data.get("id") if is_dict else None)
+
+            if action in RESET_ACTIONS:
+                # everything that was emitted to the block before is overwritten
+                for key in [key for key in self._frame if key[:3] == block]:
+                    self._drop(key)
+
+            if action in REPLACE_ACTIONS:
+                key = block + (action, _target(data))
+                if key in self._frame:
+                    self._drop(key)
+            else:
+                self._counter += 1
+                key = block + (self._counter,)
+
+            self._frame[key] = (event, data, sid)
+        self._pending.set()
+
+    def _drop(self, key):
+        # must be called while holding the lock
+        event, data, sid = self._frame.pop(key)
+        self.stats["dropped"] += 1
+        try:
+            self.stats["bytes_saved"] += len(event) + len(json.dumps(data, default=str))
+        except (TypeError, ValueError):
+            pass
+
+    def flush(self):
+        """
+        sends the messages of the current frame.
+        """
+        with self._lock:
+            frame = self._frame
+            self._frame = {}
+            self._pending.clear()
+
+        # group the messages per block (event name, session and id), keeping their order
+        groups: Dict[Tuple[str, Optional[str], Any], List[Any]] = {}
+        for key, (event, data, sid) in frame.items():
+            groups.setdefault(key[:3], []).append(data)
+
+        for (event, sid, _), messages in groups.items():
+            if len(messages) == 1:
+                self.socket.emit(event, messages[0], to=sid)
+            else:
+                self.socket.emit(event, {BATCH_KEY: messages}, to=sid)
+                with self._lock:
+                    self.stats["merged"] += len(messages)
+                    # every merged message saves the framing of a packet: 42["event",...]
+                    self.stats["bytes_saved"] += (len(messages) - 1) * (len(event) + 6)
+            with self._lock:
+                self.stats["sent"] += 1
+
+    def _run(self):
+        while True:
+            # sleep until something is emitted, then wait for the rest of the frame
+            self._pending.wait()
+            self._pending.clear()
+            sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("error while sending emitted messages")
@@ -0,0 +1,108 @@
+"""
+This module contains the compact encoding for emitted payloads.
+
+numeric series like [[x, y], ...] or OHLC candles are very verbose as JSON.
+When an emit is compact (emit(..., compact=True) or neca.start(compact=True)),
+long numeric lists in the payload are replaced by typed arrays, which Socket.IO
+sends as binary attachments. connect_block in core.js decodes them again before
+the message reaches the block, so blocks receive the same data as before.
+
+the following are encoded, everything else is sent as JSON:
+- lists of numbers:                       [1, 2, 3, ...]
+- lists of equally long lists of numbers: [[x, y], [x, y], ...]
+- lists of dicts with the same keys, whose values are numbers or
+  equally long lists of numbers:          [{"x": t, "y": [o, h, l, c]}, ...]
+"""
+
+import sys
+from array import array
+from typing import Any, Dict, List, Optional
+
+
+# the key the browser looks for to recognise an encoded value
+TYPED_KEY = "__typed__"
+
+# lists shorter than this are not worth encoding
+MIN_LENGTH = 8
+
+_INT32_MIN = -2 ** 31
+_INT32_MAX = 2 ** 31 - 1
+
+
+def _is_number(value: Any) -> bool:
+    # bool is an int, but JSON (and the browser) treat it differently
+    return (type(value) is int or type(value) is float)
+
+
+def _pack(values: List[Any]) -> Optional[Dict[str, Any]]:
+    """
+    packs a flat list of numbers in a typed array,
+    or returns None if not every value is a number.
+    """
+    if not all(map(_is_number, values)):
+        return None
+
+    if all(type(value) is int for value in values) and \
+            _INT32_MIN <= min(values) and max(values) <= _INT32_MAX:
+        packed = array("i", values)
+        dtype = "i32"
+    else:
+        packed = array("d", values)
+        dtype = "f64"
+
+    # typed arrays in the browser are little endian
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return {TYPED_KEY: dtype, "data": packed.tobytes()}
+
+
+def _encode_list(values: List[Any]) -> Optional[Dict[str, Any]]:
+    first = values[0]
+
+    # [1, 2, 3, ...]
+    if _is_number(first):
+        return _pack(values)
+
+    # [[x, y], [x, y], ...]
+    if isinstance(first, (list, tuple)):
+        width = len(first)
+        if width == 0 or not all(isinstance(row, (list, tuple)) and len(row) == width for row in values):
+            return None
+        flat = [value for row in values for value in row]
+        packed = _pack(flat)
+        if packed is not None:
+            packed["shape"] = [len(values), width]
+        return packed
+
+    # [{"x": t, "y": [o, h, l, c]}, ...]
+    if isinstance(first, dict) and first:
+        keys = list(first)
+        if not all(isinstance(row, dict) and len(row) == len(keys) for row in values):
+            return None
+        try:
+            columns = {key: _encode_list([row[key] for row in values]) for key in keys}
+        except KeyError:
+            return None
+        if any(column is None for column in columns.values()):
+            return None
+        return {TYPED_KEY: "records", "length": len(values), "columns": columns}
+
+    return None
+
+
+def encode(data: Any) -> Any:
+    """
+    returns a copy of data in which long numeric lists are replaced by typed arrays.
+    values that can't be encoded are returned unchanged.
+    """
+    if isinstance(data, dict):
+        return {key: encode(value) for key, value in data.items()}
+
+    if isinstance(data, (list, tuple)):
+        if len(data) >= MIN_LENGTH:
+            encoded = _encode_list(data)
+            if encoded is not None:
+                return encoded
+        return [encode(value) for value in data]
+
+    return data
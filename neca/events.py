@@ -12,6 +12,12 @@ Most used functions and decorators:
 
 - fire_all(eventname, data, delay=None): Emits an event with the given name in every context. All functions annotated with @event(key) are called for each context.
 
+- context.fire_many(eventname, items, delay=None): Emits an event for every item in the context, at the cost of a single pending event. Useful for high-rate sources.
+
+- @event(key, batch=True, max_batch=1000, max_wait=0.1): A decorator for batch handlers. The function is called with a list of event data, collected until max_batch events arrived or max_wait seconds passed.
+
+- @event("sensor.*.temp") / @event("stock.#"): keys with wildcard segments (separated by dots) handle every matching event. "*" matches one segment, "#" any number of segments. See neca.topics.
+
 - create_context(name=None, ruleset=None): Creates a new context and returns it. You can specify the ruleset to use for this context, and optionally, provide a name. If no ruleset is specified, the global ruleset is used.
 
 - emit(event, data, id=None): Emits a new event to the outside world, typically to a web browser. You can specify the event name, data (convertible to JSON through json.dumps), and an optional identifier.
@@ -34,12 +40,19 @@ emit("browser_event", {"message": "Hello, world!"})
 ```
 """
 
-from time import sleep
-from typing import Callable, Any, Dict, List, Optional
+from time import sleep, monotonic
+from typing import Callable, Any, Dict, Iterable, List, Optional
 from neca.log import logger
-from datetime import datetime, timedelta
+from logging import DEBUG
+from neca.scheduler import Scheduler
+from neca.executors import Dispatcher
+from neca.aio import run_coroutine
+from neca.encoding import encode
+from neca.topics import TopicTrie, is_pattern
+from inspect import iscoroutinefunction
 import neca.settings as settings
 from threading import RLock
+from queue import SimpleQueue, Empty
 
 
 
@@ -48,7 +61,15 @@ class Ruleset:
     a Ruleset object is a collection of rules that can be used to handle events.
     rules are functions that take a context and an event as arguments.
     they are called when an event is fired.
+    
+    keys can be patterns with "*" (one segment) and "#" (any number of segments),
+    like "sensor.*.temp". The rules of a key are resolved once and compiled into
+    a dispatch plan (see Ruleset.Plan), so firing an event costs a dictionary lookup
+    and the handler calls, with or without patterns.
     """
+    
+    # the number of keys whose rules are remembered
+    CACHE_SIZE = 65536
 
     class Rule:
         """
@@ -63,6 +84,17 @@ class Ruleset:
             self.conditions = []
             self.keys = keys
             
+            # where the function runs, None means in the thread handling the event
+            self.executor: Optional[str] = None
+            
+            # async def handlers return a coroutine that still has to be run
+            self.is_async = iscoroutinefunction(func)
+            
+            # batch rules receive a list of event data instead of a single piece of data
+            self.batch = False
+            self.max_batch: Optional[int] = None
+            self.max_wait: Optional[float] = None
+            
         def add_condition(self, condition: Callable[["Context", Any], bool]):
             """
             adds a condition to the rule.
@@ -77,6 +109,31 @@ class Ruleset:
                 if not condition(context, event):
                     return False
             return True
+    
+    class Plan:
+        """
+        the compiled rules of an event key: what fire_immediate does for the key.
+        built once per key and rebuilt when the rules change.
+        
+        mostly used for internal bookkeeping. If you're a user,
+        you probably won't need to use this class directly.
+        """
+        __slots__ = ("entries", "functions")
+        
+        def __init__(self, rules: List["Ruleset.Rule"]):
+            # (rule, conditions, function) for every rule, function is None
+            # when the rule can't be called directly (batch, process or async rules)
+            self.entries = tuple(
+                (rule, tuple(rule.conditions),
+                 rule.func if not rule.batch and rule.executor != "process" and not rule.is_async else None)
+                for rule in rules)
+            
+            # when no rule has conditions and every rule is a plain function,
+            # the functions are called one after another without checks
+            self.functions: Optional[tuple] = None
+            if self.entries and all(not conditions and function is not None
+                                    for _, conditions, function in self.entries):
+                self.functions = tuple(function for _, _, function in self.entries)
             
     
     def __init__(self):
@@ -87,14 +144,82 @@ class Ruleset:
         # "eventname2": [rule3, rule4, ...]
         self.index: Dict[str, List[Ruleset.Rule]] = {}
         
+        # the rules of keys with wildcards, "pattern": [rule1, rule2, ...]
+        self.patterns: Dict[str, List[Ruleset.Rule]] = {}
+        # the patterns, with (registration number, rule) as values
+        self._trie = TopicTrie()
+        
+        # the rules every fired key resolved to, and their dispatch plans,
+        # cleared when a rule is registered or gets a condition
+        self.resolved: Dict[str, List[Ruleset.Rule]] = {}
+        self.plans: Dict[str, Ruleset.Plan] = {}
+        
+    def rules(self, key: str) -> List["Ruleset.Rule"]:
+        """
+        returns the rules for an event key: the rules of the key itself,
+        followed by the rules of the patterns matching it, in the order they were registered.
+        """
+        rules = self.resolved.get(key)
+        if rules is not None:
+            return rules
+        
+        rules = self.index.get(key, [])
+        if self.patterns:
+            matched = [rule for _, rule in sorted(self._trie.match(key), key=lambda entry: entry[0])]
+            if matched:
+                # a rule that matches more than once is called once
+                rules = list(dict.fromkeys(rules + matched))
         
+        if len(self.resolved) >= self.CACHE_SIZE:
+            self.resolved.clear()
+        self.resolved[key] = rules
+        return rules
+    
+    def plan(self, key: str) -> "Ruleset.Plan":
+        """
+        returns the dispatch plan for an event key, compiled from its rules.
+        """
+        plan = self.plans.get(key)
+        if plan is None:
+            if len(self.plans) >= self.CACHE_SIZE:
+                self.plans.clear()
+            plan = self.plans[key] = Ruleset.Plan(self.rules(key))
+        return plan
     
-    def event(self, key: str):
+    def _changed(self):
+        """
+        forgets the resolved keys and their plans, called when the rules change.
+        """
+        self.resolved.clear()
+        self.plans.clear()
+    
+
+    def event(self, key: str, executor: Optional[str] = None, 
+              batch: bool = False, max_batch: Optional[int] = 1000, max_wait: Optional[float] = 0.1):
         """
         decorator for event handlers, 
         the decorated function will be called when context.fire(key, context) is called 
         on the key given to this decorator.
+        
+        executor: where the function runs. None or "thread" runs it in the thread handling the event.
+                  "process" runs it in a worker process, for pure CPU work. The function is then
+                  called with None instead of the context, and when it returns something other than None
+                  the result is fired in the context as the event "<key>_result". The engine doesn't
+                  wait for the process, so the results may arrive in another order than the events.
+                  The function and the event data must be picklable, and the main module has
+                  to call neca.start() behind `if __name__ == "__main__":`.
+        batch: if True, the function is called with a list of event data instead of a single piece of data.
+               the data of the events is collected until max_batch events have arrived,
+               or max_wait seconds have passed since the first one, whichever comes first.
+               a batch function can only be registered for one key (or pattern), events of
+               different keys matching a pattern are collected in separate batches.
+        max_batch: the maximum number of events in a batch. None means no limit.
+        max_wait: the maximum time in seconds an event waits in a batch. None means no limit.
         """
+        if executor not in (None, "thread", "process"):
+            raise ValueError(f"unknown executor: {executor}. Use 'thread' or 'process'.")
+        if batch and max_batch is None and max_wait is None:
+            raise ValueError("a batch needs a max_batch, a max_wait or both")
         
         def decorator(func: Callable[["Context", Any], None]):
             # check if the function is callable
@@ -104,18 +229,38 @@ class Ruleset:
 
             # get or create the rule
             rule = self.functions.get(func, Ruleset.Rule(func, []))
+            if (batch or rule.batch) and rule.keys:
+                # the batch settings and the collected data belong to the rule,
+                # they can't be kept apart for several keys
+                raise ValueError(f"function already registered for event key: {rule.keys[0]}. "
+                                 f"A batch function can only be registered for one event key or pattern.")
             rule.keys.append(key)
+            if executor is not None:
+                if executor == "process" and rule.is_async:
+                    raise ValueError("async def handlers can not run in a process executor")
+                rule.executor = executor
+            if batch:
+                rule.batch = True
+                rule.max_batch = max_batch
+                rule.max_wait = max_wait
             
             
-            # the function is indexed by the key
-            if key not in self.index:
-                self.index[key] = []
+            # the function is indexed by the key, or by the pattern
+            pattern = is_pattern(key)
+            index = self.patterns if pattern else self.index
+            if key not in index:
+                index[key] = []
                 
             # check if the rule is already in the index
-            if rule in self.index[key]:
+            if rule in index[key]:
                 # raise an error
                 raise ValueError(f"function already registered for event key: {key}. You can only register a function once per event key.")
-            self.index[key].append(rule)
+            index[key].append(rule)
+            if pattern:
+                self._trie.add(key, (len(self._trie), rule))
+            
+            # the keys have to be resolved again
+            self._changed()
                 
             if func not in self.functions:
                 # register the function as a rule
@@ -150,15 +295,32 @@ class Ruleset:
             
             # add the condition to the rule
             self.functions[func].add_condition(condition)
+            # the plans have the conditions of the rules
+            self._changed()
             return func
         
         return decorator
 
 class Context:
+    class Batch:
+        """
+        the event data collected for a batch rule.
+        """
+        __slots__ = ("items", "generation")
+        
+        def __init__(self):
+            self.items: List[Any] = []
+            # incremented every time the batch is flushed,
+            # so a flush timer for an older batch can be ignored
+            self.generation = 0
+    
     def __init__(self, ruleset: Ruleset, name: Optional[str] = None):
         self._data: Dict[Any, Any] = {}
         self.ruleset = ruleset
         
+        # the open batches for batch rules, indexed by (rule, key)
+        self._batches: Dict[Any, Context.Batch] = {}
+        
         if name is None:
             self.name = str(id(self))
         else:
@@ -195,6 +357,20 @@ class Context:
         """
         Manager.add_event(event_name, data, self, delay)
     
+    def fire_many(self, event_name: str, items: Iterable[Any], delay: Optional[float] = None):
+        """
+        emits an event for every item, in order, as if fire was called for each of them.
+        the items share a single pending event, which is a lot cheaper
+        for high-rate sources than calling fire for every item.
+        
+        key: the name of the event
+        items: the data of each event
+        delay: the delay in seconds before the events are fired
+        """
+        items = list(items)
+        if items:
+            Manager.add_event(event_name, items, self, delay, Manager.PendingEvent.MANY)
+    
     def fire_immediate(self, key: str, data: Any):
         """
         emits an event with the given name in the current context.
@@ -207,29 +383,134 @@ class Context:
         data: the data to pass to the event handlers
         """
             
-        # for now just use the global rules object
-        rules = self.ruleset.index.get(key, [])
-        if rules == []:
+        # the compiled rules of the key, see Ruleset.Plan
+        plan = self.ruleset.plans.get(key)
+        if plan is None:
+            plan = self.ruleset.plan(key)
+        
+        functions = plan.functions
+        if functions is not None:
+            # no conditions, just call the functions
+            for function in functions:
+                function(self, data)
+            return
+        
+        if not plan.entries:
             # no rules for this event, send a warning
             # to notify what is going on
             logger.warning(f"no rules for event: {key}")
             return
-            
-        for rule in rules:
-            if rule.check_conditions(self, data):
-                # call the function
-                #try:
-                    rule.func(self, data)
-                #except TypeError as e:
-                    #logger.error(f"error while calling function {rule.func.__name__} for event {key}: {e}")
-                    #logger.warn(f"is your function missing an argument? event handlers should have the signature: func(context, event)")
-                # Try catch block commented out because it was causing unrelated errors to be caught
-
+        
+        self._run_plan(plan, key, data)
+    
+    def fire_immediate_many(self, key: str, items: List[Any]):
+        """
+        same as fire_immediate, but for every item in the list.
+        
+        WARNING: this function fires the events immediately, without waiting for the event loop.
+        """
+        plan = self.ruleset.plans.get(key)
+        if plan is None:
+            plan = self.ruleset.plan(key)
+        
+        functions = plan.functions
+        if functions is not None:
+            if len(functions) == 1:
+                function = functions[0]
+                for data in items:
+                    function(self, data)
             else:
-                # send a debug message
-                logger.debug(f"rule for {rule.func} did not meet conditions for event: {key}")
+                for data in items:
+                    for function in functions:
+                        function(self, data)
+            return
+        
+        if not plan.entries:
+            logger.warning(f"no rules for event: {key}")
+            return
         
+        for data in items:
+            self._run_plan(plan, key, data)
+    
+    def _run_plan(self, plan: Ruleset.Plan, key: str, data: Any):
+        """
+        checks the conditions of every rule in the plan, and calls the rules that meet them.
+        """
+        for rule, conditions, function in plan.entries:
+            for condition in conditions:
+                if not condition(self, data):
+                    # only format the message when it is logged
+                    if logger.isEnabledFor(DEBUG):
+                        logger.debug(f"rule for {rule.func} did not meet conditions for event: {key}")
+                    break
+            else:
+                # call the function
+                if function is not None:
+                    function(self, data)
+                elif rule.batch:
+                    self._add_to_batch(rule, key, data)
+                else:
+                    self._call_rule(rule, key, data)
+    
+    def _call_rule(self, rule: Ruleset.Rule, key: str, data: Any):
+        """
+        calls the function of a rule, in the executor it asks for.
+        """
+        #try:
+        if rule.executor == "process":
+            # the event loop doesn't wait for the process, the result is fired when it is done
+            future = Manager.dispatcher.run_in_process(rule.func, data)
+            future.add_done_callback(lambda future: self._process_done(rule, key, future))
+        elif rule.is_async:
+            run_coroutine(rule.func(self, data))
+        else:
+            rule.func(self, data)
+        #except TypeError as e:
+            #logger.error(f"error while calling function {rule.func.__name__} for event {key}: {e}")
+            #logger.warn(f"is your function missing an argument? event handlers should have the signature: func(context, event)")
+        # Try catch block commented out because it was causing unrelated errors to be caught
     
+    def _process_done(self, rule: Ruleset.Rule, key: str, future):
+        """
+        fires the result of a rule that ran in a worker process as the event "<key>_result".
+        """
+        error = future.exception()
+        if error is not None:
+            logger.error(f"error while calling function {rule.func.__name__} in a process for event {key}: {error!r}")
+            return
+        result = future.result()
+        if result is not None:
+            self.fire(f"{key}_result", result)
+    
+    def _add_to_batch(self, rule: Ruleset.Rule, key: str, data: Any):
+        """
+        adds the data to the open batch of a batch rule, 
+        and calls the rule when the batch is full.
+        """
+        batch = self._batches.get((rule, key))
+        if batch is None:
+            batch = self._batches[(rule, key)] = Context.Batch()
+        
+        batch.items.append(data)
+        if rule.max_batch is not None and len(batch.items) >= rule.max_batch:
+            self._flush_batch(rule, key, batch.generation)
+        elif len(batch.items) == 1 and rule.max_wait is not None:
+            # first item of a new batch, make sure it does not wait too long
+            Manager.add_event(key, (rule, batch.generation), self, rule.max_wait, Manager.PendingEvent.FLUSH)
+    
+    def _flush_batch(self, rule: Ruleset.Rule, key: str, generation: int):
+        """
+        calls a batch rule with the collected data, 
+        unless that batch was already flushed.
+        """
+        batch = self._batches.get((rule, key))
+        if batch is None or batch.generation != generation or not batch.items:
+            return
+        
+        items = batch.items
+        batch.items = []
+        batch.generation += 1
+        self._call_rule(rule, key, items)
     
 
 class Manager:
@@ -240,31 +521,74 @@ class Manager:
         """
         Data class for pending events.
         """
-        def __init__(self, key: str, data: Any, stamped: datetime,
-                     context: Any = None, delay: Optional[float] = None):
+        __slots__ = ("key", "data", "stamped", "context", "delay", "due", "kind", "callback")
+        
+        # the kinds of pending events
+        EVENT = 0   # a single event, data is the event data
+        MANY = 1    # one event per item, data is a list of event data
+        FLUSH = 2   # the max_wait of a batch expired, data is (rule, generation)
+
+        def __init__(self, key: str, data: Any, stamped: float,
+                     context: Any = None, delay: Optional[float] = None, kind: int = EVENT,
+                     callback: Optional[Callable[[], None]] = None):
             """
             key: the name of the event
             data: the data to pass to the event handlers
-            stamped: the timestamp of when the event was created
+            stamped: the monotonic timestamp of when the event was created
             context: the context for which the event was created
             delay: the delay in seconds before the event is fired
+            kind: what to do when the event is fired, see the kinds above
+            callback: called after the event was handled, even if a handler failed
             """
             self.key = key
             self.data = data
             self.stamped = stamped
             self.context = context
             self.delay = delay
+            self.kind = kind
+            self.callback = callback
+            # the due time is computed once, the scheduler is keyed by it
+            self.due = stamped + delay if delay else stamped
+        
+        def fire(self):
+            """
+            fires the event in its context.
+            """
+            try:
+                if self.kind == Manager.PendingEvent.EVENT:
+                    self.context.fire_immediate(self.key, self.data)
+                elif self.kind == Manager.PendingEvent.MANY:
+                    self.context.fire_immediate_many(self.key, self.data)
+                else:
+                    self.context._flush_batch(self.data[0], self.key, self.data[1])
+            finally:
+                if self.callback is not None:
+                    self.callback()
             
     global_ruleset: Ruleset = Ruleset()
     global_context: Context = Context(global_ruleset, "global")
     rulesets: List[Ruleset] = [global_ruleset]
     contexts: List[Context] = [global_context]
 
-    # lock for the pending events, add_event may be 
-    # called from multiple threads
+    # lock for the scheduler, it is only held while moving events
+    # in and out of the scheduler, never while handlers run
     _lock = RLock()
     
-    pending_event_keys: List[PendingEvent] = []
+    # new events are put on this queue by add_event, which may be called
+    # from multiple threads. The event loop moves them into the scheduler.
+    # producers never have to wait for the event loop this way
+    _ingress: SimpleQueue = SimpleQueue()
+    
+    # called after an event is put on the ingress queue,
+    # set by engines that can't block on the queue (see neca.aio)
+    _notify: Optional[Callable[[], None]] = None
+    
+    # the pending events, ordered by their due time
+    scheduler: Scheduler = Scheduler()
+    
+    # decides where the handlers of ready events run
+    # replaced when the engine is started with workers
+    dispatcher: Dispatcher = Dispatcher()
     
     @staticmethod
     def eventLoop():
@@ -278,37 +602,67 @@ class Manager:
         logger.debug("calling init event")
         fire_global("init", None)
         while True:
-            # sort the pending events by timestamp + delay
-            Manager._lock.acquire()
-            Manager.pending_event_keys.sort(key=lambda x: x.stamped + timedelta(seconds=x.delay or 0))
+            # take the events that are ready from the scheduler
+            # the handlers are called after the lock is released
+            with Manager._lock:
+                Manager._drain_ingress()
+                ready = Manager.scheduler.pop_ready()
+                due = Manager.scheduler.peek()
             
-            # loop over the pending events
-            # and fire those that are ready
-            for pending_event in Manager.pending_event_keys:
-                if pending_event.stamped + timedelta(seconds=pending_event.delay or 0) < datetime.now():
-                    # fire the event
-                    pending_event.context.fire_immediate(pending_event.key, pending_event.data)
-                    # remove the event from the list
-                    Manager.pending_event_keys.remove(pending_event)
-                else:
-                    break
-            Manager._lock.release()
-            # sleep for 10 ms
-            sleep(0.01)
+            if not ready:
+                # block until an event is due, or until a new event is added
+                # which may be due earlier than what we are waiting for
+                timeout = None if due is None else max(due - monotonic(), 0)
+                try:
+                    pending_event = Manager._ingress.get(timeout=timeout)
+                except Empty:
+                    continue
+                with Manager._lock:
+                    Manager.scheduler.push_at(pending_event, pending_event.due)
+                continue
+            
+            # fire the events that are ready in order
+            dispatcher = Manager.dispatcher
+            for pending_event in ready:
+                # an error in a handler must not stop the event loop
+                try:
+                    dispatcher.dispatch(pending_event)
+                except Exception:
+                    logger.exception(f"error while handling event {pending_event.key} in {pending_event.context}")
+    
+    @staticmethod
+    def _drain_ingress():
+        """
+        moves all events from the ingress queue into the scheduler, without blocking.
+        must be called while holding the lock.
+        """
+        ingress = Manager._ingress
+        scheduler = Manager.scheduler
+        while True:
+            try:
+                pending_event = ingress.get_nowait()
+            except Empty:
+                return
+            scheduler.push_at(pending_event, pending_event.due)
     
     @staticmethod
-    def add_event(key: str, data: Any, context: Context, delay: Optional[float] = None):
+    def add_event(key: str, data: Any, context: Context, delay: Optional[float] = None, kind: int = 0,
+                  callback: Optional[Callable[[], None]] = None):
         """
         adds an event to the event loop. The event will be fired after the given delay.
+        kind: the kind of pending event, see Manager.PendingEvent
+        callback: called after the event was handled
         """
-        Manager._lock.acquire()
-        Manager.pending_event_keys.append(Manager.PendingEvent(key, data, datetime.now(), context, delay))
-        Manager._lock.release()
+        # the event loop is woken up by the queue
+        Manager._ingress.put(Manager.PendingEvent(key, data, monotonic(), context, delay, kind, callback))
+        if Manager._notify is not None:
+            Manager._notify()
     
     
     
     
-def event(key: str):
+def event(key: str, executor: Optional[str] = None, 
+          batch: bool = False, max_batch: Optional[int] = 1000, max_wait: Optional[float] = 0.1):
     """
     decorator for event handlers, 
     the decorated function will be called when fire_global(key, context) is called 
@@ -316,7 +670,7 @@ def event(key: str):
 
     same as Rules.event, but attaches the event to the global rules object.
     """
-    return Manager.global_ruleset.event(key)
+    return Manager.global_ruleset.event(key, executor, batch, max_batch, max_wait)
 
 def condition(condition: Callable[[Any, Any], bool]):
     """
@@ -358,7 +712,7 @@ def create_context(name: Optional[str] = None, ruleset: Optional[Ruleset] = None
     Manager.contexts.append(context)
     return context
 
-def emit(event, data, id = None, sid: str | None = None):
+def emit(event, data, id = None, sid: str | None = None, compact: bool | None = None):
     """
     Emits a new event to the outside world (which is usually the browser).
 
@@ -366,7 +720,15 @@ def emit(event, data, id = None, sid: str | None = None):
     data: a piece of data that can be converted to JSON through json.dumps
     id: optional identifier to be emitted. None indicates no identifier is emitted.
     sid: the session id to emit to. If None, the event is emitted to all sessions.
+    compact: send long numeric lists as binary typed arrays (see neca.encoding).
+             If None, the setting given to neca.start is used.
     """
     if id is not None:
         data.update({"id": id})
-    settings.socket.emit(event, data, to=sid)
\ No newline at end of file
+    if compact or (compact is None and settings.compact):
+        data = encode(data)
+    if settings.emitter is not None:
+        # collect the message for the current frame
+        settings.emitter.emit(event, data, sid)
+    else:
+        settings.socket.emit(event, data, to=sid)
\ No newline at end of file
@@ -0,0 +1,127 @@
+"""
+This module contains the dispatcher that decides where event handlers run.
+
+By default every event is handled on the event loop thread, one after the other.
+When the engine is started with workers (neca.start(workers=N)), events are handed
+to a pool of worker threads instead. Events for different contexts then run
+concurrently, while events within one context still run one at a time and in order.
+
+Handlers registered with @event(key, executor="process") run in a separate
+worker process, which is useful for pure CPU work that would otherwise hold the GIL.
+The worker processes are never forked from the running engine, they are started by a
+fork server or spawned (see process_context). They import the main module again, so a
+main module with process handlers has to start the engine behind a guard:
+
+```python
+if __name__ == "__main__":
+    neca.start()
+```
+"""
+
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from threading import Lock
+from typing import Any, Callable, Deque, Dict, Optional
+from neca.log import logger
+
+
+def process_context():
+    """
+    returns the multiprocessing context worker processes are started with.
+    forking a process that already runs the event loop and the web server threads can
+    deadlock, so the workers are started by a fork server, or spawned where there is none.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+
+class Dispatcher:
+    """
+    hands ready events to the contexts they were fired in.
+
+    mostly used for internal bookkeeping by the event loop. If you're a user,
+    you probably won't need to use this class directly, use neca.start(workers=N) instead.
+    """
+
+    # the maximum number of events a worker handles for one context
+    # before giving other contexts a turn
+    FAIRNESS = 64
+
+    def __init__(self, workers: int = 0, process_workers: Optional[int] = None):
+        """
+        workers: the number of worker threads. 0 means handlers run on the event loop thread.
+        process_workers: the number of worker processes for handlers with executor="process".
+                         If None, the number of CPUs is used.
+        """
+        if workers < 0:
+            raise ValueError("the number of workers can not be negative")
+
+        self.workers = workers
+        self.process_workers = process_workers
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="neca-worker") if workers else None
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+
+        # per-context queues of events that are waiting for the context to be free
+        # a context has a queue in this dict while a worker is handling its events
+        self._queues: Dict[Any, Deque] = {}
+        self._lock = Lock()
+
+    def dispatch(self, pending_event):
+        """
+        handles a ready event, either right away or on a worker thread.
+        """
+        if self._pool is None:
+            pending_event.fire()
+            return
+
+        context = pending_event.context
+        with self._lock:
+            queue = self._queues.get(context)
+            if queue is not None:
+                # a worker is already busy with this context, it will pick the event up
+                queue.append(pending_event)
+                return
+            self._queues[context] = deque((pending_event,))
+        self._pool.submit(self._drain, context)
+
+    def _drain(self, context):
+        """
+        handles the queued events of a context in order.
+        """
+        for _ in range(self.FAIRNESS):
+            with self._lock:
+                queue = self._queues[context]
+                if not queue:
+                    del self._queues[context]
+                    return
+                pending_event = queue.popleft()
+
+            try:
+                pending_event.fire()
+            except Exception:
+                logger.exception(f"error while handling event {pending_event.key} in {context}")
+
+        # let other contexts have a turn before continuing with this one
+        self._pool.submit(self._drain, context)
+
+    def run_in_process(self, func: Callable[[Any, Any], Any], data: Any) -> Future:
+        """
+        calls func(None, data) in a worker process, without waiting for it.
+        returns the future of the result. the function and the data must be picklable.
+        """
+        if self._process_pool is None:
+            with self._lock:
+                if self._process_pool is None:
+                    self._process_pool = ProcessPoolExecutor(self.process_workers, mp_context=process_context())
+        return self._process_pool.submit(func, None, data)
+
+    def shutdown(self):
+        """
+        stops the worker threads and processes after they finish their current work.
+        """
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False)
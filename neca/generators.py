@@ -1,10 +1,189 @@
-from datetime import datetime
-from typing import Optional, Callable, Generator, Tuple
+from typing import Any, BinaryIO, Optional, Callable, Generator, Iterable, Iterator, Tuple
 from neca.events import *
+from neca.timestamps import compile_argument_parser, compile_parser
+from neca.replay import IndexedFile, Replay, find_files, merge_files
+from neca.columnar import BATCH_SIZE, read_batches, as_list
+from queue import Queue, Full
+import bz2
+import csv
+import gzip
+import io
 import json
+import lzma
+import os
 
 import threading
 
+# use orjson to parse lines when it is installed, it is a lot faster than json
+# both accept bytes, so lines don't have to be decoded first
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+# the number of bytes read from a file at once
+CHUNK_SIZE = 1 << 20
+
+# compressed files are recognised by their extension, .zst needs the zstandard package
+COMPRESSIONS = {'.gz': 'gzip', '.bz2': 'bz2', '.xz': 'lzma', '.lzma': 'lzma', '.zst': 'zstandard'}
+
+# the number of decompressed chunks read ahead of the parser
+READ_AHEAD = 4
+
+
+def compression(data_file: str) -> Optional[str]:
+    """
+    Return the compression of a data file based on its extension ('gzip', 'bz2', 'lzma' or 'zstandard'),
+    or None if it is not compressed.
+    """
+    return COMPRESSIONS.get(os.path.splitext(data_file)[1].lower())
+
+
+def open_data_file(data_file: str) -> BinaryIO:
+    """
+    Open a data file for reading bytes, decompressing it if it is compressed.
+
+    Parameters:
+    - data_file (str): The path to the file, compressed files end in .gz, .bz2, .xz, .lzma or .zst.
+
+    Returns:
+    - BinaryIO: The opened file.
+    """
+    kind = compression(data_file)
+    if kind == 'gzip':
+        return gzip.open(data_file, 'rb')
+    if kind == 'bz2':
+        return bz2.open(data_file, 'rb')
+    if kind == 'lzma':
+        return lzma.open(data_file, 'rb')
+    if kind == 'zstandard':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError(f"reading {data_file} needs the zstandard package: pip install zstandard") from None
+        return zstandard.ZstdDecompressor().stream_reader(open(data_file, 'rb'), closefd=True)
+    return open(data_file, 'rb')
+
+
+def _read_ahead(f: BinaryIO, chunk_size: int) -> Generator[bytes, None, None]:
+    """
+    yields the chunks of a file, which are read (and decompressed) by a background thread.
+    the decompressors release the GIL, so decompressing overlaps with parsing.
+    """
+    chunks: Queue = Queue(READ_AHEAD)
+    stopped = threading.Event()
+    
+    def put(item):
+        # wait for room, unless the reader stopped early
+        while not stopped.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return
+            except Full:
+                pass
+    
+    def read():
+        try:
+            while not stopped.is_set():
+                chunk = f.read(chunk_size)
+                put(chunk)
+                if not chunk:
+                    return
+        except Exception as e:
+            put(e)
+    
+    thread = threading.Thread(target=read, daemon=True)
+    thread.start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if isinstance(chunk, Exception):
+                raise chunk
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def line_reader(data_file: str, chunk_size: int = CHUNK_SIZE) -> Generator[bytes, None, None]:
+    """
+    Read a file in large binary chunks and yield its lines, without the newline.
+    
+    Compressed files (.gz, .bz2, .xz, .lzma and .zst) are decompressed while they are read,
+    by a background thread, so decompressing and parsing the lines happen at the same time.
+
+    Parameters:
+    - data_file (str): The path to the file.
+    - chunk_size (int, optional): The number of bytes read at once. Default is 1 MB.
+
+    Yields:
+    - bytes: A line of the file.
+    """
+    with open_data_file(data_file) as f:
+        if compression(data_file) is None:
+            chunks = iter(lambda: f.read(chunk_size), b'')
+        else:
+            chunks = _read_ahead(f, chunk_size)
+        
+        try:
+            rest = b''
+            for chunk in chunks:
+                lines = chunk.split(b'\n')
+                # the last line may continue in the next chunk
+                lines[0] = rest + lines[0]
+                rest = lines.pop()
+                yield from lines
+            if rest:
+                yield rest
+        finally:
+            # stop the read ahead thread before the file is closed under it
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+
+
+def json_lines_generator(data_file: str, 
+                         fields: Optional[Iterable[str]] = None,
+                         chunk_size: int = CHUNK_SIZE) -> Generator[dict, None, None]:
+    """
+    Generate objects from a file with one JSON-encoded object per line.
+
+    The file is read in large binary chunks and parsed with orjson when it is installed,
+    falling back to the json module. Empty lines are skipped.
+
+    Parameters:
+    - data_file (str): The path to the file containing the data.
+    - fields (Iterable[str], optional): Only keep these top-level fields of every object.
+      If None, every field is kept. When used with generate_data, include the timestamp field.
+    - chunk_size (int, optional): The number of bytes read at once. Default is 1 MB.
+
+    Yields:
+    - dict: A parsed object as a Python dictionary.
+
+    Example usage:
+    ```python
+    # only keep the fields the dashboard uses
+    generator = lambda f: json_lines_generator(f, fields=('created_at', 'text'))
+    generate_data('tweets.txt', generator=generator)
+    ```
+    """
+    loads = _loads
+    if fields is None:
+        for line in line_reader(data_file, chunk_size):
+            if line.strip():
+                yield loads(line)
+        return
+
+    fields = tuple(fields)
+    for line in line_reader(data_file, chunk_size):
+        if line.strip():
+            record = loads(line)
+            yield {field: record[field] for field in fields if field in record}
+
+
 def tweet_generator(data_file: str) -> Generator[dict, None, None]:
     """
     Generate tweet objects from a data file and yield them.
@@ -13,7 +192,7 @@ def tweet_generator(data_file: str) -> Generator[dict, None, None]:
     and yields the parsed tweet objects one by one.
 
     Parameters:
-    - data_file (str): The path to the file containing the tweet data.
+    - data_file (str): The path to the file containing the tweet data, which may be compressed (see line_reader).
 
     Yields:
     - dict: A parsed tweet object as a Python dictionary.
@@ -23,9 +202,27 @@ def tweet_generator(data_file: str) -> Generator[dict, None, None]:
     - The input file should contain one JSON-encoded tweet object per line.
     """
 
-    for line in open(data_file, 'r', encoding='utf-8'):
-        tweet = json.loads(line)
-        yield tweet
+    yield from json_lines_generator(data_file)
+
+
+def csv_generator(data_file: str, delimiter: Optional[str] = None) -> Generator[dict, None, None]:
+    """
+    Generate objects from a CSV file with a header line, one object per line.
+
+    The values are strings, the keys are the names in the header. The file may be compressed
+    (see line_reader). For large files, generate_columnar is faster.
+
+    Parameters:
+    - data_file (str): The path to the file containing the data.
+    - delimiter (str, optional): The delimiter of the values. Default is a tab for .tsv files and a comma otherwise.
+
+    Yields:
+    - dict: A row of the file as a Python dictionary.
+    """
+    with io.TextIOWrapper(open_data_file(data_file), encoding='utf-8', newline='') as f:
+        if delimiter is None:
+            delimiter = '\t' if '.tsv' in data_file.lower() else ','
+        yield from csv.DictReader(f, delimiter=delimiter)
 
 def generate_data(data_file: str, 
                           time_scale: int = 1000, 
@@ -33,7 +230,10 @@ def generate_data(data_file: str,
                           context: Optional[Context] = None, 
                           limit: Optional[int] = None,
                           generator: Callable[[str], Generator] = tweet_generator,
-                          timestamp_signature: Tuple[str,str] = ('created_at','%a %b %d %H:%M:%S %z %Y')) -> threading.Thread:
+                          timestamp_signature: Tuple[str,str] = ('created_at','%a %b %d %H:%M:%S %z %Y'),
+                          start: Optional[Any] = None,
+                          end: Optional[Any] = None,
+                          max_in_flight: Optional[int] = 10000) -> Replay:
     """
     Generate and emit tweet objects from a data file as events.
 
@@ -41,16 +241,32 @@ def generate_data(data_file: str,
     and custom event naming. The tweets are converted into event objects and delivered to the provided context.
 
     Parameters:
-    - data_file (str): The path to the file containing the tweet data.
+    - data_file (str): The path to the file containing the tweet data, which may be compressed (see line_reader).
     - time_scale (int, optional): The time scale used to convert timestamps in the file to simulation time.
       Default is 1000, which means that 1 second in the file corresponds to 1 millisecond in the simulation (1000x speedup)
+      None replays the file as fast as possible.
     - event_name (str, optional): The name of the event to which the tweets should be emitted. Default is 'tweet'.
     - context (Context, optional): The context in which to emit the events. If None, events are not emitted.
     - limit (int, optional): The maximum number of tweets to emit. If None, all tweets from the file are emitted.
     - generator (Callable[[str], Generator], optional): The generator function used to read and parse data from the file.
       Default is 'tweet_generator'.
     - timestamp_signature (Tuple[str,str], optional): The signature of the timestamp field (name, format) in the data file.
+      The format is a strptime format, or 'epoch' / 'epoch_ms' for fields with seconds / milliseconds since the epoch.
       Default is ('created_at','%a %b %d %H:%M:%S %z %Y').
+    - start (optional): Only replay the records at or after this timestamp, either in seconds since the epoch
+      or a string in the timestamp format. Numbers are always seconds, also for 'epoch_ms' data
+      (see neca.timestamps.compile_argument_parser). Default is None, which starts at the first record.
+    - end (optional): Only replay the records before this timestamp, like start. Default is None.
+      When start or end is given with tweet_generator or json_lines_generator, the data file is read through
+      an index stored next to it (see neca.replay), which is built the first time. Files of other generators,
+      and compressed files, are read from the start and only the records in the range are replayed.
+    - max_in_flight (int, optional): The maximum number of records that are scheduled but not handled yet.
+      The file is only read further once earlier records were handled, so memory use does not depend on
+      the size of the file. Default is 10000. None schedules every record as soon as it is read.
+
+    Returns:
+    - Replay: The running replay, see neca.replay. It can be paused, resumed, moved with seek
+      and sped up with set_time_scale while it runs, and joined like a thread.
 
     Note:
     - The generator function should be a Callable that takes the data file as input
@@ -60,67 +276,200 @@ def generate_data(data_file: str,
     ```python
     # Generate and emit tweets from a data file
     generate_data('tweets.txt', time_scale=1000, event_name='new_tweet', limit=100)
+    
+    # Only replay one day of the data file
+    generate_data('tweets.txt', start='Wed Oct 10 00:00:00 +0000 2018', end='Thu Oct 11 00:00:00 +0000 2018')
+    
+    # Control the replay from the dashboard, with the replay_pause, replay_speed, ... events
+    replay = generate_data('tweets.txt')
+    replay.register()
     ```
     """
-    thread = threading.Thread(target=__generate_data, args=(data_file, time_scale, event_name, context, limit, generator, timestamp_signature))
-    thread.start()
-    return thread
+    source = _file_source(data_file, generator, timestamp_signature, start, end)
+    parse_argument = compile_argument_parser(timestamp_signature[1])
+    return Replay(source, time_scale, event_name, context, limit, max_in_flight, parse_argument).start()
 
-def __generate_data(data_file: str, 
-                          time_scale: int = 1000, 
-                          event_name: str = 'tweet', 
-                          context: Optional[Context] = None, 
-                          limit: Optional[int] = None,
-                          generator: Callable[[str], Generator] = tweet_generator,
-                          timestamp_signature: Tuple[str,str] = ('created_at','%a %b %d %H:%M:%S %z %Y')) -> None:
+def generate_data_many(data_files: Any,
+                       time_scale: int = 1000,
+                       event_name: str = 'tweet',
+                       context: Optional[Context] = None,
+                       limit: Optional[int] = None,
+                       generator: Callable[[str], Generator] = tweet_generator,
+                       timestamp_signature: Tuple[str,str] = ('created_at','%a %b %d %H:%M:%S %z %Y'),
+                       max_in_flight: Optional[int] = 10000) -> Replay:
+    """
+    Generate and emit objects from many data files as one stream of events, in timestamp order.
+
+    The files are parsed in parallel by worker processes and merged by timestamp, so data sets
+    that are sharded (by day, by source, ...) can be replayed together without merging them first.
+    Every file should be in timestamp order by itself. A worker is only started once the replay
+    reaches the first timestamp of its file, so shards that don't overlap in time are not parsed
+    at the same time.
+
+    Parameters:
+    - data_files: The files to replay. Either a list of paths, a directory (every file in it is replayed)
+      or a glob pattern like 'data/2018-10-*.txt'.
+    - generator (Callable[[str], Generator], optional): The generator function used to read and parse data from a file.
+      It is called in the worker processes, so it has to be a function defined at the top level of a module
+      (not a lambda). Default is 'tweet_generator'.
+    - the other parameters are the same as for generate_data.
+
+    Example usage:
+    ```python
+    # Replay the shards of every source for October 2018 together
+    generate_data_many('data/*/2018-10-*.txt', time_scale=1000)
+    ```
+    """
+    files = find_files(data_files)
+    parse_argument = compile_argument_parser(timestamp_signature[1])
     
-    begin_time = None
-    begin_actual_time = datetime.now()
-    last_time = datetime.now()
+    def source(begin: Optional[float]) -> Iterator[Tuple[float, Any]]:
+        records = merge_files(files, generator, timestamp_signature)
+        if begin is None:
+            return records
+        return _skip_until(records, begin)
     
-    if context is None:
-        context = Manager.global_context
-        
-    gen = generator(data_file)
+    return Replay(source, time_scale, event_name, context, limit, max_in_flight, parse_argument).start()
+
+def generate_columnar(data_file: str,
+                      time_scale: int = 1000,
+                      event_name: str = 'tick',
+                      context: Optional[Context] = None,
+                      limit: Optional[int] = None,
+                      timestamp_signature: Tuple[str,str] = ('time', 'epoch_ms'),
+                      batches: bool = False,
+                      batch_size: int = BATCH_SIZE,
+                      fields: Optional[Iterable[str]] = None,
+                      start: Optional[Any] = None,
+                      end: Optional[Any] = None,
+                      max_in_flight: Optional[int] = 10000,
+                      **options: Any) -> Replay:
+    """
+    Generate and emit records from a CSV, Parquet or Arrow file as events.
+
+    The file is read in batches of columns and the timestamps of a batch are converted at once
+    (see neca.columnar), which makes replaying files with millions of records feasible.
+    The format is chosen by the extension: .csv, .tsv, .parquet, .pq, .arrow, .feather or .ipc.
+    CSV files may be compressed. Parquet and Arrow files need pyarrow: pip install neca[columnar].
+
+    Parameters:
+    - data_file (str): The path to the file containing the data.
+    - time_scale (int, optional): The time scale, see generate_data. None replays as fast as possible.
+    - event_name (str, optional): The name of the emitted events. Default is 'tick'.
+    - context (Context, optional): The context in which to emit the events, see generate_data.
+    - limit (int, optional): The maximum number of events to emit. If None, the whole file is emitted.
+    - timestamp_signature (Tuple[str,str], optional): The name and format of the timestamp column.
+      The format is a strptime format, or 'epoch' / 'epoch_ms' for seconds / milliseconds since the epoch.
+      Arrow timestamp columns are read natively. Default is ('time', 'epoch_ms').
+    - batches (bool, optional): Emit a neca.columnar.ColumnBatch per batch of records instead of a dict per record.
+      A batch is emitted at the time of its first record. Default is False.
+    - batch_size (int, optional): The number of records read at once, and the size of emitted batches.
+    - fields (Iterable[str], optional): Only read these columns. If None, every column is read.
+    - start, end (optional): Only replay the records in this time range, see generate_data.
+      The file should be in timestamp order.
+    - max_in_flight (int, optional): The maximum number of events that are emitted but not handled yet, see generate_data.
+    - options: Passed to the reader, like types={'price': float} and delimiter for CSV files.
+
+    Returns:
+    - Replay: The running replay, see generate_data.
+
+    Example usage:
+    ```python
+    # replay a day of market ticks, a batch of ticks per event
+    generate_columnar('ticks.parquet', time_scale=10, batches=True, batch_size=1000)
+
+    @event('tick')
+    def ticks(context, batch):
+        prices = batch.columns['price']
+    ```
+    """
+    parse_argument = compile_argument_parser(timestamp_signature[1])
+    start = None if start is None else parse_argument(start)
+    end = None if end is None else parse_argument(end)
     
-    for tweet in gen:
-        if limit is not None and limit <= 0:
-            break
-        if limit is not None:
-            limit -= 1
+    def source(begin: Optional[float]) -> Generator[Tuple[float, Any], None, None]:
+        if begin is None or (start is not None and begin < start):
+            begin = start
         
-        
-        # get the time of the tweet
-        tweet_time = datetime.strptime(tweet[timestamp_signature[0]], timestamp_signature[1])
-                    #datetime.strptime(tweet['created_at'], '%a %b %d %H:%M:%S %z %Y')
-        
-        # wait until the tweet should be emitted
-        # based on the last tweet time and the time scale
-        if begin_time is None:
-            # first tweet, emit immediately
-            begin_time = tweet_time
-            last_time = tweet_time
-            context.fire(event_name, tweet, 0)
-            continue
-            
+        for batch in read_batches(data_file, timestamp_signature, batch_size, fields, **options):
+            timestamps = as_list(batch.timestamps)
+            if end is not None and timestamps[-1] >= end:
+                # the last batch of the range
+                last = next(i for i, timestamp in enumerate(timestamps) if timestamp >= end)
+                if last == 0:
+                    return
+                batch = batch.slice(0, last)
+                timestamps = timestamps[:last]
             
-        # wait until the tweet should be emitted
-        wait = tweet_time - begin_time
-        delay = wait.total_seconds() / time_scale
-        
-        real_delay = delay - (datetime.now() - begin_actual_time).total_seconds()
-        
-        # cap the wait time to prevent it taking too long
-        # cap at 2 hours at timescale 1
-        if real_delay > 2 * 60 * 60 / time_scale:
-            real_delay = ((last_time - begin_time).total_seconds() + 2 * 60 * 60) / time_scale
+            if begin is not None and timestamps[0] < begin:
+                # skip the records before the start
+                first = next((i for i, timestamp in enumerate(timestamps) if timestamp >= begin), None)
+                if first is None:
+                    continue
+                batch = batch.slice(first)
+                timestamps = timestamps[first:]
             
-        last_time = tweet_time
+            if batches:
+                yield timestamps[0], batch
+            else:
+                yield from zip(timestamps, batch.rows())
+    
+    return Replay(source, time_scale, event_name, context, limit, max_in_flight, parse_argument).start()
 
+def _file_source(data_file: str,
+                 generator: Callable[[str], Generator],
+                 timestamp_signature: Tuple[str,str],
+                 start: Optional[Any],
+                 end: Optional[Any]) -> Callable[[Optional[float]], Iterator[Tuple[float, Any]]]:
+    """
+    returns the source of a replay of a data file, which yields (timestamp, record) pairs
+    from a timestamp on.
+    """
+    # compile the timestamp format once, instead of calling strptime for every record
+    timestamp_field, timestamp_format = timestamp_signature
+    parse_timestamp = compile_parser(timestamp_format)
+    parse_argument = compile_argument_parser(timestamp_format)
+    start = None if start is None else parse_argument(start)
+    end = None if end is None else parse_argument(end)
+    
+    # JSON lines files are read through the index to skip to a timestamp, other files are
+    # read from the start and filtered. compressed files can't be memory-mapped, they are filtered too
+    indexable = generator in (tweet_generator, json_lines_generator) and compression(data_file) is None
+    
+    def source(begin: Optional[float]) -> Generator[Tuple[float, Any], None, None]:
+        if begin is None or (start is not None and begin < start):
+            begin = start
         
-        context.fire(event_name, tweet, real_delay)
-            
-            
+        if begin is None and end is None:
+            gen = generator(data_file)
+            for record in gen:
+                yield parse_timestamp(record[timestamp_field]), record
+        elif indexable:
+            # skip to the start using the index, it is built the first time and loaded after that
+            indexed = IndexedFile(data_file, timestamp_field, parse_timestamp, _loads,
+                                  timestamp_format=timestamp_format)
+            gen = indexed.records(begin, end)
+            try:
+                for record in gen:
+                    yield parse_timestamp(record[timestamp_field]), record
+            finally:
+                # also when the replay stops early or seeks, which closes this generator
+                gen.close()
+                indexed.close()
+        else:
+            # no index, read the records before the start too
+            for record in generator(data_file):
+                timestamp = parse_timestamp(record[timestamp_field])
+                if (begin is None or timestamp >= begin) and (end is None or timestamp < end):
+                    yield timestamp, record
+    
+    return source
+
+def _skip_until(records: Iterable[Tuple[float, Any]], begin: float) -> Generator[Tuple[float, Any], None, None]:
+    for timestamp, record in records:
+        if timestamp >= begin:
+            yield timestamp, record
+
 def print_tweet(tweet):
     print_object(tweet)
         
@@ -0,0 +1,786 @@
+"""
+This module contains the building blocks for replaying data files.
+
+An index of a data file (with one JSON-encoded record per line) stores the byte offset
+and the timestamp of every record. It is built once and stored next to the data file
+(tweets.txt -> tweets.txt.idx). With the index, a replay can start at any timestamp,
+jump around or replay a time range, without parsing everything before it:
+the data file is memory-mapped and the start is found by binary search.
+
+Example usage:
+```python
+from neca.replay import IndexedFile
+from neca.timestamps import compile_parser
+
+data = IndexedFile('tweets.txt', 'created_at', compile_parser('%a %b %d %H:%M:%S %z %Y'),
+                   timestamp_format='%a %b %d %H:%M:%S %z %Y')
+# replay the fifth hour of the dataset
+begin = data.timestamps[0] + 4 * 60 * 60
+for tweet in data.records(begin, begin + 60 * 60):
+    ...
+```
+
+Data sets that are split over many files can be replayed as one stream with merge_files:
+every file is parsed in a worker process, and the records are merged by timestamp.
+
+generate_data returns a Replay, which paces the records and fires them as events.
+It can be paused, resumed, moved to another timestamp and sped up or slowed down
+while it runs, also from the browser:
+```python
+replay = generate_data('tweets.txt', time_scale=1000)
+replay.register()  # handles the replay_pause, replay_seek, ... events
+
+replay.set_time_scale(None)  # as fast as possible
+replay.seek('Wed Oct 10 12:00:00 +0000 2018')
+replay.stats()  # {'state': 'playing', 'time_scale': None, 'achieved_scale': 5120.3, ...}
+```
+"""
+
+import glob
+import heapq
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+from time import monotonic
+from array import array
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Generator, Iterable, Iterator, List, Optional, Set, Tuple, Union
+from neca.events import Context, Manager, Ruleset, emit
+from neca.executors import process_context
+from neca.log import logger
+from neca.timestamps import compile_parser
+
+
+# the index is stored next to the data file, with this suffix
+INDEX_SUFFIX = ".idx"
+
+# header: magic, data file size, data file mtime, number of records, sorted flag, length of the signature
+_MAGIC = b"NECAIDX1"
+_HEADER = struct.Struct("<8sQdQBH")
+
+# the number of records a worker sends to the merge at once,
+# and the number of those chunks it reads ahead
+CHUNK_RECORDS = 1000
+READ_AHEAD = 8
+
+# gaps in the data longer than this (in seconds of data time) are shortened to it,
+# so a replay never waits hours for the next record
+MAX_GAP = 2 * 60 * 60
+
+# the actions that can be sent to a replay, from events or from the browser
+ACTIONS = ("pause", "resume", "seek", "speed", "stop", "status")
+
+# the replays that can be controlled from the browser by name, with the context
+# their control events are fired in (see Replay.register)
+_registered: Dict[str, Tuple[Context, "Replay"]] = {}
+
+# the rulesets that have the control rules of a name, so they are only added once
+_ruled: Set[Tuple[Ruleset, str]] = set()
+
+
+class IndexedFile:
+    """
+    a memory-mapped data file with an index of the offset and timestamp of every record.
+    """
+
+    def __init__(self, data_file: str,
+                 timestamp_field: str,
+                 parse_timestamp: Callable[[Any], float],
+                 loads: Callable[[bytes], Any] = json.loads,
+                 rebuild: bool = False,
+                 timestamp_format: Optional[str] = None):
+        """
+        data_file: the path to the file, with one JSON-encoded record per line
+        timestamp_field: the name of the timestamp field in the records
+        parse_timestamp: turns the timestamp field into seconds since the epoch (see neca.timestamps)
+        loads: the function used to parse a line
+        rebuild: build the index even if an up to date one exists
+        timestamp_format: the format parse_timestamp was compiled from. The index holds parsed
+                          timestamps, so it is only reused for the same format. None uses the
+                          name of parse_timestamp instead
+        """
+        self.data_file = data_file
+        self.index_file = data_file + INDEX_SUFFIX
+        self.timestamp_field = timestamp_field
+        self.parse_timestamp = parse_timestamp
+        self.timestamp_format = timestamp_format
+        self.loads = loads
+
+        # the byte offset and timestamp of every record,
+        # and whether the timestamps are in order
+        self.offsets = array("Q")
+        self.timestamps = array("d")
+        self.sorted = True
+
+        if rebuild or not self._load_index():
+            self._build_index()
+
+        self._file = open(data_file, "rb")
+        self._size = os.fstat(self._file.fileno()).st_size
+        # an empty file can't be mapped
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self._size else b""
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def _signature(self) -> bytes:
+        # records which field the timestamps were read from, and how they were parsed
+        parser = self.timestamp_format
+        if parser is None:
+            parser = f"{getattr(self.parse_timestamp, '__module__', '')}.{getattr(self.parse_timestamp, '__qualname__', '')}"
+        return f"{self.timestamp_field}\0{parser}".encode("utf-8")
+
+    def _load_index(self) -> bool:
+        """
+        loads the index from disk, returns False if there is none or it is out of date.
+        """
+        try:
+            stat = os.stat(self.data_file)
+            with open(self.index_file, "rb") as f:
+                magic, size, mtime, count, is_sorted, signature_length = _HEADER.unpack(f.read(_HEADER.size))
+                if magic != _MAGIC or size != stat.st_size or mtime != stat.st_mtime:
+                    return False
+                if f.read(signature_length) != self._signature():
+                    return False
+                self.offsets.fromfile(f, count)
+                self.timestamps.fromfile(f, count)
+                self.sorted = bool(is_sorted)
+        except (OSError, EOFError, struct.error):
+            self.offsets = array("Q")
+            self.timestamps = array("d")
+            return False
+        return True
+
+    def _build_index(self):
+        """
+        reads the whole data file once and writes the index next to it.
+        when the index can't be written, it is only kept in memory.
+        """
+        offsets = array("Q")
+        timestamps = array("d")
+        field = self.timestamp_field
+        parse = self.parse_timestamp
+        loads = self.loads
+
+        offset = 0
+        with open(self.data_file, "rb") as f:
+            for line in f:
+                if line.strip():
+                    offsets.append(offset)
+                    timestamps.append(parse(loads(line)[field]))
+                offset += len(line)
+
+        self.offsets = offsets
+        self.timestamps = timestamps
+        self.sorted = all(a <= b for a, b in zip(timestamps, timestamps[1:]))
+
+        stat = os.stat(self.data_file)
+        signature = self._signature()
+        # write to a temporary file first, so a crash never leaves half an index
+        temporary = self.index_file + ".tmp"
+        try:
+            with open(temporary, "wb") as f:
+                f.write(_HEADER.pack(_MAGIC, stat.st_size, stat.st_mtime, len(offsets), self.sorted, len(signature)))
+                f.write(signature)
+                offsets.tofile(f)
+                timestamps.tofile(f)
+            os.replace(temporary, self.index_file)
+        except OSError as e:
+            # a read-only directory, the index is only kept in memory
+            logger.debug(f"could not write the index of {self.data_file}, keeping it in memory: {e}")
+            try:
+                os.remove(temporary)
+            except OSError:
+                pass
+
+    def position(self, timestamp: Optional[float]) -> int:
+        """
+        returns the number of the first record at or after the timestamp.
+        """
+        if timestamp is None:
+            return 0
+        if self.sorted:
+            return bisect_left(self.timestamps, timestamp)
+
+        # the records are not in order, find the first one that is late enough
+        for i, record_time in enumerate(self.timestamps):
+            if record_time >= timestamp:
+                return i
+        return len(self.timestamps)
+
+    def line(self, i: int) -> bytes:
+        """
+        returns the raw line of record i.
+        """
+        begin = self.offsets[i]
+        end = self._map.find(b"\n", begin)
+        return self._map[begin:end if end != -1 else self._size]
+
+    def record(self, i: int) -> Any:
+        """
+        returns the parsed record i.
+        """
+        return self.loads(self.line(i))
+
+    def records(self, start: Optional[float] = None,
+                end: Optional[float] = None,
+                position: Optional[int] = None) -> Generator[Any, None, None]:
+        """
+        yields the records from the start timestamp (or position) until the end timestamp.
+        start: the timestamp to start at, in seconds since the epoch. None starts at the first record.
+        end: the timestamp to stop before, in seconds since the epoch. None replays until the last record.
+        position: the number of the record to start at, instead of a start timestamp.
+        """
+        i = self.position(start) if position is None else position
+        timestamps = self.timestamps
+        count = len(timestamps)
+        while i < count:
+            record_time = timestamps[i]
+            if end is not None and record_time >= end:
+                if self.sorted:
+                    break
+            elif self.sorted or start is None or record_time >= start:
+                yield self.record(i)
+            i += 1
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+
+def find_files(data_files: Union[str, Iterable[str]]) -> List[str]:
+    """
+    returns the data files to replay.
+    data_files: a list of paths, a directory (every file in it, except indices) or a glob pattern
+    """
+    if isinstance(data_files, str):
+        if os.path.isdir(data_files):
+            files = [os.path.join(data_files, name) for name in sorted(os.listdir(data_files))
+                     if not name.startswith(".") and not name.endswith(INDEX_SUFFIX)]
+            files = [path for path in files if os.path.isfile(path)]
+        elif glob.has_magic(data_files):
+            files = [path for path in sorted(glob.glob(data_files)) if not path.endswith(INDEX_SUFFIX)]
+        else:
+            files = [data_files]
+    else:
+        files = list(data_files)
+
+    if not files:
+        raise FileNotFoundError(f"no data files found for {data_files!r}")
+    return files
+
+
+def _parse_worker(data_file: str, generator: Callable[[str], Generator],
+                  timestamp_signature: Tuple[str, str], queue, chunk_size: int):
+    """
+    runs in a worker process: parses a data file and sends chunks of (timestamp, record) to the merge.
+    the end of the file is marked with None, an error is sent instead of the remaining records.
+    """
+    try:
+        timestamp_field, timestamp_format = timestamp_signature
+        parse_timestamp = compile_parser(timestamp_format)
+        chunk = []
+        for record in generator(data_file):
+            chunk.append((parse_timestamp(record[timestamp_field]), record))
+            if len(chunk) >= chunk_size:
+                queue.put(chunk)
+                chunk = []
+        if chunk:
+            queue.put(chunk)
+        queue.put(None)
+    except BaseException as e:
+        try:
+            queue.put(e)
+        except Exception:
+            # the error itself could not be sent
+            queue.put(RuntimeError(f"error while reading {data_file}: {e!r}"))
+
+
+class _Stream:
+    """
+    the records of one data file, parsed by a worker process.
+    """
+
+    def __init__(self, data_file: str, first: float):
+        self.data_file = data_file
+        self.first = first
+        self.process = None
+        self.queue = None
+        self.chunk: List[Tuple[float, Any]] = []
+        self.position = 0
+
+    def start(self, generator, timestamp_signature, chunk_size, read_ahead):
+        # the replay runs next to the event loop and server threads, so the worker is not forked
+        context = process_context()
+        self.queue = context.Queue(read_ahead)
+        self.process = context.Process(
+            target=_parse_worker,
+            args=(self.data_file, generator, timestamp_signature, self.queue, chunk_size),
+            daemon=True)
+        self.process.start()
+
+    def next(self) -> Optional[Tuple[float, Any]]:
+        """
+        returns the next (timestamp, record) of the file, or None at the end.
+        """
+        if self.position >= len(self.chunk):
+            chunk = self.queue.get()
+            if chunk is None:
+                self.stop()
+                return None
+            if isinstance(chunk, BaseException):
+                self.stop()
+                raise chunk
+            self.chunk = chunk
+            self.position = 0
+        item = self.chunk[self.position]
+        self.position += 1
+        return item
+
+    def stop(self):
+        if self.process is None:
+            return
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
+        self.queue.close()
+        self.process = None
+
+
+def _first_timestamp(data_file: str, generator: Callable[[str], Generator],
+                     parse_timestamp: Callable[[Any], float], timestamp_field: str) -> Optional[float]:
+    gen = generator(data_file)
+    try:
+        for record in gen:
+            return parse_timestamp(record[timestamp_field])
+        return None
+    finally:
+        gen.close()
+
+
+def merge_files(data_files: Iterable[str],
+                generator: Callable[[str], Generator],
+                timestamp_signature: Tuple[str, str],
+                chunk_size: int = CHUNK_RECORDS,
+                read_ahead: int = READ_AHEAD) -> Generator[Tuple[float, Any], None, None]:
+    """
+    yields (timestamp, record) of the records of all data files, merged by timestamp.
+
+    every file should be in timestamp order by itself. The files are parsed by worker
+    processes, a worker is started once the merge reaches the first timestamp of its file,
+    so only files that overlap in time are parsed at the same time.
+
+    data_files: the paths of the data files
+    generator: reads the records of a file, it is called in the worker processes,
+               so it must be picklable (a function defined at the top level of a module).
+               the workers are started with neca.executors.process_context and import
+               the main module again, like the process workers of the engine
+    timestamp_signature: (field, format) of the timestamp in the records, see neca.timestamps
+    chunk_size: the number of records a worker sends at once
+    read_ahead: the number of chunks a worker reads ahead of the merge
+    """
+    timestamp_field, timestamp_format = timestamp_signature
+    parse_timestamp = compile_parser(timestamp_format)
+
+    # the files that are not being read yet, ordered by their first timestamp
+    waiting = []
+    for data_file in data_files:
+        first = _first_timestamp(data_file, generator, parse_timestamp, timestamp_field)
+        if first is not None:
+            waiting.append(_Stream(data_file, first))
+    waiting.sort(key=lambda stream: stream.first)
+    waiting.reverse()
+
+    # (timestamp, stream number, record, stream) of the next record of every active file.
+    # a stream has at most one entry, so entries never compare by record
+    heap = []
+    active = []
+    try:
+        while waiting or heap:
+            # start the files whose records are due before the next record of the active files
+            while waiting and (not heap or waiting[-1].first <= heap[0][0]):
+                stream = waiting.pop()
+                stream.start(generator, timestamp_signature, chunk_size, read_ahead)
+                active.append(stream)
+                item = stream.next()
+                if item is not None:
+                    heapq.heappush(heap, (item[0], len(active), item[1], stream))
+            if not heap:
+                continue
+
+            timestamp, number, record, stream = heap[0]
+            yield timestamp, record
+
+            item = stream.next()
+            if item is None:
+                heapq.heappop(heap)
+            else:
+                heapq.heapreplace(heap, (item[0], number, item[1], stream))
+    finally:
+        # also stops the workers when the replay is stopped early
+        for stream in active:
+            stream.stop()
+
+
+class Replay:
+    """
+    paces (timestamp, record) pairs and fires the records as events, as returned by generate_data.
+
+    the replay runs on its own thread and keeps a clock that maps data time to real time.
+    Records are only handed to the event loop when they are due, so pausing, seeking or
+    changing the time scale only moves the clock, nothing that was scheduled has to be moved.
+    """
+
+    def __init__(self, source: Callable[[Optional[float]], Iterator[Tuple[float, Any]]],
+                 time_scale: Optional[float] = 1000,
+                 event_name: str = "tweet",
+                 context: Optional[Context] = None,
+                 limit: Optional[int] = None,
+                 max_in_flight: Optional[int] = 10000,
+                 parse_timestamp: Optional[Callable[[Any], float]] = None):
+        """
+        source: returns the (timestamp, record) pairs from the given timestamp on, None is from the start
+        time_scale: the number of seconds of data time per real second, None is as fast as possible
+        event_name: the name of the fired events
+        context: the context the events are fired in, None is the global context
+        limit: the maximum number of records to fire
+        max_in_flight: the maximum number of fired records that were not handled yet, None is unbounded
+        parse_timestamp: used to parse timestamps passed to seek, numbers should be read as seconds
+                         (see neca.timestamps.compile_argument_parser)
+        """
+        self._check_scale(time_scale)
+        self.source = source
+        self.event_name = event_name
+        self.context = Manager.global_context if context is None else context
+        self.limit = limit
+        self.max_in_flight = max_in_flight
+        self.parse_timestamp = parse_timestamp or float
+
+        self._condition = threading.Condition()
+        self._time_scale = time_scale
+        self._paused = False
+        self._stopped = False
+        self._finished = False
+        self._seek: Optional[float] = None
+
+        # the clock: data time anchor_data is at real time anchor_real
+        # anchor_real is None until the first record, and while paused
+        self._anchor_data: Optional[float] = None
+        self._anchor_real: Optional[float] = None
+
+        # the timestamp of the last fired record, and the number of fired records
+        self._position: Optional[float] = None
+        self._count = 0
+        # the timestamp of the record that is fired next
+        self._next_time: Optional[float] = None
+
+        # what was fired since the last change, for the achieved rate
+        self._sample: Tuple[float, Optional[float], int] = (monotonic(), None, 0)
+
+        self._thread = threading.Thread(target=self._run)
+
+    @staticmethod
+    def _check_scale(time_scale: Optional[float]):
+        if time_scale is not None and time_scale <= 0:
+            raise ValueError("the time scale should be greater than 0, or None for as fast as possible")
+
+    # the thread, so a replay can be used like the thread generate_data used to return
+
+    def start(self) -> "Replay":
+        self._thread.start()
+        return self
+
+    def join(self, timeout: Optional[float] = None):
+        self._thread.join(timeout)
+
+    def is_alive(self) -> bool:
+        return self._thread.is_alive()
+
+    # controls, these can be called from any thread
+
+    @property
+    def paused(self) -> bool:
+        return self._paused
+
+    @property
+    def time_scale(self) -> Optional[float]:
+        return self._time_scale
+
+    @property
+    def position(self) -> Optional[float]:
+        """
+        the timestamp of the last fired record, in seconds since the epoch.
+        """
+        return self._position
+
+    def pause(self):
+        with self._condition:
+            if self._paused:
+                return
+            self._anchor_data = self._data_time()
+            self._anchor_real = None
+            self._paused = True
+            self._condition.notify_all()
+
+    def resume(self):
+        with self._condition:
+            if not self._paused:
+                return
+            self._paused = False
+            self._rebase(self._anchor_data)
+
+    def seek(self, timestamp: Any):
+        """
+        continues the replay at the first record at or after the timestamp,
+        either in seconds since the epoch or a string in the timestamp format.
+        numbers are always seconds, also for 'epoch_ms' data.
+        """
+        timestamp = self.parse_timestamp(timestamp)
+        with self._condition:
+            self._seek = timestamp
+            self._condition.notify_all()
+
+    def set_time_scale(self, time_scale: Optional[float]):
+        """
+        changes the number of seconds of data time per real second, None replays as fast as possible.
+        """
+        self._check_scale(time_scale)
+        with self._condition:
+            now = self._data_time()
+            self._time_scale = time_scale
+            if not self._paused:
+                self._rebase(now)
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        returns the state of the replay, and the achieved time scale and rate
+        since the last pause, seek or change of the time scale.
+        """
+        with self._condition:
+            if self._stopped:
+                state = "stopped"
+            elif self._finished:
+                state = "finished"
+            elif self._paused:
+                state = "paused"
+            else:
+                state = "playing"
+
+            since, data, count = self._sample
+            elapsed = monotonic() - since
+            achieved_scale = None
+            rate = None
+            if elapsed > 0 and not self._paused:
+                rate = (self._count - count) / elapsed
+                if data is not None and self._position is not None:
+                    achieved_scale = (self._position - data) / elapsed
+
+            return {
+                "state": state,
+                "position": self._position,
+                "records": self._count,
+                "time_scale": self._time_scale,
+                "achieved_scale": achieved_scale,
+                "rate": rate,
+            }
+
+    def register(self, context: Optional[Context] = None, name: str = "replay"):
+        """
+        lets events control the replay, and the browser through replay_control in core.js.
+        the events are {name}_pause, {name}_resume, {name}_seek (data: the timestamp),
+        {name}_speed (data: the time scale, None is as fast as possible), {name}_stop and
+        {name}_status, which emits the stats as the {name}_status event.
+        """
+        if context is None:
+            context = Manager.global_context
+        _registered[name] = (context, self)
+
+        ruleset = context.ruleset
+        if (ruleset, name) in _ruled:
+            # the rules are there already, they control the replay registered last
+            return
+        _ruled.add((ruleset, name))
+
+        def replay() -> "Replay":
+            return _registered[name][1]
+
+        ruleset.event(f"{name}_pause")(lambda context, data: replay().pause())
+        ruleset.event(f"{name}_resume")(lambda context, data: replay().resume())
+        ruleset.event(f"{name}_seek")(lambda context, data: replay().seek(data))
+        ruleset.event(f"{name}_speed")(lambda context, data: replay().set_time_scale(data))
+        ruleset.event(f"{name}_stop")(lambda context, data: replay().stop())
+        ruleset.event(f"{name}_status")(lambda context, data: emit(f"{name}_status", replay().stats()))
+
+    # the clock, these must be called while holding the condition
+
+    def _data_time(self) -> Optional[float]:
+        """
+        the data time the clock is at now.
+        """
+        if self._anchor_real is None or self._anchor_data is None:
+            return self._anchor_data
+        if self._time_scale is None:
+            # as fast as possible, the clock is kept with the records
+            return self._anchor_data
+        now = self._anchor_data + (monotonic() - self._anchor_real) * self._time_scale
+        # when the handlers can't keep up the clock runs ahead of the records,
+        # don't skip the records that are overdue
+        if self._next_time is not None and now > self._next_time:
+            return self._next_time
+        return now
+
+    def _rebase(self, data_time: Optional[float]):
+        self._anchor_data = data_time
+        self._anchor_real = monotonic() if data_time is not None else None
+        self._sample = (monotonic(), self._position if self._position is not None else data_time, self._count)
+        self._condition.notify_all()
+
+    # the replay thread
+
+    def _run(self):
+        records = self.source(None)
+        pending: Optional[Tuple[float, Any]] = None
+        limit = self.limit
+        fire = self._fire_function()
+
+        try:
+            while limit is None or limit > 0:
+                with self._condition:
+                    if self._seek is not None:
+                        # start reading at the new timestamp, and move the clock there
+                        timestamp, self._seek = self._seek, None
+                        _close(records)
+                        records = self.source(timestamp)
+                        pending = None
+                        self._position = None
+                        self._next_time = None
+                        self._anchor_data = timestamp
+                        if not self._paused:
+                            self._rebase(timestamp)
+                        continue
+
+                if pending is None:
+                    pending = next(records, None)
+                    if pending is None:
+                        break
+
+                timestamp, record = pending
+                with self._condition:
+                    if self._stopped:
+                        return
+                    if self._seek is not None:
+                        continue
+                    if self._paused:
+                        self._condition.wait()
+                        continue
+
+                    self._next_time = timestamp
+                    if self._anchor_real is None:
+                        # the first record starts the clock
+                        self._rebase(timestamp)
+                    elif self._position is not None and timestamp - self._position > MAX_GAP:
+                        # shorten long gaps in the data
+                        self._anchor_data += timestamp - self._position - MAX_GAP
+
+                    if self._time_scale is not None:
+                        wait = (timestamp - self._anchor_data) / self._time_scale - (monotonic() - self._anchor_real)
+                        if wait > 0:
+                            # woken up early by the controls, check again
+                            self._condition.wait(wait)
+                            continue
+
+                if not fire(record):
+                    continue
+
+                with self._condition:
+                    self._position = timestamp
+                    self._count += 1
+                    if self._time_scale is None:
+                        # as fast as possible, keep the clock with the records
+                        self._anchor_data = timestamp
+                        self._anchor_real = monotonic()
+                pending = None
+                if limit is not None:
+                    limit -= 1
+        finally:
+            _close(records)
+            with self._condition:
+                self._finished = True
+                self._condition.notify_all()
+
+    def _fire_function(self) -> Callable[[Any], bool]:
+        """
+        returns the function that fires a record, which returns False if it
+        should be tried again because no slot came free in time.
+        """
+        event_name = self.event_name
+        context = self.context
+
+        if self.max_in_flight is None:
+            def fire(record: Any) -> bool:
+                Manager.add_event(event_name, record, context)
+                return True
+            return fire
+
+        # a slot is taken for every fired record, and given back once the record
+        # was handled. When all slots are taken, the source is not read any further
+        slots = threading.Semaphore(self.max_in_flight)
+
+        def fire(record: Any) -> bool:
+            # don't wait forever, the replay may be paused or stopped in the meantime
+            if not slots.acquire(timeout=0.1):
+                return False
+            Manager.add_event(event_name, record, context, callback=slots.release)
+            return True
+        return fire
+
+
+def control(name: str, action: str, value: Any = None):
+    """
+    fires the event for an action on a registered replay, used for the messages from the browser.
+    unknown replays and actions, and values that are not valid for the action, are ignored,
+    so a browser can't make a handler fail.
+    """
+    registered = _registered.get(name)
+    if registered is None or action not in ACTIONS:
+        logger.warning(f"unknown replay control: {name} {action}")
+        return
+    context, replay = registered
+
+    if action == "seek":
+        try:
+            value = float(replay.parse_timestamp(value))
+            if not math.isfinite(value):
+                raise ValueError("not a finite number")
+        except (TypeError, ValueError, OverflowError) as e:
+            logger.warning(f"ignored replay control {name} seek: invalid timestamp {value!r} ({e})")
+            return
+    elif action == "speed" and value is not None:
+        try:
+            value = float(value)
+        except (TypeError, ValueError) as e:
+            logger.warning(f"ignored replay control {name} speed: invalid time scale {value!r} ({e})")
+            return
+        if not 0 < value < math.inf:
+            logger.warning(f"ignored replay control {name} speed: the time scale should be greater than 0")
+            return
+    elif action != "speed":
+        # the other actions don't take a value
+        value = None
+    context.fire(f"{name}_{action}", value)
+
+
+def _close(records: Iterator):
+    # stops a generator early, like the merge of many files with its worker processes
+    close = getattr(records, "close", None)
+    if close is not None:
+        close()
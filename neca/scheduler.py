@@ -0,0 +1,77 @@
+"""
+This module contains the scheduler used by the event loop.
+
+the scheduler keeps pending items in a min-heap ordered by their due time,
+which is computed once (on a monotonic clock) when the item is scheduled.
+inserting an item is O(log n), peeking at the next due time is O(1)
+and items that share the same due time come out in the order they were added.
+"""
+
+import heapq
+from itertools import count
+from time import monotonic
+from typing import Any, List, Optional, Tuple
+
+
+class Scheduler:
+    """
+    a min-heap of items keyed by their due time.
+
+    mostly used for internal bookkeeping by the event loop. If you're a user,
+    you probably won't need to use this class directly.
+    """
+
+    def __init__(self):
+        # entries are (due, sequence number, item)
+        # the sequence number breaks ties so equal due times stay FIFO
+        # and the items themselves are never compared
+        self._heap: List[Tuple[float, int, Any]] = []
+        self._counter = count()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def push(self, item: Any, delay: Optional[float] = None) -> float:
+        """
+        schedules an item to become ready after the given delay (in seconds).
+        returns the due time of the item on the monotonic clock.
+        """
+        due = monotonic()
+        if delay:
+            due += delay
+        self.push_at(item, due)
+        return due
+
+    def push_at(self, item: Any, due: float):
+        """
+        schedules an item to become ready at the given monotonic time.
+        """
+        heapq.heappush(self._heap, (due, next(self._counter), item))
+
+    def peek(self) -> Optional[float]:
+        """
+        returns the due time of the earliest item, or None if the scheduler is empty.
+        """
+        if not self._heap:
+            return None
+        return self._heap[0][0]
+
+    def pop_ready(self, now: Optional[float] = None) -> List[Any]:
+        """
+        removes and returns all items that are due, in order.
+        now: the time to compare against. If None, the current monotonic time is used.
+        """
+        if now is None:
+            now = monotonic()
+
+        ready = []
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            ready.append(heapq.heappop(heap)[2])
+        return ready
+
+    def clear(self):
+        """
+        removes all scheduled items.
+        """
+        self._heap.clear()
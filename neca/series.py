@@ -0,0 +1,255 @@
+"""
+This module contains the series store, which sends chart updates as deltas.
+
+Instead of emitting the whole series every time it changes, the store remembers
+which points every connected browser already has and only emits the points that
+were appended or changed since. Series keep a window of the latest points, older
+points are trimmed on the server and in the browser.
+
+The charts in neca/statics/lib (linearchart, linechart and apexchart) understand
+the "delta" messages sent by the store.
+
+Example Usage:
+```python
+from neca.events import event
+from neca.series import SeriesStore
+
+store = SeriesStore("chart", window=1000)
+
+@event("connect")
+def connect(context, sid):
+    # the new browser gets the whole series on the next sync
+    store.connect(sid)
+    store.sync(sid)
+
+@event("disconnect")
+def disconnect(context, sid):
+    store.disconnect(sid)
+
+@event("measurement")
+def measurement(context, data):
+    store.append("temperature", [data["time"], data["value"]])
+    store.sync()
+```
+"""
+
+from threading import RLock
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from neca.events import emit
+
+
+class Series:
+    """
+    the points of a single series, with absolute indices.
+
+    mostly used for internal bookkeeping by the SeriesStore. If you're a user,
+    you probably won't need to use this class directly.
+    """
+
+    def __init__(self, window: Optional[int] = None):
+        self.window = window
+
+        # the points that are stored, self.points[0] has the absolute index self.base
+        # points before the window are trimmed in bulk, so self.points can be
+        # a bit longer than the window
+        self.points: List[Any] = []
+        self.base = 0
+
+        # incremented when the series is replaced as a whole
+        self.version = 0
+
+        # incremented on every change, changed points remember
+        # the revision they were changed in
+        self.revision = 0
+        self.changed: Dict[int, int] = {}
+
+    @property
+    def end(self) -> int:
+        """
+        the absolute index after the last point.
+        """
+        return self.base + len(self.points)
+
+    @property
+    def start(self) -> int:
+        """
+        the absolute index of the first point in the window.
+        """
+        if self.window is None:
+            return self.base
+        return max(self.base, self.end - self.window)
+
+    def extend(self, points: Iterable[Any]):
+        self.points.extend(points)
+        self.revision += 1
+        self._trim()
+
+    def update(self, index: int, point: Any):
+        """
+        replaces a point, index is relative to the window like a list index (-1 is the last point).
+        """
+        size = self.end - self.start
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError("series index out of range")
+
+        index += self.start
+        self.points[index - self.base] = point
+        self.revision += 1
+        self.changed[index] = self.revision
+
+    def replace(self, points: Iterable[Any]):
+        self.points = list(points)
+        self.base = 0
+        self.version += 1
+        self.revision += 1
+        self.changed.clear()
+        self._trim()
+
+    def window_points(self) -> List[Any]:
+        return self.points[self.start - self.base:]
+
+    def delta(self, state: Optional[Tuple[int, int, int]]) -> Optional[Dict[str, Any]]:
+        """
+        returns what a client with the given state is missing, or None if it is up to date.
+        state: (version, end, revision) of what the client received last, None for a new client
+        """
+        start = self.start
+        if state is None or state[0] != self.version or state[1] < start:
+            # the client has nothing, or nothing we can build on
+            return {"reset": True, "offset": start, "start": start, "append": self.window_points()}
+
+        _, end, revision = state
+        if end == self.end and revision == self.revision:
+            return None
+
+        update = [[index, self.points[index - self.base]]
+                  for index, changed in self.changed.items()
+                  if changed > revision and start <= index < end]
+        return {
+            "offset": start,
+            "start": end,
+            "append": self.points[end - self.base:],
+            "update": update,
+        }
+
+    def state(self) -> Tuple[int, int, int]:
+        return (self.version, self.end, self.revision)
+
+    def _trim(self):
+        if self.window is None:
+            return
+
+        # trim in bulk, once the points before the window
+        # take up a quarter of the window
+        excess = len(self.points) - self.window
+        if excess > max(self.window // 4, 1):
+            del self.points[:excess]
+            self.base += excess
+            self.changed = {index: changed for index, changed in self.changed.items() if index >= self.base}
+
+
+class SeriesStore:
+    """
+    a collection of series that are shown in one block,
+    which sends every connected browser only what it is missing.
+    """
+
+    def __init__(self, event: str, window: Optional[int] = None, id: Any = None):
+        """
+        event: the name of the emitted event, the key the block is connected to
+        window: the maximum number of points kept per series. None keeps every point.
+        id: optional identifier to be emitted, see events.emit
+        """
+        self.event = event
+        self.window = window
+        self.id = id
+        self._series: Dict[str, Series] = {}
+
+        # what every connected client received last
+        # sid -> series name -> (version, end, revision)
+        self._clients: Dict[str, Dict[str, Tuple[int, int, int]]] = {}
+        self._lock = RLock()
+
+    def connect(self, sid: str):
+        """
+        starts tracking a browser, it receives every series in full on the next sync.
+        """
+        with self._lock:
+            self._clients[sid] = {}
+
+    def disconnect(self, sid: str):
+        """
+        stops tracking a browser.
+        """
+        with self._lock:
+            self._clients.pop(sid, None)
+
+    def _get(self, series: str) -> Series:
+        if series not in self._series:
+            self._series[series] = Series(self.window)
+        return self._series[series]
+
+    def append(self, series: str, *points: Any):
+        """
+        appends points to a series.
+        """
+        self.extend(series, points)
+
+    def extend(self, series: str, points: Iterable[Any]):
+        """
+        appends every point in points to a series.
+        """
+        with self._lock:
+            self._get(series).extend(points)
+
+    def update(self, series: str, index: int, point: Any):
+        """
+        replaces a point of a series, index works like a list index (-1 is the last point).
+        """
+        with self._lock:
+            self._get(series).update(index, point)
+
+    def set(self, series: str, points: Iterable[Any]):
+        """
+        replaces all points of a series.
+        """
+        with self._lock:
+            self._get(series).replace(points)
+
+    def points(self, series: str) -> List[Any]:
+        """
+        returns the points in the window of a series.
+        """
+        with self._lock:
+            return self._get(series).window_points()
+
+    def sync(self, sid: Optional[str] = None):
+        """
+        emits the appended and changed points to every connected browser,
+        or only to the given one.
+        """
+        with self._lock:
+            sids = list(self._clients) if sid is None else [sid]
+            for name, series in self._series.items():
+                # clients in the same state get the same delta, compute it once
+                groups: Dict[Optional[Tuple[int, int, int]], List[str]] = {}
+                for client in sids:
+                    if client in self._clients:
+                        groups.setdefault(self._clients[client].get(name), []).append(client)
+
+                for state, clients in groups.items():
+                    delta = series.delta(state)
+                    if delta is None:
+                        continue
+
+                    delta["action"] = "delta"
+                    delta["series"] = name
+                    for client in clients:
+                        emit(self.event, delta, self.id, client)
+
+                new_state = series.state()
+                for clients in groups.values():
+                    for client in clients:
+                        self._clients[client][name] = new_state
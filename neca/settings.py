@@ -13,6 +13,12 @@ app = None
 socket = None
 eventThread = None
 
+# the outbound emit pipeline, None sends every emit right away
+emitter = None
+
+# whether emitted payloads use the compact encoding by default
+compact = False
+
 
 def init():
     global app
@@ -3,8 +3,13 @@ function apexchart(id, config = {}) {
 
     let chart = new ApexCharts(element, config);
     chart.render();
+
+    // local copy of the series, to apply deltas from a series store to
+    let series = (config.series || []).map((s) => ({...s, data: (s.data || []).slice()}));
+
     chart.onEvent = function (data) {
         if (data.action === "updateSeries") {
+            series = data.newSeries.map((s) => ({...s, data: (s.data || []).slice()}));
             chart.updateSeries(data.newSeries, data.animate);
         }
         else if (data.action === "updateOptions") {
@@ -16,6 +21,16 @@ function apexchart(id, config = {}) {
         else if (data.action === "appendData") {
             chart.appendData(data.newData);
         }
+        else if (data.action === "delta") {
+            // apply the appended and changed points of a series store
+            let target = series.find((s) => s.name === data.series);
+            if (target === undefined) {
+                target = {name: data.series, data: []};
+                series.push(target);
+            }
+            apply_delta(target, data);
+            chart.updateSeries(series.map((s) => ({name: s.name, type: s.type, data: s.data})), data.animate);
+        }
         else {
             console.warn("Invalid action: " + data.action);
         }
@@ -10,12 +10,124 @@ socket.on('connect', function () {
 
 document.addEventListener("DOMContentLoaded", () => socket.connect());
 
+// control a replay on the server (see neca/replay.py), the replay should be registered
+// actions: "pause", "resume", "seek", "speed", "stop" and "status"
+// replay_control("speed", 5000), replay_control("seek", 1539202764)
+// "status" makes the server emit the "replay_status" event, which can be connected to a block
+function replay_control(action, value = null, name = "replay") {
+    socket.emit("replay", {name: name, action: action, value: value});
+}
+
 // create new connections between blocks and events
 // when the connect() function is called in the template
 
 // connect("tweets", ".tweet")
 // connect("graph", ".graph")
 
+// the server may merge the messages of one frame into a single message
+// (see neca/emitter.py), these are unpacked before they reach the block
+const BATCH_KEY = "__batch__";
+
+// the server may send long numeric lists as typed arrays (see neca/encoding.py)
+// these are turned back into plain arrays before they reach the block
+const TYPED_KEY = "__typed__";
+
+function to_typed_array(type, data) {
+    // socket.io delivers binary attachments as ArrayBuffers in the browser,
+    // copy views (like Buffers) so the typed array is aligned
+    if (ArrayBuffer.isView(data)) {
+        data = data.buffer.slice(data.byteOffset, data.byteOffset + data.byteLength);
+    }
+    return type === "i32" ? new Int32Array(data) : new Float64Array(data);
+}
+
+function decode(value) {
+    if (Array.isArray(value)) {
+        return value.map(decode);
+    }
+    if (value === null || typeof value !== "object" || value instanceof ArrayBuffer) {
+        return value;
+    }
+
+    const type = value[TYPED_KEY];
+    if (type === undefined) {
+        // a regular object, decode its values
+        for (const key in value) {
+            value[key] = decode(value[key]);
+        }
+        return value;
+    }
+
+    if (type === "records") {
+        // a list of objects, encoded per column
+        const columns = {};
+        for (const key in value.columns) {
+            columns[key] = decode(value.columns[key]);
+        }
+        const rows = new Array(value.length);
+        for (let i = 0; i < value.length; i++) {
+            const row = {};
+            for (const key in columns) {
+                row[key] = columns[key][i];
+            }
+            rows[i] = row;
+        }
+        return rows;
+    }
+
+    const array = to_typed_array(type, value.data);
+    if (value.shape) {
+        // a list of rows
+        const [length, width] = value.shape;
+        const rows = new Array(length);
+        for (let i = 0; i < length; i++) {
+            rows[i] = Array.from(array.subarray(i * width, (i + 1) * width));
+        }
+        return rows;
+    }
+    return Array.from(array);
+}
+
+function unpack(message, handler) {
+    if (message && Array.isArray(message[BATCH_KEY])) {
+        message[BATCH_KEY].forEach(handler);
+    } else {
+        handler(message);
+    }
+}
+
+// applies a "delta" message sent by a series store (see neca/series.py)
+// target is an object with the points in target.data,
+// target.offset keeps the absolute index of the first point
+function apply_delta(target, delta) {
+    if (delta.reset || target.offset === undefined) {
+        // the server sends the whole window
+        target.data = delta.append.slice();
+        target.offset = delta.offset;
+        return;
+    }
+
+    if (delta.start !== target.offset + target.data.length) {
+        console.warn("Series out of sync, expected points from " + (target.offset + target.data.length) + " but got " + delta.start);
+    }
+
+    // replace the points that changed
+    for (const [index, point] of delta.update || []) {
+        target.data[index - target.offset] = point;
+    }
+
+    // add the new points
+    for (const point of delta.append) {
+        target.data.push(point);
+    }
+
+    // drop the points that fell out of the window
+    if (delta.offset > target.offset) {
+        target.data.splice(0, delta.offset - target.offset);
+        target.offset = delta.offset;
+    }
+}
+
 function connect_block(block, key) {
     // check if block is callable or has a function called onEvent
     if (typeof block === "object" && typeof block.onEvent === "function") {
@@ -23,7 +135,7 @@ function connect_block(block, key) {
         socket.on(key, function(message) {
             // trigger the event
             console.log("Triggering event: ", key);
-            block.onEvent(message);
+            unpack(decode(message), (m) => block.onEvent(m));
         });
     }
     else if (typeof block === "function") {
@@ -31,7 +143,7 @@ function connect_block(block, key) {
         socket.on(key, function(message) {
             // trigger the event
             console.log("Triggering event: ", key);
-            block(message);
+            unpack(decode(message), (m) => block(m));
         });
     } else {
         console.log("Block is not callable");
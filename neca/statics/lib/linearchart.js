@@ -119,6 +119,26 @@ function linearchart(id, config = {}) {
             chart.update();
         }
 
+        else if (data.action == "delta") {
+            // apply the appended and changed points of a series store
+            let series = data.series || chart.data.datasets[0].label;
+
+            // get the index of the series
+            let index = chart.data.datasets.findIndex((dataset) => {
+                return dataset.label == series;
+            });
+
+            // if the series doesn't exist, create it
+            if (index == -1) {
+                createSeries(series, []);
+                index = chart.data.datasets.length - 1;
+            }
+            apply_delta(chart.data.datasets[index], data);
+
+            // update the chart
+            chart.update();
+        }
+
         else if (data.action == "reset") {
             // reset the chart
             chart.data = default_data || {
@@ -18,6 +18,9 @@ function linechart(id, config = {}) {
         options: config.options || {}
     });
 
+    // the [category, value] points received from a series store
+    const points = {};
+
     function onEvent(data) {
         // data = {action: "data/set/add/reset/remove", value: [category: string, value: int]}
         if (data.action === "data") {
@@ -48,6 +51,15 @@ function linechart(id, config = {}) {
             // add the value to the data
             chart.data.datasets[0].data[index] += data.value[1];
         }
+        else if (data.action === "delta") {
+            // apply the appended and changed points of a series store
+            // data.value is not used, the points are [category, value] pairs
+            let series = data.series || "default";
+            points[series] = points[series] || {};
+            apply_delta(points[series], data);
+            chart.data.labels = points[series].data.map((point) => point[0]);
+            chart.data.datasets[0].data = points[series].data.map((point) => point[1]);
+        }
         else if (data.action === "reset") {
             chart.data.datasets[0].data = [];
         }
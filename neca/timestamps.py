@@ -0,0 +1,199 @@
+"""
+This module contains the timestamp parsing used when replaying data files.
+
+datetime.strptime is slow, and replaying a file calls it for every record.
+compile_parser turns a strptime format into a parser that:
+- uses a regular expression compiled once from the format, with the
+  timestamp computed by plain arithmetic instead of building a datetime
+- falls back to datetime.strptime for formats or values it does not understand
+- remembers recently parsed strings, records often share the same second
+- reads epoch numbers (seconds or milliseconds) natively
+
+the parsers return seconds since the epoch (as a float), naive timestamps are treated as UTC.
+
+Example usage:
+```python
+parse = compile_parser('%a %b %d %H:%M:%S %z %Y')
+parse('Wed Oct 10 20:19:24 +0000 2018')  # 1539202764.0
+compile_parser('epoch_ms')(1539202764000)  # 1539202764.0
+```
+"""
+
+import re
+from calendar import monthrange, timegm
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Callable, Optional
+
+
+# the number of distinct timestamp strings a parser remembers
+CACHE_SIZE = 4096
+
+# formats for fields that contain epoch numbers
+EPOCH_FORMATS = {
+    "epoch": 1,         # seconds since the epoch
+    "epoch_ms": 1000,   # milliseconds since the epoch
+}
+
+_MONTHS = {name: number for number, name in enumerate(
+    ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"), 1)}
+
+# the directives the fast parser understands, and what they match
+_DIRECTIVES = {
+    "Y": r"(?P<Y>\d{4})",
+    "y": r"(?P<y>\d{2})",
+    "m": r"(?P<m>\d{1,2})",
+    "d": r"(?P<d>\d{1,2})",
+    "H": r"(?P<H>\d{1,2})",
+    "M": r"(?P<M>\d{1,2})",
+    "S": r"(?P<S>\d{1,2})",
+    "f": r"(?P<f>\d{1,6})",
+    "z": r"(?P<z>Z|[+-]\d{2}:?\d{2})",
+    "b": r"(?P<b>[A-Za-z]{3})",
+    "a": r"[A-Za-z]+",
+    "%": "%",
+}
+
+
+def _compile_regex(fmt: str) -> Optional["re.Pattern"]:
+    """
+    compiles a strptime format into a regular expression,
+    or returns None if the format uses directives the fast parser does not know.
+    """
+    parts = []
+    i = 0
+    seen = set()
+    while i < len(fmt):
+        char = fmt[i]
+        if char == "%":
+            if i + 1 >= len(fmt):
+                return None
+            directive = fmt[i + 1]
+            if directive not in _DIRECTIVES or directive in seen:
+                return None
+            if directive not in "a%":
+                seen.add(directive)
+            parts.append(_DIRECTIVES[directive])
+            i += 2
+        elif char.isspace():
+            # like strptime, whitespace matches any amount of whitespace
+            parts.append(r"\s+")
+            while i < len(fmt) and fmt[i].isspace():
+                i += 1
+        else:
+            parts.append(re.escape(char))
+            i += 1
+
+    # a date is needed to compute a timestamp
+    if not ({"Y", "y"} & seen):
+        return None
+    return re.compile("".join(parts) + r"\Z")
+
+
+def _epoch(match: "re.Match") -> Optional[float]:
+    """
+    computes the timestamp from the groups of a match, or None if a value is invalid.
+    """
+    groups = match.groupdict()
+
+    if groups.get("Y") is not None:
+        year = int(groups["Y"])
+    else:
+        # like strptime, 69-99 are in the 1900s, 00-68 in the 2000s
+        year = int(groups["y"])
+        year += 1900 if year >= 69 else 2000
+
+    if groups.get("b") is not None:
+        month = _MONTHS.get(groups["b"].lower())
+        if month is None:
+            return None
+    else:
+        month = int(groups.get("m") or 1)
+
+    day = int(groups.get("d") or 1)
+    hour = int(groups.get("H") or 0)
+    minute = int(groups.get("M") or 0)
+    second = int(groups.get("S") or 0)
+    if not (1 <= month <= 12 and hour < 24 and minute < 60 and second < 62):
+        return None
+    if not 1 <= day <= monthrange(year, month)[1]:
+        return None
+
+    timestamp = float(timegm((year, month, day, hour, minute, second)))
+
+    fraction = groups.get("f")
+    if fraction:
+        timestamp += int(fraction.ljust(6, "0")) / 1e6
+
+    zone = groups.get("z")
+    if zone and zone != "Z":
+        zone = zone.replace(":", "")
+        offset = int(zone[1:3]) * 3600 + int(zone[3:5]) * 60
+        timestamp -= offset if zone[0] == "+" else -offset
+
+    return timestamp
+
+
+def _strptime(value: str, fmt: str) -> float:
+    parsed = datetime.strptime(value, fmt)
+    if parsed.tzinfo is None:
+        return timegm(parsed.timetuple()) + parsed.microsecond / 1e6
+    return parsed.timestamp()
+
+
+def compile_parser(fmt: Optional[str], cache_size: int = CACHE_SIZE) -> Callable[[Any], float]:
+    """
+    Compile a timestamp format into a parser that returns seconds since the epoch.
+
+    Parameters:
+    - fmt (str): A strptime format like '%a %b %d %H:%M:%S %z %Y', or 'epoch' / 'epoch_ms'
+      for fields containing seconds / milliseconds since the epoch. None is the same as 'epoch'.
+    - cache_size (int, optional): The number of distinct strings the parser remembers. Default is 4096.
+
+    Returns:
+    - Callable[[Any], float]: The parser. Numbers are always read as epoch values.
+    """
+    if fmt is None:
+        fmt = "epoch"
+
+    if fmt in EPOCH_FORMATS:
+        scale = EPOCH_FORMATS[fmt]
+
+        def parse_epoch(value: Any) -> float:
+            return float(value) / scale
+        return parse_epoch
+
+    regex = _compile_regex(fmt)
+
+    @lru_cache(maxsize=cache_size)
+    def parse_string(value: str) -> float:
+        if regex is not None:
+            match = regex.match(value)
+            if match is not None:
+                timestamp = _epoch(match)
+                if timestamp is not None:
+                    return timestamp
+        # the fast parser did not understand the value, let strptime handle it
+        return _strptime(value, fmt)
+
+    def parse(value: Any) -> float:
+        if isinstance(value, str):
+            return parse_string(value)
+        # epoch numbers are read natively
+        return float(value)
+    return parse
+
+
+def compile_argument_parser(fmt: Optional[str]) -> Callable[[Any], float]:
+    """
+    Compile a parser for timestamps passed as arguments, like the start of a replay.
+    Numbers are seconds since the epoch, whatever the format of the data is.
+    Strings are parsed with the format, see compile_parser.
+    """
+    parse = compile_parser(fmt)
+
+    def parse_argument(value: Any) -> float:
+        if isinstance(value, str):
+            return parse(value)
+        return float(value)
+    return parse_argument
@@ -0,0 +1,97 @@
+"""
+a trie of event key patterns, used by Ruleset for wildcard event keys.
+
+the segments of a key are separated by dots:
+- "sensor.kitchen.temp" matches only that key
+- "*" matches exactly one segment: "sensor.*.temp" matches "sensor.kitchen.temp"
+- "#" matches any number of segments, also none: "stock.#" matches "stock", "stock.aapl"
+  and "stock.aapl.price", and "#" matches every key
+
+these are the same patterns the connector middleware uses for subscriptions. The middleware
+has its own copy of the matching (connector middleware/topics.py), it runs without neca, so a
+change to the matching has to be made in both. tests/test_topics.py checks both with the same cases.
+finding the patterns that match a key takes time in the length of the key, not in the
+number of patterns.
+
+mostly used for internal bookkeeping. If you're a user,
+you probably won't need to use this module directly.
+"""
+
+from typing import Any, Dict, List
+
+
+# the segments that make a key a pattern
+WILDCARDS = ("*", "#")
+
+
+def is_pattern(key: str) -> bool:
+    """
+    returns whether the key has a wildcard segment.
+    """
+    return any(segment in WILDCARDS for segment in key.split("."))
+
+
+class _Node:
+    __slots__ = ("children", "values")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        # the values of the patterns that end at this node
+        self.values: List[Any] = []
+
+
+class TopicTrie:
+    """
+    maps patterns to values, and finds the values of the patterns that match a key.
+    """
+
+    def __init__(self):
+        self._root = _Node()
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def add(self, pattern: str, value: Any):
+        """
+        adds a value for a pattern.
+        """
+        node = self._root
+        for segment in pattern.split("."):
+            child = node.children.get(segment)
+            if child is None:
+                child = node.children[segment] = _Node()
+            node = child
+        node.values.append(value)
+        self.size += 1
+
+    def match(self, key: str) -> List[Any]:
+        """
+        returns the values of every pattern that matches the key, every value once.
+        """
+        found: Dict[int, Any] = {}
+        self._match(self._root, key.split("."), 0, found, set())
+        return list(found.values())
+
+    def _match(self, node: _Node, segments: List[str], depth: int, found: Dict[int, Any], visited: set):
+        if depth == len(segments):
+            for value in node.values:
+                found[id(value)] = value
+
+        children = node.children
+        if depth < len(segments):
+            child = children.get(segments[depth])
+            if child is not None:
+                self._match(child, segments, depth + 1, found, visited)
+            child = children.get("*")
+            if child is not None and segments[depth] != "*":
+                self._match(child, segments, depth + 1, found, visited)
+
+        # "#" takes zero or more segments
+        child = children.get("#")
+        if child is not None:
+            for skip in range(depth, len(segments) + 1):
+                # patterns with several "#" can reach the same place in many ways
+                if (id(child), skip) not in visited:
+                    visited.add((id(child), skip))
+                    self._match(child, segments, skip, found, visited)
@@ -44,6 +44,12 @@ setup(
     python_requires=">=3.10, <4",
     # read from requirements.txt
     install_requires=requirements,
+    # optional dependencies that speed up replaying data files
+    extras_require={
+        "fast": ["orjson"],
+        # CSV batches as numpy arrays, Parquet and Arrow files (see neca.columnar)
+        "columnar": ["numpy", "pyarrow"],
+    },
     include_package_data=True,
     package_data={
         "neca": ["templates/*", "tutorials/*", "demos/*", "statics/*"],
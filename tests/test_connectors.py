@@ -0,0 +1,44 @@
+import json
+import socket
+import time
+from threading import Event, Thread
+
+from neca.connectors import Connector, Position
+
+
+def serve_ignoring_resume(server: socket.socket, stop: Event):
+    # an older middleware: it sends events with offsets, but never answers {"resume": ...}
+    conn, _ = server.accept()
+    with conn:
+        offset = 100
+        while not stop.is_set():
+            try:
+                conn.sendall(json.dumps({"offset": offset, "key": "tick", "data": offset}).encode() + b"\n")
+            except OSError:
+                return
+            offset += 1
+            time.sleep(0.02)
+
+
+def test_resume_without_an_answer(monkeypatch):
+    monkeypatch.setattr(Position, "RESUME_TIMEOUT", 0.3)
+    server = socket.create_server(("127.0.0.1", 0))
+    stop = Event()
+    Thread(target=serve_ignoring_resume, args=(server, stop), daemon=True).start()
+
+    received = []
+    connector = Connector([server.getsockname()], fire=lambda key, data: received.append(data),
+                          resume=0, reconnect=False).start()
+    try:
+        deadline = time.monotonic() + 5
+        while len(received) < 5 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        # the events before the timeout are dropped, the ones after it are fired in order
+        assert len(received) >= 5
+        assert received == sorted(received)
+        assert not connector.position.waiting
+    finally:
+        stop.set()
+        connector.stop()
+        connector.join(5)
+        server.close()
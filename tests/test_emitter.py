@@ -0,0 +1,29 @@
+from neca.emitter import BATCH_KEY, Emitter
+
+
+class Socket:
+    def __init__(self):
+        self.sent = []
+
+    def emit(self, event, data, to=None):
+        self.sent.append((event, data, to))
+
+
+def test_frames_are_coalesced_per_id():
+    socket = Socket()
+    emitter = Emitter(socket, interval=60)
+    # two charts listening to the same event
+    emitter.emit("chart", {"action": "add", "id": "a", "value": 1})
+    emitter.emit("chart", {"action": "add", "id": "b", "value": 2})
+    emitter.emit("chart", {"action": "add", "id": "a", "value": 3})
+    emitter.emit("chart", {"action": "set", "id": "a", "value": 4})
+    emitter.emit("chart", {"action": "set", "id": "b", "value": 5})
+    emitter.flush()
+
+    assert socket.sent == [
+        ("chart", {BATCH_KEY: [{"action": "add", "id": "a", "value": 1},
+                               {"action": "add", "id": "a", "value": 3},
+                               {"action": "set", "id": "a", "value": 4}]}, None),
+        ("chart", {BATCH_KEY: [{"action": "add", "id": "b", "value": 2},
+                               {"action": "set", "id": "b", "value": 5}]}, None),
+    ]
@@ -0,0 +1,32 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "connector middleware"))
+
+import eventlog  # noqa: E402
+from eventlog import EventLog  # noqa: E402
+
+
+def events(*keys):
+    return [(key, b'{"key": "%s", "data": null}\n' % key.encode()) for key in keys]
+
+
+def test_time_retention_without_flush_thread(tmp_path, monkeypatch):
+    monkeypatch.setattr(eventlog, "RETAIN_INTERVAL", 0)
+    log = EventLog(str(tmp_path), segment_size=1, retention_seconds=0.2, fsync_interval=0)
+    try:
+        # every append starts a new segment
+        for key in ("a", "b", "c"):
+            log.append(events(key))
+        assert log.stats()["segments"] == 3
+
+        # no new segment, the retention is applied by the append itself
+        log.segment_size = 1 << 20
+        time.sleep(0.3)
+        log.append(events("d"))
+        assert log.start_offset == 2
+        assert log.stats()["segments"] == 1
+        assert log.read(0)[0].count(b"\n") == 2
+    finally:
+        log.close()
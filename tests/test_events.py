@@ -0,0 +1,75 @@
+from threading import Event, Thread
+
+import pytest
+
+from neca.events import Context, Manager, Ruleset
+
+
+def start_event_loop():
+    if not getattr(start_event_loop, "started", False):
+        Thread(target=Manager.eventLoop, daemon=True).start()
+        start_event_loop.started = True
+
+
+def test_event_loop_survives_handler_error():
+    # without workers the handlers run on the event loop thread
+    start_event_loop()
+    rules = Ruleset()
+    handled = Event()
+
+    @rules.event("fail")
+    def fail(context, data):
+        raise RuntimeError("handler error")
+
+    @rules.event("after")
+    def after(context, data):
+        handled.set()
+
+    context = Context(rules, "test")
+    context.fire("fail")
+    context.fire("after")
+    assert handled.wait(2)
+
+    # the events fired after that are still handled
+    handled.clear()
+    context.fire("fail")
+    context.fire("after")
+    assert handled.wait(2)
+
+
+def test_batch_rule_has_one_key():
+    rules = Ruleset()
+
+    def collect(context, items):
+        pass
+
+    rules.event("a", batch=True, max_batch=10)(collect)
+    # the batch settings belong to the rule, a second key would share them
+    with pytest.raises(ValueError):
+        rules.event("b", batch=True, max_batch=5)(collect)
+    with pytest.raises(ValueError):
+        rules.event("sensor.*.temp")(collect)
+
+    # a function that handles single events can't become a batch rule for another key
+    def handle(context, data):
+        pass
+
+    rules.event("a")(handle)
+    with pytest.raises(ValueError):
+        rules.event("b", batch=True)(handle)
+    assert rules.functions[collect].keys == ["a"] and not rules.functions[handle].batch
+
+
+def test_batch_rule_with_pattern():
+    rules = Ruleset()
+    batches = []
+
+    @rules.event("sensor.*.temp", batch=True, max_batch=2, max_wait=None)
+    def collect(context, items):
+        batches.append(items)
+
+    context = Context(rules, "batches")
+    for key, value in (("sensor.a.temp", 1), ("sensor.b.temp", 2), ("sensor.a.temp", 3), ("sensor.b.temp", 4)):
+        context.fire_immediate(key, value)
+    # the events of every key are collected in their own batch
+    assert batches == [[1, 3], [2, 4]]
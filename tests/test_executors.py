@@ -0,0 +1,39 @@
+import multiprocessing
+
+from neca.executors import Dispatcher, process_context
+
+
+def square(context, data):
+    return data * data
+
+
+def start_in_worker(errors):
+    # what a worker process does when it imports a main module without the guard
+    import neca
+    try:
+        neca.start()
+    except RuntimeError as error:
+        errors.put(str(error))
+    else:
+        errors.put(None)
+
+
+def test_process_workers_are_not_forked():
+    assert process_context().get_start_method() in ("forkserver", "spawn")
+
+    dispatcher = Dispatcher(process_workers=1)
+    try:
+        assert dispatcher.run_in_process(square, 7).result(timeout=60) == 49
+        assert dispatcher._process_pool._mp_context.get_start_method() != "fork"
+    finally:
+        dispatcher.shutdown()
+
+
+def test_start_refuses_to_run_in_a_worker_process():
+    context = multiprocessing.get_context("spawn")
+    errors = context.Queue()
+    process = context.Process(target=start_in_worker, args=(errors,))
+    process.start()
+    error = errors.get(timeout=60)
+    process.join(10)
+    assert error is not None and "__main__" in error
@@ -0,0 +1,21 @@
+import json
+
+from neca.generators import _file_source, csv_generator, json_lines_generator
+
+
+def test_csv_replay_with_start(tmp_path):
+    path = tmp_path / "data.csv"
+    path.write_text("time,value\n1,a\n2,b\n3,c\n4,d\n")
+
+    # csv files have no index, the records before the start are skipped
+    source = _file_source(str(path), csv_generator, ("time", "epoch"), start=2, end=4)
+    assert [(timestamp, record["value"]) for timestamp, record in source(None)] == [(2, "b"), (3, "c")]
+    assert [record["value"] for _, record in source(3)] == ["c"]
+
+
+def test_json_lines_replay_with_start(tmp_path):
+    path = tmp_path / "data.txt"
+    path.write_text("".join(json.dumps({"time": time}) + "\n" for time in range(1, 5)))
+
+    source = _file_source(str(path), json_lines_generator, ("time", "epoch"), start=2, end=None)
+    assert [timestamp for timestamp, _ in source(None)] == [2, 3, 4]
@@ -0,0 +1,49 @@
+import json
+
+from neca import replay
+from neca.replay import IndexedFile, merge_files
+from neca.timestamps import compile_parser
+
+
+def json_lines(path):
+    with open(path) as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def write_records(path, times):
+    with open(path, "w") as f:
+        for time in times:
+            f.write(json.dumps({"time": time}) + "\n")
+
+
+def test_merge_files_in_worker_processes(tmp_path, monkeypatch):
+    write_records(tmp_path / "a.txt", [1, 3, 5, 7])
+    write_records(tmp_path / "b.txt", [2, 4, 6])
+
+    # the workers are started from the context, never with a plain fork
+    methods = []
+    context = replay.process_context()
+    monkeypatch.setattr(replay, "process_context", lambda: methods.append(context.get_start_method()) or context)
+
+    merged = list(merge_files([str(tmp_path / "a.txt"), str(tmp_path / "b.txt")],
+                              json_lines, ("time", "epoch"), chunk_size=2))
+    assert [timestamp for timestamp, _ in merged] == [1, 2, 3, 4, 5, 6, 7]
+    assert methods and all(method in ("forkserver", "spawn") for method in methods)
+
+
+def test_index_of_a_read_only_directory(tmp_path):
+    path = tmp_path / "data.txt"
+    write_records(path, [1, 2, 3])
+    # the index can't be written: its temporary file is taken by a directory
+    (tmp_path / "data.txt.idx.tmp").mkdir()
+    tmp_path.chmod(0o555)
+    try:
+        indexed = IndexedFile(str(path), "time", compile_parser("epoch"))
+        try:
+            assert [record["time"] for record in indexed.records(2)] == [2, 3]
+        finally:
+            indexed.close()
+        assert not (tmp_path / "data.txt.idx").exists()
+    finally:
+        tmp_path.chmod(0o755)
@@ -0,0 +1,64 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "connector middleware"))
+
+from neca.topics import TopicTrie  # noqa: E402
+from topics import TopicIndex  # noqa: E402
+
+
+# (pattern, key, whether the pattern matches the key)
+# the rulesets of neca and the connector middleware have their own copy of the matching,
+# both are checked with these cases so they can't drift apart
+CASES = [
+    ("sensor.kitchen.temp", "sensor.kitchen.temp", True),
+    ("sensor.kitchen.temp", "sensor.kitchen", False),
+    ("sensor.*.temp", "sensor.kitchen.temp", True),
+    ("sensor.*.temp", "sensor.kitchen.humidity", False),
+    ("sensor.*.temp", "sensor.temp", False),
+    ("sensor.*.temp", "sensor.a.b.temp", False),
+    ("*", "tick", True),
+    ("*", "sensor.temp", False),
+    ("stock.#", "stock", True),
+    ("stock.#", "stock.aapl", True),
+    ("stock.#", "stock.aapl.price", True),
+    ("stock.#", "stocks.aapl", False),
+    ("#", "tick", True),
+    ("#", "sensor.kitchen.temp", True),
+    ("#.temp", "temp", True),
+    ("#.temp", "sensor.kitchen.temp", True),
+    ("#.temp", "sensor.kitchen.humidity", False),
+    ("sensor.#.temp", "sensor.temp", True),
+    ("sensor.#.temp", "sensor.a.b.temp", True),
+    ("#.#", "a.b.c", True),
+    ("a.#.b.#.c", "a.x.b.y.z.c", True),
+    ("a.#.b.#.c", "a.x.c", False),
+    ("*.#", "a", True),
+    ("*.#", "a.b.c", True),
+]
+
+
+@pytest.mark.parametrize("pattern, key, matches", CASES)
+def test_topic_trie(pattern, key, matches):
+    trie = TopicTrie()
+    trie.add(pattern, "value")
+    assert (trie.match(key) == ["value"]) == matches
+
+
+@pytest.mark.parametrize("pattern, key, matches", CASES)
+def test_topic_index(pattern, key, matches):
+    index = TopicIndex()
+    index.subscribe("subscriber", [pattern])
+    assert (index.match(key) == {"subscriber"}) == matches
+
+
+def test_both_match_the_same_patterns():
+    trie = TopicTrie()
+    index = TopicIndex()
+    for pattern, _, _ in CASES:
+        trie.add(pattern, pattern)
+        index.subscribe(pattern, [pattern])
+    for _, key, _ in CASES:
+        assert set(trie.match(key)) == index.match(key)